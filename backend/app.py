@@ -1,15 +1,106 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, redirect, request, jsonify, send_file, stream_with_context, url_for
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import DeclarativeBase
+from werkzeug.formparser import parse_form_data
 import os
+import sqlite3
+import time
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
-from config import ALLOWED_ORIGINS, DATABASE_URL, SESSION_SECRET
+from config import (
+    ALLOWED_ORIGINS,
+    CATALOG_CACHE_MAX_ENTRIES,
+    CATALOG_CACHE_TTL,
+    CHAT_CATCH_UP_INTERVAL,
+    CHAT_MAX_PAGE_SIZE,
+    CHAT_POLL_TIMEOUT,
+    CHAT_STREAM_HEARTBEAT,
+    CHAT_STREAM_MAX_SECONDS,
+    COMPRESS_BROTLI_QUALITY,
+    COMPRESS_CACHE_MAX_BYTES,
+    COMPRESS_GZIP_LEVEL,
+    COMPRESS_MIN_SIZE,
+    DATABASE_READ_URLS,
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_READ_AFTER_WRITE_SECONDS,
+    DB_READ_MAX_OVERFLOW,
+    DB_READ_POOL_SIZE,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    IMAGE_CACHE_MAX_AGE,
+    IMAGE_MAX_BYTES,
+    IMAGE_STORAGE_DIR,
+    IMAGE_VARIANT_SIZES,
+    IMAGE_WORKERS,
+    IMPORT_CHUNK_SIZE,
+    ORDER_EXPIRY_BATCH_SIZE,
+    ORDER_EXPIRY_LEASE_SECONDS,
+    ORDER_EXPIRY_POLL_SECONDS,
+    ORDER_EXPIRY_SCHEDULER,
+    ORDER_RESERVATION_TTL_MINUTES,
+    PRODUCT_DETAIL_BULK_MAX_IDS,
+    PRODUCT_DETAIL_CACHE_MAX_ENTRIES,
+    PRODUCT_DETAIL_CACHE_TTL,
+    PRODUCT_DETAIL_MAX_BYTES,
+    SEARCH_INDEX_MAX_AGE,
+    SEARCH_MAX_RESULTS,
+    STOCK_CHANGE_COMPACT_INTERVAL,
+    STOCK_CHANGE_MAX_PAGE_SIZE,
+    STOCK_CHANGE_PAGE_SIZE,
+    STOCK_CHANGE_RETENTION_DAYS,
+    SESSION_SECRET,
+    SETTINGS_VERSION_CHECK_INTERVAL,
+    SLOW_REQUEST_MS,
+    STOCK_BATCH_MAX_OPERATIONS,
+    SQLITE_BUSY_TIMEOUT,
+)
+from json_provider import dumps_bytes, install_json_provider
+from logging_setup import configure_logging, install_request_ids
+from services.chat_event_hub import ADMIN_TOPIC, ChatEventHub, conversation_topic
+from services.catalog_cache import CatalogCache, facets_key, item_key, listing_key
+from services.chat_summary_service import load_conversation_summaries
+from services.image_store import VARIANT_FORMATS, ImageStore, ImageUploadError, parse_variant_sizes
+from services.product_detail_store import ProductDetailError, ProductDetailStore
+from services.db_router import READ_PRIMARY_HEADER, REPLICA_BIND_PREFIX, DbRouter, RoutingSession, parse_read_urls, replica_reads
+from services.order_assembler import OrderAssembler
+from services.stock_batch_service import StockBatchError, apply_stock_batch
+from services.stock_change_log import ChangeFeedExpired, StockChangeLog
+from services.stock_facet_service import load_stock_facets, parse_bucket_count
+from services.request_metrics import RequestMetrics
+from services.reservation_expiry import EXPIRED, ReservationExpiry
+from services.response_encoding import ResponseEncoding, set_last_modified
+from services.row_serializer import RowSerializer
+from services.settings_snapshot import SettingsSnapshot
+from services.stock_import_service import (
+    ImportFormatError,
+    StockImporter,
+    StockSynchronizer,
+    detect_feed_format,
+    iter_feed_rows,
+    stock_content_hash,
+)
+from services.stock_search_index import StockSearchIndex
+from services.stock_reservation_service import (
+    StockReservationError,
+    merge_order_lines,
+    reserve_stock,
+)
+from services.stock_query_service import (
+    StockQueryError,
+    apply_stock_filters,
+    fetch_stock_page,
+    is_query_mode,
+    parse_stock_query,
+)
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging (levels and format from LOG_* settings, written by a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Define SQLAlchemy base class
@@ -18,29 +109,88 @@ class Base(DeclarativeBase):
 
 # Initialize Flask app and database
 app = Flask(__name__)
+# orjson when installed (JSON_PROVIDER), otherwise Flask's json-module provider
+install_json_provider(app)
 # Enable CORS for all routes with more permissive settings for debugging
-CORS(app, resources={r"/*": {"origins": "*", "supports_credentials": True}})
+CORS(app, resources={r"/*": {
+    "origins": "*",
+    "supports_credentials": True,
+    "expose_headers": ["X-Total-Count", "X-Next-Cursor", "X-Request-ID", READ_PRIMARY_HEADER]
+}})
 
 # Configure the database
 app.secret_key = SESSION_SECRET
+
+def _engine_options(url, pool_size, max_overflow):
+    options = {
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+    # In-memory SQLite uses a single-connection pool that takes no sizing options
+    if ":memory:" not in url and url.rstrip("/") != "sqlite:":
+        options.update({
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": DB_POOL_TIMEOUT,
+        })
+    if url.startswith("sqlite"):
+        # Let threads share pooled connections and wait on locks instead of failing at once
+        options["connect_args"] = {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT,
+        }
+    return options
+
 app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _engine_options(DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW)
+# Read replicas, each with its own pool; see DbRouter for which requests use them
+app.config["SQLALCHEMY_BINDS"] = {
+    f"{REPLICA_BIND_PREFIX}{index}": dict(_engine_options(url, DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW), url=url)
+    for index, url in enumerate(parse_read_urls(DATABASE_READ_URLS))
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Name of the CacheVersion row covering StoreSettings and PaymentSettings
+PAYMENT_SETTINGS_VERSION = 'payment_settings'
+
 # Initialize SQLAlchemy with app
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 db.init_app(app)
 
+# Routes @replica_reads views to a read replica when DATABASE_READ_URLS is set
+db_router = DbRouter(db, read_after_write=DB_READ_AFTER_WRITE_SECONDS)
+db_router.install(app)
+
+# Use WAL on SQLite so readers are not blocked by a writer in another process
+@event.listens_for(Engine, "connect")
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+    cursor.close()
+
+# Latency, SQL and response size per endpoint, served at /api/metrics
+request_metrics = RequestMetrics(slow_request_ms=SLOW_REQUEST_MS)
+request_metrics.install(app)
+install_request_ids(app)
+
+# ETags, 304 Not Modified and gzip/brotli for GET responses; the metrics hook runs after
+# every other after_request handler, so http_response_bytes_total counts the bytes sent
+response_encoding = ResponseEncoding(
+    min_size=COMPRESS_MIN_SIZE,
+    gzip_level=COMPRESS_GZIP_LEVEL,
+    brotli_quality=COMPRESS_BROTLI_QUALITY,
+    cache_max_bytes=COMPRESS_CACHE_MAX_BYTES,
+)
+response_encoding.install(app)
+
 # Add a simple ping endpoint for connectivity testing
 @app.route('/api/ping', methods=['GET', 'OPTIONS'])
 def ping():
-    # Log request details for debugging
-    logger.info("Received ping request")
-    logger.info(f"Request Headers: {dict(request.headers)}")
-    logger.info(f"Request Origin: {request.headers.get('Origin', 'No Origin')}")
+    logger.debug("Ping from origin %s", request.headers.get('Origin', 'No Origin'))
     
     # Handle preflight OPTIONS request
     if request.method == 'OPTIONS':
@@ -65,6 +215,20 @@ class StockItem(db.Model):
     grade = db.Column(db.String(20), nullable=False)
     location = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Hash of the catalog fields as the last import or edit wrote them, used by the diff-based
+    # sync import; order reservations and expiries change quantity without touching it
+    content_hash = db.Column(db.String(40))
+    # Set when a sync import removes the item; kept so order references stay valid
+    deleted_at = db.Column(db.DateTime)
+    
+    # Composite indexes backing the filtered/sorted listing in get_stock_items
+    __table_args__ = (
+        db.Index('ix_stock_item_grade_price', 'grade', 'price', 'id'),
+        db.Index('ix_stock_item_location_price', 'location', 'price', 'id'),
+        db.Index('ix_stock_item_price_id', 'price', 'id'),
+        db.Index('ix_stock_item_created_at_id', 'created_at', 'id'),
+        db.Index('ix_stock_item_name_id', 'name', 'id'),
+    )
     
     def to_dict(self):
         return {
@@ -76,6 +240,31 @@ class StockItem(db.Model):
             'location': self.location
         }
 
+@event.listens_for(StockItem, 'before_insert')
+@event.listens_for(StockItem, 'before_update')
+def _refresh_stock_content_hash(mapper, connection, target):
+    target.content_hash = stock_content_hash(target)
+
+# Stock items that have not been removed by a sync import
+def active_stock_query():
+    return StockItem.query.filter(StockItem.deleted_at.is_(None))
+
+# Photos of a stock item by role (main, front, back, detail), as URLs of uploaded images
+class StockItemImage(db.Model):
+    stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_item.id', ondelete='CASCADE'), primary_key=True)
+    role = db.Column(db.String(20), primary_key=True)
+    url = db.Column(db.String(500), nullable=False)
+
+STOCK_IMAGE_ROLES = ('main', 'front', 'back', 'detail')
+
+# Description, specifications and warranty text of a stock item as one compressed JSON
+# document, loaded only by the detail endpoints so listings stay small
+class StockItemDetail(db.Model):
+    stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_item.id', ondelete='CASCADE'), primary_key=True)
+    encoding = db.Column(db.String(10), nullable=False)
+    body = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
 # Define StoreSettings model
 class StoreSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -107,14 +296,54 @@ class PaymentSettings(db.Model):
             'settings_json': self.settings_json
         }
 
+# Version counters for in-memory snapshots shared by all worker processes
+class CacheVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Increment a version counter inside the caller's transaction
+def bump_cache_version(name):
+    updated = CacheVersion.query.filter_by(name=name).update(
+        {CacheVersion.version: CacheVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+
+def read_cache_version(name):
+    return db.session.query(CacheVersion.version).filter_by(name=name).scalar() or 0
+
+# One row per stock item changed by a write, under the catalog version the write got
+class StockChange(db.Model):
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    stock_item_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    op = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_stock_change_item_version', 'stock_item_id', 'version'),
+        db.Index('ix_stock_change_changed_at', 'changed_at'),
+    )
+
 # Define new Order and Payment model
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(100))
     total_amount = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(50), default='pending')  # pending, paid, shipped, delivered
+    status = db.Column(db.String(50), default='pending')  # pending, paid, shipped, delivered, expired
     tracking_number = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Until when a pending order holds its stock (see reservation_expiry below)
+    expires_at = db.Column(db.DateTime)
+    
+    items = db.relationship('OrderItem', back_populates='order', order_by='OrderItem.id')
+    payments = db.relationship('Payment', back_populates='order', order_by='Payment.id')
+    
+    # Lookups by user and tracking number (created by migration 5, see migrations.py)
+    __table_args__ = (
+        db.Index('ix_order_user_id', 'user_id'),
+        db.Index('ix_order_tracking_number', 'tracking_number'),
+        db.Index('ix_order_status_expires_at', 'status', 'expires_at'),
+    )
     
     def to_dict(self):
         return {
@@ -123,7 +352,8 @@ class Order(db.Model):
             'total_amount': self.total_amount,
             'status': self.status,
             'tracking_number': self.tracking_number,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
         }
 
 class OrderItem(db.Model):
@@ -133,6 +363,15 @@ class OrderItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     
+    order = db.relationship('Order', back_populates='items')
+    stock_item = db.relationship('StockItem')
+    
+    # Items of an order, and orders referencing a stock item
+    __table_args__ = (
+        db.Index('ix_order_item_order_id', 'order_id'),
+        db.Index('ix_order_item_stock_item_id', 'stock_item_id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -151,6 +390,12 @@ class Payment(db.Model):
     transaction_id = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    order = db.relationship('Order', back_populates='payments')
+    
+    __table_args__ = (
+        db.Index('ix_payment_order_id', 'order_id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -174,6 +419,12 @@ class ChatMessage(db.Model):
     conversation_id = db.Column(db.String(100), nullable=False)  # Group messages by conversation
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Indexes for per-conversation reads and the admin conversation summary
+    __table_args__ = (
+        db.Index('ix_chat_message_conversation_created', 'conversation_id', 'created_at'),
+        db.Index('ix_chat_message_conversation_unread', 'conversation_id', 'is_admin_reply', 'is_read'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -187,16 +438,204 @@ class ChatMessage(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+# Loads order details (items, product names, payment) in a constant number of queries
+order_assembler = OrderAssembler(Order, OrderItem)
+
+# Pushes new chat messages to long-poll and SSE clients of this process
+chat_events = ChatEventHub()
+
+# Pre-serialized catalog responses, invalidated by every stock write
+catalog_cache = CatalogCache(ttl=CATALOG_CACHE_TTL, max_entries=CATALOG_CACHE_MAX_ENTRIES)
+
+def _cached_json_response(key, build):
+    # build() returns (payload, headers), or None for a response that is not cached
+    entry = catalog_cache.get(key)
+    if entry is None:
+        generation = catalog_cache.generation
+        result = build()
+        if result is None:
+            return None
+        payload, headers = result
+        entry = catalog_cache.put(key, dumps_bytes(app, payload), headers, generation)
+    
+    response = Response(entry.body, mimetype='application/json', headers=entry.headers)
+    response.set_etag(entry.etag)
+    set_last_modified(response, entry.built_at)
+    return response
+
+# Change log behind /api/stock/changes, written in the transaction of every stock write
+stock_changes = StockChangeLog(StockChange.__table__, CacheVersion.__table__,
+                               retention=timedelta(days=STOCK_CHANGE_RETENTION_DAYS),
+                               compact_interval=STOCK_CHANGE_COMPACT_INTERVAL)
+
+@app.after_request
+def _compact_stock_changes(response):
+    # At most once per STOCK_CHANGE_COMPACT_INTERVAL per worker, after a successful write
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        stock_changes.maybe_compact(db.engine)
+    return response
+
+def _reservations_released(item_ids):
+    # Runs on the expiry thread after each committed batch
+    catalog_cache.invalidate_items(item_ids)
+    with app.app_context():
+        _reindex_search_items(item_ids)
+
+# Puts back the stock of pending orders past their expires_at; one worker at a time sweeps
+reservation_expiry = ReservationExpiry(
+    Order.__table__, OrderItem.__table__, StockItem.__table__,
+    batch_size=ORDER_EXPIRY_BATCH_SIZE,
+    poll_interval=ORDER_EXPIRY_POLL_SECONDS,
+    lease_ttl=ORDER_EXPIRY_LEASE_SECONDS,
+    on_released=_reservations_released,
+    record_changes=lambda connection, item_ids: stock_changes.record(connection, upserted=item_ids),
+)
+
+@app.before_request
+def _start_reservation_expiry():
+    # Started by the first request of each worker, so no thread runs in CLI commands
+    if ORDER_EXPIRY_SCHEDULER != 'off' and not reservation_expiry.running():
+        reservation_expiry.start(db.engine)
+
+# Product detail documents by stock item id, cached per process
+product_details = ProductDetailStore(StockItemDetail.__table__, ttl=PRODUCT_DETAIL_CACHE_TTL,
+                                     max_entries=PRODUCT_DETAIL_CACHE_MAX_ENTRIES)
+
+# Uploaded product photos, stored by content hash; resized variants are rendered in a process pool
+image_store = ImageStore(
+    IMAGE_STORAGE_DIR or os.path.join(app.instance_path, 'images'),
+    max_bytes=IMAGE_MAX_BYTES,
+    variant_sizes=parse_variant_sizes(IMAGE_VARIANT_SIZES),
+    workers=IMAGE_WORKERS,
+)
+
+def _notification_stats():
+    from services.telegram_service import notification_stats
+    return notification_stats()
+
+# Column-selected rows serialized like to_dict(), for list endpoints and the search index
+stock_rows = RowSerializer(StockItem, ('id', 'name', 'price', 'quantity', 'grade', 'location'))
+order_rows = RowSerializer(Order, ('id', 'user_id', 'total_amount', 'status', 'tracking_number', 'created_at',
+                                   'expires_at'))
+message_rows = RowSerializer(ChatMessage, ('id', 'user_id', 'username', 'email', 'message', 'is_admin_reply',
+                                           'is_read', 'conversation_id', 'created_at'))
+
+def _load_active_stock():
+    return stock_rows.dicts(db.session.execute(stock_rows.select().where(StockItem.deleted_at.is_(None))))
+
+# Inverted index behind /api/stock/search, kept current by every stock write in this process
+stock_search = StockSearchIndex(load=_load_active_stock, max_age=SEARCH_INDEX_MAX_AGE)
+
+# Above this many changed items, reloading the search index is cheaper than patching it
+SEARCH_REINDEX_LIMIT = 1000
+
+def _reindex_search_items(changed_ids, removed_ids=()):
+    if len(changed_ids) > SEARCH_REINDEX_LIMIT:
+        stock_search.invalidate()
+        return
+    for item_id in removed_ids:
+        stock_search.remove(item_id)
+    if changed_ids:
+        rows = db.session.execute(stock_rows.select(StockItem.deleted_at).where(StockItem.id.in_(changed_ids)))
+        for row in rows:
+            if row.deleted_at is None:
+                stock_search.upsert(dict(zip(stock_rows.fields, row)))
+
+request_metrics.add_gauge("catalog_cache", "Catalog cache counters and size",
+                          catalog_cache.snapshot, label="stat")
+request_metrics.add_gauge("stock_search_documents", "Stock items in the search index",
+                          lambda: len(stock_search))
+request_metrics.add_gauge("response_encoding", "304 and compressed GET responses with the body bytes they saved",
+                          lambda: dict(response_encoding.stats), label="stat")
+request_metrics.add_gauge("db_routing", "Requests served by a read replica or the primary",
+                          lambda: dict(db_router.stats), label="stat")
+request_metrics.add_gauge("product_details", "Product detail cache counters and stored bytes",
+                          product_details.snapshot, label="stat")
+request_metrics.add_gauge("reservation_expiry", "Unpaid orders expired and stock units released",
+                          lambda: dict(reservation_expiry.stats, deadlines=reservation_expiry.pending_deadlines()),
+                          label="stat")
+request_metrics.add_gauge("images", "Image uploads, deduplicated uploads and rendered variants",
+                          lambda: dict(image_store.stats, pending=image_store.pending_count()), label="stat")
+request_metrics.add_gauge("chat_stream_subscribers", "Open long-poll and SSE chat subscriptions",
+                          chat_events.subscriber_count)
+request_metrics.add_gauge("telegram_notifications", "Telegram dispatcher counters and queue depth",
+                          _notification_stats, label="stat")
+
+# Prometheus metrics for this worker process
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # API Routes for Stock Items
 @app.route('/api/stock', methods=['GET'])
+@replica_reads
 def get_stock_items():
     try:
-        items = StockItem.query.all()
-        return jsonify([item.to_dict() for item in items]), 200
+        # Without query parameters return the full catalog as before
+        if not is_query_mode(request.args):
+            def build_listing():
+                # Read before the rows: a consumer resuming the change feed from here may see a
+                # change twice, never miss one
+                version, _ = stock_changes.versions(db.session)
+                return _load_active_stock(), {'X-Catalog-Version': str(version)}
+            
+            return _cached_json_response(listing_key(request.args), build_listing)
+        
+        try:
+            params = parse_stock_query(request.args)
+        except StockQueryError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        def build_page():
+            query = apply_stock_filters(active_stock_query(), StockItem, params)
+            total = query.count()
+            # The cursor needs the sort column, which may not be a response field
+            sort_column = () if params['sort_key'] in stock_rows.fields else (getattr(StockItem, params['sort_key']),)
+            rows, next_cursor = fetch_stock_page(stock_rows.restrict(query, *sort_column), StockItem, params)
+            headers = {'X-Total-Count': str(total)}
+            if next_cursor:
+                headers['X-Next-Cursor'] = next_cursor
+            return stock_rows.dicts(rows), headers
+        
+        return _cached_json_response(listing_key(request.args), build_page)
     except Exception as e:
         logger.error(f"Error fetching stock items: {str(e)}")
         return jsonify({"error": "Failed to fetch stock items"}), 500
 
+@app.route('/api/stock/facets', methods=['GET'])
+@replica_reads
+def get_stock_facets():
+    # Counts for the filter sidebar; accepts the same filters as GET /api/stock
+    try:
+        try:
+            params = parse_stock_query(request.args)
+            buckets = parse_bucket_count(request.args)
+        except StockQueryError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        return _cached_json_response(facets_key(request.args), lambda: (
+            load_stock_facets(db.session, StockItem, params, buckets), {}
+        ))
+    except Exception as e:
+        logger.error(f"Error fetching stock facets: {str(e)}")
+        return jsonify({"error": "Failed to fetch stock facets"}), 500
+
+@app.route('/api/stock/search', methods=['GET'])
+def search_stock_items():
+    # Ranked full-text search over name, grade and location; the last word matches as a prefix
+    try:
+        query = request.args.get('q', '')
+        limit = max(min(request.args.get('limit', 20, type=int), SEARCH_MAX_RESULTS), 1)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        
+        total, items = stock_search.search(query, limit=limit, offset=offset)
+        response = jsonify(items)
+        response.headers['X-Total-Count'] = str(total)
+        return response
+    except Exception as e:
+        logger.error(f"Error searching stock items: {str(e)}")
+        return jsonify({"error": "Failed to search stock items"}), 500
+
 @app.route('/api/stock', methods=['POST'])
 def add_stock_item():
     try:
@@ -211,7 +650,11 @@ def add_stock_item():
         )
         
         db.session.add(new_item)
+        db.session.flush()
+        stock_changes.record(db.session, upserted=[new_item.id])
         db.session.commit()
+        catalog_cache.invalidate_items([new_item.id])
+        stock_search.upsert(new_item.to_dict())
         
         return jsonify(new_item.to_dict()), 201
     except Exception as e:
@@ -219,13 +662,57 @@ def add_stock_item():
         db.session.rollback()
         return jsonify({"error": f"Failed to add stock item: {str(e)}"}), 500
 
+@app.route('/api/stock/changes', methods=['GET'])
+@replica_reads
+def get_stock_changes():
+    # ?since=<version>[&after=<id>][&limit=n]: items changed after a catalog version, oldest first.
+    # Start from the X-Catalog-Version of a full GET /api/stock and pass back the returned
+    # version and after until has_more is false; 410 means the catalog must be reloaded
+    try:
+        since = request.args.get('since', type=int)
+        after = request.args.get('after', type=int)
+        limit = min(max(request.args.get('limit', STOCK_CHANGE_PAGE_SIZE, type=int), 1), STOCK_CHANGE_MAX_PAGE_SIZE)
+        if since is None or since < 0:
+            return jsonify({"error": "since must be a catalog version (from X-Catalog-Version)"}), 400
+        
+        try:
+            page = stock_changes.read(db.session, since, after, limit)
+        except ChangeFeedExpired as e:
+            return jsonify({"error": str(e), "floor": e.floor, "version": e.version}), 410
+        
+        upserted = [item_id for _, item_id, op in page['changes'] if op == 'upsert']
+        items = {}
+        for start in range(0, len(upserted), 500):
+            rows = db.session.execute(stock_rows.select().where(
+                StockItem.id.in_(upserted[start:start + 500]), StockItem.deleted_at.is_(None)))
+            items.update((item['id'], item) for item in stock_rows.dicts(rows))
+        
+        # Current state of each item; one changed and then deleted later shows up as deleted
+        changes = [
+            {"version": version, "id": item_id, "op": "upsert", "item": items[item_id]} if item_id in items
+            else {"version": version, "id": item_id, "op": "delete"}
+            for version, item_id, _ in page['changes']
+        ]
+        return jsonify({"changes": changes, "version": page['version'], "after": page['after'],
+                        "has_more": page['has_more']}), 200
+    except Exception as e:
+        logger.error(f"Error fetching stock changes: {str(e)}")
+        return jsonify({"error": "Failed to fetch stock changes"}), 500
+
 @app.route('/api/stock/<int:item_id>', methods=['GET'])
+@replica_reads
 def get_stock_item(item_id):
     try:
-        item = StockItem.query.get(item_id)
-        if not item:
+        def build_item():
+            item = StockItem.query.get(item_id)
+            if not item or item.deleted_at is not None:
+                return None
+            return item.to_dict(), {}
+        
+        response = _cached_json_response(item_key(item_id), build_item)
+        if response is None:
             return jsonify({"error": "Item not found"}), 404
-        return jsonify(item.to_dict()), 200
+        return response
     except Exception as e:
         logger.error(f"Error fetching stock item: {str(e)}")
         return jsonify({"error": "Failed to fetch stock item"}), 500
@@ -249,14 +736,47 @@ def update_stock_item(item_id):
             item.grade = data['grade']
         if 'location' in data:
             item.location = data['location']
-            
+        
+        stock_changes.record(db.session, upserted=[item_id])
         db.session.commit()
+        catalog_cache.invalidate_items([item_id])
+        if item.deleted_at is None:
+            stock_search.upsert(item.to_dict())
         return jsonify(item.to_dict()), 200
     except Exception as e:
         logger.error(f"Error updating stock item: {str(e)}")
         db.session.rollback()
         return jsonify({"error": "Failed to update stock item"}), 500
 
+@app.route('/api/stock/batch', methods=['PATCH'])
+def batch_update_stock_items():
+    # Creates, partial updates, rule-based adjustments and deletes in one transaction;
+    # if any operation is invalid nothing is written and every problem is reported
+    try:
+        data = request.get_json(silent=True)
+        try:
+            results = apply_stock_batch(db.session, StockItem.__table__, OrderItem.__table__, data,
+                                        max_operations=STOCK_BATCH_MAX_OPERATIONS)
+        except StockBatchError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e), "errors": e.errors}), 400
+        
+        touched = results.pop("touched")
+        removed = results.pop("removed")
+        if removed:
+            product_details.delete_items(db.session, removed)
+            StockItemImage.query.filter(StockItemImage.stock_item_id.in_(removed)).delete(synchronize_session=False)
+        stock_changes.record(db.session, upserted=touched, deleted=removed)
+        db.session.commit()
+        catalog_cache.invalidate_items(touched + removed)
+        product_details.invalidate(removed)
+        _reindex_search_items(touched, removed)
+        return jsonify(results), 200
+    except Exception as e:
+        logger.error(f"Error applying stock batch: {str(e)}")
+        db.session.rollback()
+        return jsonify({"error": f"Failed to apply stock batch: {str(e)}"}), 500
+
 # Add new DELETE endpoint for stock items
 @app.route('/api/stock/<int:item_id>', methods=['DELETE'])
 def delete_stock_item(item_id):
@@ -270,14 +790,219 @@ def delete_stock_item(item_id):
         if order_items:
             return jsonify({"error": "Cannot delete item that is referenced in orders"}), 400
             
+        # Not left to ON DELETE CASCADE: SQLite only enforces foreign keys when asked to
+        product_details.delete_items(db.session, [item_id])
+        StockItemImage.query.filter_by(stock_item_id=item_id).delete(synchronize_session=False)
         db.session.delete(item)
+        db.session.flush()
+        stock_changes.record(db.session, deleted=[item_id])
         db.session.commit()
+        catalog_cache.invalidate_items([item_id])
+        product_details.invalidate([item_id])
+        stock_search.remove(item_id)
         return jsonify({"message": f"Item {item_id} deleted successfully"}), 200
     except Exception as e:
         logger.error(f"Error deleting stock item: {str(e)}")
         db.session.rollback()
         return jsonify({"error": f"Failed to delete stock item: {str(e)}"}), 500
 
+def _detail_payload(item_id, loaded):
+    document, _ = loaded or ({}, None)
+    return dict(document, id=item_id)
+
+@app.route('/api/stock/details', methods=['GET'])
+@replica_reads
+def get_stock_items_details():
+    # ?ids=1,2,3 -> {"1": {...}, "2": {...}}; items without details get {"id": n}, unknown ids are left out
+    try:
+        try:
+            item_ids = list(dict.fromkeys(int(value) for value in request.args.get('ids', '').split(',') if value.strip()))
+        except ValueError:
+            return jsonify({"error": "ids must be a comma-separated list of item ids"}), 400
+        if len(item_ids) > PRODUCT_DETAIL_BULK_MAX_IDS:
+            return jsonify({"error": f"At most {PRODUCT_DETAIL_BULK_MAX_IDS} ids per request"}), 400
+        
+        existing = [item_id for (item_id,) in db.session.execute(
+            db.select(StockItem.id).where(StockItem.id.in_(item_ids), StockItem.deleted_at.is_(None))
+        )] if item_ids else []
+        loaded = product_details.load_many(db.session, existing)
+        return jsonify({str(item_id): _detail_payload(item_id, loaded.get(item_id)) for item_id in existing}), 200
+    except Exception as e:
+        logger.error(f"Error fetching stock item details: {str(e)}")
+        return jsonify({"error": "Failed to fetch stock item details"}), 500
+
+@app.route('/api/stock/<int:item_id>/details', methods=['GET'])
+@replica_reads
+def get_stock_item_details(item_id):
+    try:
+        exists = db.session.execute(
+            db.select(StockItem.id).where(StockItem.id == item_id, StockItem.deleted_at.is_(None))
+        ).first()
+        if not exists:
+            return jsonify({"error": "Item not found"}), 404
+        loaded = product_details.load(db.session, item_id)
+        response = jsonify(_detail_payload(item_id, loaded))
+        if loaded is not None:
+            set_last_modified(response, loaded[1].replace(tzinfo=timezone.utc))
+        return response, 200
+    except Exception as e:
+        logger.error(f"Error fetching stock item details: {str(e)}")
+        return jsonify({"error": "Failed to fetch stock item details"}), 500
+
+@app.route('/api/stock/<int:item_id>/details', methods=['PUT'])
+def update_stock_item_details(item_id):
+    # Body: any of productDetails, specifications, warrantyInfo; omitted fields are kept,
+    # null or "" removes one
+    try:
+        item = db.session.get(StockItem, item_id)
+        if not item or item.deleted_at is not None:
+            return jsonify({"error": "Item not found"}), 404
+        try:
+            document = product_details.save(db.session, item_id, request.get_json(silent=True),
+                                            max_bytes=PRODUCT_DETAIL_MAX_BYTES)
+        except ProductDetailError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 400
+        db.session.commit()
+        product_details.invalidate([item_id])
+        return jsonify(dict(document, id=item_id)), 200
+    except Exception as e:
+        logger.error(f"Error updating stock item details: {str(e)}")
+        db.session.rollback()
+        return jsonify({"error": f"Failed to update stock item details: {str(e)}"}), 500
+
+def _receive_image_upload():
+    # Multipart (field "image", as the admin panel sends it) or a raw image body,
+    # streamed into the image store either way
+    if request.content_length and request.content_length > IMAGE_MAX_BYTES + 64 * 1024:
+        raise ImageUploadError(f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+    if request.mimetype != 'multipart/form-data':
+        return image_store.save_stream(request.stream)
+    
+    writers = []
+    def stream_factory(**kwargs):
+        writers.append(image_store.stream_factory(**kwargs))
+        return writers[-1]
+    
+    try:
+        _, _, files = parse_form_data(request.environ, stream_factory=stream_factory, silent=False)
+        upload = files.get('image') or next(iter(files.values()), None)
+        if upload is None:
+            raise ImageUploadError("No image file in the request")
+        for writer in writers:
+            if writer is not upload.stream:
+                writer.discard()
+        return image_store.finish(upload.stream)
+    except BaseException:
+        for writer in writers:
+            writer.discard()
+        raise
+
+def _image_urls(digest):
+    return {
+        'imageUrl': url_for('get_image', digest=digest, _external=True),
+        'variants': {
+            name: {image_format: url_for('get_image_variant', digest=digest, name=name,
+                                         image_format=image_format, _external=True)
+                   for image_format in VARIANT_FORMATS}
+            for name in image_store.variant_sizes
+        } if image_store.variants_enabled else {},
+    }
+
+@app.route('/api/upload/image', methods=['POST'])
+def upload_image():
+    try:
+        stored = _receive_image_upload()
+    except ImageUploadError as e:
+        status = 413 if 'larger than' in str(e) else 400
+        return jsonify({"error": str(e)}), status
+    except Exception as e:
+        logger.error(f"Error uploading image: {str(e)}")
+        return jsonify({"error": "Failed to upload image"}), 500
+    
+    return jsonify(dict(_image_urls(stored['hash']), hash=stored['hash'], contentType=stored['content_type'],
+                        size=stored['size'], deduplicated=stored['deduplicated'])), 201
+
+def _send_image(resolved, etag):
+    path, media_type, _ = resolved
+    # conditional=True answers If-None-Match with 304 and Range with 206
+    response = send_file(path, mimetype=media_type, conditional=True, etag=etag, max_age=IMAGE_CACHE_MAX_AGE)
+    # Content-addressed: the bytes behind this URL never change
+    response.cache_control.immutable = True
+    return response
+
+def _valid_digest(digest):
+    return len(digest) == 64 and all(char in '0123456789abcdef' for char in digest)
+
+@app.route('/api/images/<digest>', methods=['GET'])
+def get_image(digest):
+    resolved = image_store.resolve(digest) if _valid_digest(digest) else None
+    if resolved is None:
+        return jsonify({"error": "Image not found"}), 404
+    return _send_image(resolved, digest)
+
+@app.route('/api/images/<digest>/<name>.<image_format>', methods=['GET'])
+def get_image_variant(digest, name, image_format):
+    # e.g. /api/images/<hash>/thumb.webp
+    if name not in image_store.variant_sizes or image_format not in VARIANT_FORMATS or not _valid_digest(digest):
+        return jsonify({"error": "Image not found"}), 404
+    resolved = image_store.resolve(digest, name, image_format)
+    if resolved is None:
+        return jsonify({"error": "Image not found"}), 404
+    if not resolved[2]:
+        # Not rendered yet (or Pillow is missing): send the client to the original's immutable
+        # URL, and never cache the redirect so the variant is asked for again next time
+        response = redirect(url_for('get_image', digest=digest), 307)
+        response.cache_control.no_cache = True
+        return response
+    return _send_image(resolved, f"{digest}-{name}-{image_format}")
+
+@app.route('/api/stock/<int:item_id>/images', methods=['GET'])
+@replica_reads
+def get_stock_item_images(item_id):
+    try:
+        if not db.session.get(StockItem, item_id):
+            return jsonify({"error": "Item not found"}), 404
+        rows = db.session.execute(
+            db.select(StockItemImage.role, StockItemImage.url).where(StockItemImage.stock_item_id == item_id)
+        )
+        return jsonify({"id": item_id, "images": dict(rows.all())}), 200
+    except Exception as e:
+        logger.error(f"Error fetching stock item images: {str(e)}")
+        return jsonify({"error": "Failed to fetch stock item images"}), 500
+
+@app.route('/api/stock/<int:item_id>/images', methods=['PUT'])
+def update_stock_item_images(item_id):
+    # Body: {"main": url, "front": url, ...}; a role sent as null or "" is removed
+    try:
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be an object"}), 400
+        unknown = set(data) - set(STOCK_IMAGE_ROLES)
+        if unknown:
+            return jsonify({"error": f"Unknown image roles: {', '.join(sorted(unknown))}"}), 400
+        for role, url in data.items():
+            if url is not None and (not isinstance(url, str) or len(url) > 500):
+                return jsonify({"error": f"Invalid URL for {role}"}), 400
+        if not db.session.get(StockItem, item_id):
+            return jsonify({"error": "Item not found"}), 404
+        
+        StockItemImage.query.filter(
+            StockItemImage.stock_item_id == item_id, StockItemImage.role.in_(list(data))
+        ).delete(synchronize_session=False)
+        db.session.add_all(StockItemImage(stock_item_id=item_id, role=role, url=url)
+                           for role, url in data.items() if url)
+        db.session.commit()
+        
+        rows = db.session.execute(
+            db.select(StockItemImage.role, StockItemImage.url).where(StockItemImage.stock_item_id == item_id)
+        )
+        return jsonify({"id": item_id, "images": dict(rows.all())}), 200
+    except Exception as e:
+        logger.error(f"Error updating stock item images: {str(e)}")
+        db.session.rollback()
+        return jsonify({"error": f"Failed to update stock item images: {str(e)}"}), 500
+
 @app.route('/api/settings', methods=['GET'])
 def get_store_settings():
     try:
@@ -292,7 +1017,9 @@ def get_store_settings():
                 swiftCode=''
             )
             db.session.add(settings)
+            bump_cache_version(PAYMENT_SETTINGS_VERSION)
             db.session.commit()
+            payment_settings_snapshot.invalidate()
             
         return jsonify(settings.to_dict()), 200
     except Exception as e:
@@ -320,41 +1047,52 @@ def update_store_settings():
         if 'swiftCode' in data:
             settings.swiftCode = data['swiftCode']
             
+        bump_cache_version(PAYMENT_SETTINGS_VERSION)
         db.session.commit()
+        payment_settings_snapshot.invalidate()
         return jsonify(settings.to_dict()), 200
     except Exception as e:
         logger.error(f"Error updating store settings: {str(e)}")
         db.session.rollback()
         return jsonify({"error": "Failed to update store settings"}), 500
 
+# Merge bank transfer details and the other payment methods into one payload
+def _load_payment_settings():
+    response = {}
+    
+    # Get bank transfer details from StoreSettings
+    bank_transfer = StoreSettings.query.first()
+    if bank_transfer:
+        response['bank_transfer'] = bank_transfer.to_dict()
+    
+    # Get other payment settings from PaymentSettings
+    for setting_type, settings_json in db.session.query(
+        PaymentSettings.setting_type, PaymentSettings.settings_json
+    ):
+        if settings_json:
+            try:
+                response[setting_type] = json.loads(settings_json)
+            except ValueError:
+                logger.error(f"Error parsing JSON for {setting_type}")
+    
+    return response
+
+# Parsed and serialized payment settings, rebuilt when their version changes
+payment_settings_snapshot = SettingsSnapshot(
+    load=_load_payment_settings,
+    read_version=lambda: read_cache_version(PAYMENT_SETTINGS_VERSION),
+    serialize=lambda data: app.json.dumps(data).encode('utf-8'),
+    check_interval=SETTINGS_VERSION_CHECK_INTERVAL
+)
+
 @app.route('/api/payment-settings', methods=['GET'])
 def get_payment_settings():
     try:
-        # Create a response with all payment details
-        response = {}
-        
-        # Get bank transfer details from StoreSettings
-        bank_transfer = StoreSettings.query.first()
-        if bank_transfer:
-            response['bank_transfer'] = {
-                'bankName': bank_transfer.bankName,
-                'accountNumber': bank_transfer.accountNumber,
-                'accountName': bank_transfer.accountName,
-                'routingNumber': bank_transfer.routingNumber,
-                'swiftCode': bank_transfer.swiftCode
-            }
-        
-        # Get other payment settings from PaymentSettings
-        payment_settings = PaymentSettings.query.all()
-        for setting in payment_settings:
-            if setting.settings_json:
-                import json
-                try:
-                    response[setting.setting_type] = json.loads(setting.settings_json)
-                except:
-                    logger.error(f"Error parsing JSON for {setting.setting_type}")
-        
-        return jsonify(response), 200
+        snapshot = payment_settings_snapshot.get()
+        response = Response(snapshot.body, mimetype='application/json')
+        response.set_etag(snapshot.etag)
+        set_last_modified(response, snapshot.built_at)
+        return response
     except Exception as e:
         logger.error(f"Error fetching payment settings: {str(e)}")
         return jsonify({"error": "Failed to fetch payment settings"}), 500
@@ -386,8 +1124,6 @@ def update_payment_settings():
         # Update other payment settings in PaymentSettings
         for key, value in data.items():
             if key != 'bank_transfer' and value:
-                import json
-                
                 setting = PaymentSettings.query.filter_by(setting_type=key).first()
                 if not setting:
                     setting = PaymentSettings(setting_type=key)
@@ -395,7 +1131,9 @@ def update_payment_settings():
                 
                 setting.settings_json = json.dumps(value)
         
+        bump_cache_version(PAYMENT_SETTINGS_VERSION)
         db.session.commit()
+        payment_settings_snapshot.invalidate()
         return jsonify({"message": "Payment settings updated successfully"}), 200
     except Exception as e:
         logger.error(f"Error updating payment settings: {str(e)}")
@@ -404,46 +1142,91 @@ def update_payment_settings():
 
 @app.route('/api/import-stock', methods=['POST'])
 def import_stock_items():
+    # Accepts a JSON array, JSON lines or CSV body (by Content-Type or ?format=),
+    # streamed and validated in chunks. The catalog is only replaced once the
+    # whole feed has been read with at most ?max_errors= invalid rows.
     try:
-        # Clear existing stock items
-        StockItem.query.delete()
-        
-        # Get stock items from request
-        items = request.json
-        
-        # Add new stock items
-        for item_data in items:
-            item = StockItem(
-                id=item_data.get('id'),
-                name=item_data.get('name'),
-                price=item_data.get('price'),
-                quantity=item_data.get('quantity'),
-                grade=item_data.get('grade'),
-                location=item_data.get('location')
-            )
-            db.session.add(item)
-            
-        db.session.commit()
-        return jsonify({"message": "Stock items imported successfully"}), 200
+        feed_format = detect_feed_format(request.mimetype, request.args.get('format'))
+        max_errors = request.args.get('max_errors', 0, type=int)
+        chunk_size = min(request.args.get('chunk_size', IMPORT_CHUNK_SIZE, type=int), IMPORT_CHUNK_SIZE)
+        mode = request.args.get('mode', 'replace')
+        if mode not in ('replace', 'sync'):
+            raise ImportFormatError(f"Unsupported import mode: {mode}")
+    except ImportFormatError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    rows = iter_feed_rows(request.stream, feed_format)
+    
+    # ?mode=sync applies only the differences and soft-deletes missing items
+    if mode == 'sync':
+        synchronizer = StockSynchronizer(db.engine, StockItem.__table__, max_errors=max_errors,
+                                         change_log=stock_changes, order_table=Order.__table__,
+                                         order_item_table=OrderItem.__table__)
+        try:
+            report = synchronizer.run(rows)
+        except ImportFormatError as e:
+            return jsonify({"error": f"Failed to sync stock items: {str(e)}"}), 400
+        except Exception as e:
+            logger.error(f"Error syncing stock items: {str(e)}")
+            return jsonify({"error": f"Failed to sync stock items: {str(e)}"}), 500
+        
+        if not report["applied"]:
+            return jsonify(dict(report, error="Sync rejected: too many invalid rows")), 400
+        catalog_cache.invalidate_all()
+        product_details.invalidate_all()
+        for row in synchronizer.applied_changes["upserted"]:
+            stock_search.upsert({field: row[field] for field in stock_rows.fields})
+        for item_id in synchronizer.applied_changes["deleted"]:
+            stock_search.remove(item_id)
+        return jsonify(report), 200
+    
+    importer = StockImporter(db.engine, StockItem.__table__, chunk_size=max(chunk_size, 1), max_errors=max_errors,
+                             change_log=stock_changes, order_item_table=OrderItem.__table__,
+                             dependent_tables=(StockItemDetail.__table__, StockItemImage.__table__))
+    
+    # ?progress=1 streams one JSON line per chunk followed by the final report
+    if request.args.get('progress', '').lower() in ('1', 'true', 'yes'):
+        return Response(
+            stream_with_context(_import_progress_events(importer, rows)),
+            mimetype='application/x-ndjson'
+        )
+    
+    try:
+        report = importer.run(rows)
+        if report["swapped"]:
+            catalog_cache.invalidate_all()
+            product_details.invalidate_all()
+            stock_search.invalidate()
+    except ImportFormatError as e:
+        return jsonify({"error": f"Failed to import stock items: {str(e)}"}), 400
     except Exception as e:
         logger.error(f"Error importing stock items: {str(e)}")
-        db.session.rollback()
         return jsonify({"error": f"Failed to import stock items: {str(e)}"}), 500
+    
+    if not report["swapped"]:
+        return jsonify(dict(report, error="Import rejected: too many invalid rows")), 400
+    
+    return jsonify(dict(report, message="Stock items imported successfully")), 200
+
+def _import_progress_events(importer, rows):
+    try:
+        for event in importer.iter_run(rows):
+            if event.get("swapped"):
+                catalog_cache.invalidate_all()
+                product_details.invalidate_all()
+                stock_search.invalidate()
+            yield json.dumps(event) + "\n"
+    except Exception as e:
+        logger.error(f"Error importing stock items: {str(e)}")
+        yield json.dumps({"done": True, "swapped": False, "error": f"Failed to import stock items: {str(e)}"}) + "\n"
 
 # New payment and order endpoints
 @app.route('/api/orders', methods=['POST'])
 def create_order():
     try:
-        logger.debug("Received order creation request")
-        
-        # Log the raw request data for debugging
-        request_data = request.get_data()
-        logger.debug(f"Raw request data: {request_data}")
-        
         try:
             # Try to parse the JSON data
             data = request.json
-            logger.debug(f"Parsed order data: {json.dumps(data)}")
         except Exception as e:
             logger.error(f"Failed to parse JSON data: {str(e)}")
             return jsonify({"error": f"Invalid JSON format: {str(e)}"}), 400
@@ -470,54 +1253,52 @@ def create_order():
             logger.error("Missing items in order data")
             return jsonify({"error": "Order items are required"}), 400
         
+        for item in items:
+            if item.get('id') is None or item.get('quantity') is None or item.get('price') is None:
+                logger.error(f"Invalid item data: {item}")
+                return jsonify({"error": f"Invalid item data: {item}"}), 400
+        
+        # Reserve stock for every line at once; nothing is written if any line fails
+        try:
+            requested = merge_order_lines(items)
+            reserved = reserve_stock(db.session, StockItem.__table__, requested)
+        except StockReservationError as e:
+            logger.error(f"Stock reservation failed: {e.errors}")
+            db.session.rollback()
+            status = 404 if e.not_found else 400
+            return jsonify({"error": str(e), "items": e.errors}), status
+        
         # Create new order
         order = Order(
             user_id=user_id,
             total_amount=total_amount,
-            status='pending'
+            status='pending',
+            expires_at=datetime.utcnow() + timedelta(minutes=ORDER_RESERVATION_TTL_MINUTES)
+            if ORDER_RESERVATION_TTL_MINUTES > 0 else None
         )
         db.session.add(order)
         db.session.flush()  # Get the order ID
-        logger.debug(f"Created order with ID: {order.id}")
+        logger.debug("Created order %s with %d lines", order.id, len(items))
         
         # Add order items
-        for item in items:
-            item_id = item.get('id')
-            quantity = item.get('quantity')
-            price = item.get('price')
-            
-            if item_id is None or quantity is None or price is None:
-                logger.error(f"Invalid item data: {item}")
-                db.session.rollback()
-                return jsonify({"error": f"Invalid item data: {item}"}), 400
-            
-            # Verify item exists
-            stock_item = StockItem.query.get(item_id)
-            if not stock_item:
-                logger.error(f"Stock item not found: {item_id}")
-                db.session.rollback()
-                return jsonify({"error": f"Stock item with ID {item_id} not found"}), 404
-            
-            order_item = OrderItem(
+        db.session.add_all([
+            OrderItem(
                 order_id=order.id,
-                stock_item_id=item_id,
-                quantity=quantity,
-                price=price
+                stock_item_id=int(item['id']),
+                quantity=item['quantity'],
+                price=item['price']
             )
-            db.session.add(order_item)
-            logger.debug(f"Added order item: {order_item.to_dict()}")
-            
-            # Update stock quantity
-            if stock_item.quantity < quantity:
-                logger.error(f"Insufficient stock for item {item_id}: {stock_item.quantity} < {quantity}")
-                db.session.rollback()
-                return jsonify({"error": f"Insufficient stock for item {stock_item.name}"}), 400
-                
-            stock_item.quantity -= quantity
-            logger.debug(f"Updated stock quantity for item {item_id}: {stock_item.quantity}")
+            for item in items
+        ])
+        db.session.flush()
+        stock_changes.record(db.session, upserted=list(requested))
         
         db.session.commit()
-        logger.info(f"Order created successfully with ID: {order.id}")
+        reservation_expiry.schedule(order.expires_at)
+        catalog_cache.invalidate_items(requested)
+        for item_id, row in reserved.items():
+            stock_search.update_fields(item_id, quantity=row.quantity)
+        logger.info("Order created successfully with ID: %s", order.id)
         return jsonify({"order_id": order.id}), 201
     except Exception as e:
         logger.error(f"Error creating order: {str(e)}")
@@ -563,94 +1344,103 @@ def confirm_payment(payment_id):
         if not payment:
             return jsonify({"error": "Payment not found"}), 404
         
-        payment.status = 'completed'
+        order = db.session.get(Order, payment.order_id)
+        if not order:
+            return jsonify({"error": "Order not found"}), 404
         
-        # Update order status
-        order = Order.query.get(payment.order_id)
-        if order:
-            order.status = 'paid'
-            # Generate a tracking number
-            order.tracking_number = f"UEP{order.id:08d}"
+        # Conditional, so it cannot overwrite an expiry committed after the read above; the
+        # expiry sweep likewise only touches orders still pending (see ReservationExpiry)
+        tracking_number = f"UEP{order.id:08d}"
+        paid = db.session.execute(
+            db.update(Order)
+            .where(Order.id == order.id, Order.status == 'pending')
+            .values(status='paid', tracking_number=tracking_number)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not paid:
+            db.session.rollback()
+            status = db.session.execute(db.select(Order.status).where(Order.id == order.id)).scalar()
+            if status == EXPIRED:
+                return jsonify({"error": "Order expired before payment; its items were released"}), 409
+            return jsonify({"error": f"Order is {status}, not pending"}), 409
         
+        payment.status = 'completed'
         db.session.commit()
-        return jsonify({"message": "Payment confirmed", "tracking_number": order.tracking_number}), 200
+        return jsonify({"message": "Payment confirmed", "tracking_number": tracking_number}), 200
     except Exception as e:
         logger.error(f"Error confirming payment: {str(e)}")
         db.session.rollback()
         return jsonify({"error": f"Failed to confirm payment: {str(e)}"}), 500
 
+@app.route('/api/orders', methods=['GET'])
+@replica_reads
+def get_orders_batch():
+    try:
+        raw_ids = request.args.get('ids', '')
+        try:
+            order_ids = [int(part) for part in raw_ids.split(',') if part.strip()]
+        except ValueError:
+            return jsonify({"error": "ids must be a comma-separated list of order IDs"}), 400
+        
+        if not order_ids:
+            return jsonify({"error": "At least one order ID is required"}), 400
+        
+        return jsonify(order_assembler.load_many(order_ids)), 200
+    except Exception as e:
+        logger.error(f"Error fetching orders: {str(e)}")
+        return jsonify({"error": f"Failed to fetch orders: {str(e)}"}), 500
+
+def _latest_created_at(records):
+    # Newest created_at of serialized records (naive UTC ISO strings), for Last-Modified
+    stamps = [record['created_at'] for record in records if record and record.get('created_at')]
+    return datetime.fromisoformat(max(stamps)).replace(tzinfo=timezone.utc) if stamps else None
+
+def _load_order(**criteria):
+    result = order_assembler.load_one(**criteria)
+    if not result and db_router.using_replica():
+        # An order created moments ago may not have reached the replica yet
+        with db_router.primary():
+            result = order_assembler.load_one(**criteria)
+    return result
+
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
+@replica_reads
 def get_order(order_id):
     try:
-        order = Order.query.get(order_id)
-        if not order:
+        result = _load_order(id=order_id)
+        if not result:
             return jsonify({"error": "Order not found"}), 404
         
-        # Get order items
-        order_items = OrderItem.query.filter_by(order_id=order_id).all()
-        items = []
-        for item in order_items:
-            stock_item = StockItem.query.get(item.stock_item_id)
-            items.append({
-                "id": item.id,
-                "stock_item_id": item.stock_item_id,
-                "name": stock_item.name if stock_item else "Unknown",
-                "quantity": item.quantity,
-                "price": item.price
-            })
-        
-        # Get payment
-        payment = Payment.query.filter_by(order_id=order_id).first()
-        
-        result = {
-            "order": order.to_dict(),
-            "items": items,
-            "payment": payment.to_dict() if payment else None
-        }
-        
-        return jsonify(result), 200
+        response = jsonify(result)
+        # The status changes without a timestamp, so only the ETag validates
+        set_last_modified(response, _latest_created_at([result['order'], result.get('payment')]), validator=False)
+        return response, 200
     except Exception as e:
         logger.error(f"Error fetching order: {str(e)}")
         return jsonify({"error": f"Failed to fetch order: {str(e)}"}), 500
 
 @app.route('/api/orders/by-user/<user_id>', methods=['GET'])
+@replica_reads
 def get_orders_by_user(user_id):
     try:
-        orders = Order.query.filter_by(user_id=user_id).all()
-        return jsonify([order.to_dict() for order in orders]), 200
+        # ?details=true returns items and payment for every order in one batch
+        if request.args.get('details', '').lower() in ('1', 'true', 'yes'):
+            return jsonify(order_assembler.load_where(user_id=user_id)), 200
+        
+        orders = db.session.execute(order_rows.select().where(Order.user_id == user_id))
+        return jsonify(order_rows.dicts(orders)), 200
     except Exception as e:
         logger.error(f"Error fetching orders: {str(e)}")
         return jsonify({"error": f"Failed to fetch orders: {str(e)}"}), 500
 
 @app.route('/api/orders/by-tracking/<tracking_number>', methods=['GET'])
+@replica_reads
 def get_order_by_tracking(tracking_number):
     try:
-        order = Order.query.filter_by(tracking_number=tracking_number).first()
-        if not order:
+        result = _load_order(tracking_number=tracking_number)
+        if not result:
             return jsonify({"error": "Order not found"}), 404
         
-        # Get order items
-        order_items = OrderItem.query.filter_by(order_id=order.id).all()
-        items = []
-        for item in order_items:
-            stock_item = StockItem.query.get(item.stock_item_id)
-            items.append({
-                "id": item.id,
-                "stock_item_id": item.stock_item_id,
-                "name": stock_item.name if stock_item else "Unknown",
-                "quantity": item.quantity,
-                "price": item.price
-            })
-        
-        # Get payment
-        payment = Payment.query.filter_by(order_id=order.id).first()
-        
-        result = {
-            "order": order.to_dict(),
-            "items": items,
-            "payment": payment.to_dict() if payment else None
-        }
-        
         return jsonify(result), 200
     except Exception as e:
         logger.error(f"Error fetching order: {str(e)}")
@@ -687,10 +1477,11 @@ def send_chat_message():
         
         db.session.add(chat_message)
         db.session.commit()
+        chat_events.publish_message(chat_message.to_dict())
         
         # Trigger notification to Telegram
         try:
-            from services.telegram_service import send_telegram_message
+            from services.telegram_service import queue_telegram_message
             
             notification_message = f"""
 <b>New Chat Message</b>
@@ -699,7 +1490,7 @@ def send_chat_message():
 <b>Conversation ID:</b> {conversation_id}
             """
             
-            send_telegram_message(notification_message)
+            queue_telegram_message(notification_message)
         except Exception as e:
             logger.error(f"Failed to send Telegram notification: {str(e)}")
         
@@ -710,68 +1501,201 @@ def send_chat_message():
         return jsonify({"error": f"Failed to send message: {str(e)}"}), 500
 
 @app.route('/api/chat/messages/<conversation_id>', methods=['GET'])
+@replica_reads
 def get_chat_messages(conversation_id):
     try:
-        messages = ChatMessage.query.filter_by(conversation_id=conversation_id).order_by(ChatMessage.created_at).all()
+        # Optional incremental mode: ?since_id=<id>&limit=<n> returns only newer messages
+        since_id = request.args.get('since_id', type=int)
+        limit = request.args.get('limit', type=int)
         
-        # Mark all unread admin messages as read
-        for message in messages:
-            if message.is_admin_reply and not message.is_read:
-                message.is_read = True
+        query = ChatMessage.query.filter_by(conversation_id=conversation_id)
+        if since_id is not None:
+            query = query.filter(ChatMessage.id > since_id)
+        query = query.order_by(ChatMessage.created_at, ChatMessage.id)
+        if limit is not None and limit > 0:
+            query = query.limit(min(limit, CHAT_MAX_PAGE_SIZE))
         
-        db.session.commit()
+        result = message_rows.dicts(message_rows.restrict(query))
         
-        return jsonify([message.to_dict() for message in messages]), 200
+        # Mark unread admin replies as read with one UPDATE, only when there are any
+        unread_ids = [m['id'] for m in result if m['is_admin_reply'] and not m['is_read']]
+        if unread_ids:
+            ChatMessage.query.filter(ChatMessage.id.in_(unread_ids)).update(
+                {ChatMessage.is_read: True}, synchronize_session=False
+            )
+            db.session.commit()
+            for message in result:
+                if message['id'] in unread_ids:
+                    message['is_read'] = True
+        
+        response = jsonify(result)
+        # Read flags change without a timestamp, so only the ETag validates
+        set_last_modified(response, _latest_created_at(result), validator=False)
+        return response, 200
     except Exception as e:
         logger.error(f"Error fetching chat messages: {str(e)}")
+        db.session.rollback()
         return jsonify({"error": f"Failed to fetch messages: {str(e)}"}), 500
 
+@app.route('/api/chat/messages/mark-read', methods=['POST'])
+def mark_chat_messages_read():
+    try:
+        data = request.json or {}
+        conversation_id = data.get('conversation_id')
+        is_admin = bool(data.get('is_admin', False))
+        
+        if not conversation_id:
+            return jsonify({"error": "Conversation ID is required"}), 400
+        
+        # The admin reads messages from the user and vice versa
+        unread = ChatMessage.query.filter_by(
+            conversation_id=conversation_id,
+            is_admin_reply=not is_admin,
+            is_read=False
+        )
+        
+        # Check first so that nothing is written when everything is already read
+        updated = 0
+        if db.session.query(unread.exists()).scalar():
+            updated = unread.update({ChatMessage.is_read: True}, synchronize_session=False)
+            db.session.commit()
+        
+        return jsonify({"updated": updated}), 200
+    except Exception as e:
+        logger.error(f"Error marking chat messages as read: {str(e)}")
+        db.session.rollback()
+        return jsonify({"error": f"Failed to mark messages as read: {str(e)}"}), 500
+
+def _load_messages_after(since_id, conversation_id=None, limit=CHAT_MAX_PAGE_SIZE):
+    query = ChatMessage.query.filter(ChatMessage.id > since_id)
+    if conversation_id is not None:
+        query = query.filter(ChatMessage.conversation_id == conversation_id)
+    messages = message_rows.dicts(message_rows.restrict(query.order_by(ChatMessage.id).limit(limit)))
+    # Give the connection back to the pool before waiting for new messages
+    db.session.close()
+    return messages
+
+def _format_sse(message):
+    return f"id: {message['id']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+
+"""
+Wait until a message newer than since_id is published here or shows up in the database
+@param subscription Subscription to the conversation's (or the admin) topic
+@param timeout Seconds to wait at most
+@returns The newer messages from the database, or [] after the timeout
+"""
+def _wait_for_messages(subscription, since_id, conversation_id, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return []
+        # A publish only wakes the wait: another worker may have written an older
+        # message this one never heard of, so the database decides what is new
+        if subscription.get(timeout=min(remaining, CHAT_CATCH_UP_INTERVAL)) is not None:
+            subscription.drain()
+        with app.app_context():
+            messages = _load_messages_after(since_id, conversation_id)
+        if messages:
+            return messages
+
+def _chat_event_stream(subscription, backlog, last_id, conversation_id=None):
+    try:
+        yield "retry: 3000\n\n"
+        for message in backlog:
+            yield _format_sse(message)
+            last_id = message['id']
+        
+        deadline = time.monotonic() + CHAT_STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            messages = _wait_for_messages(subscription, last_id, conversation_id,
+                                          min(CHAT_STREAM_HEARTBEAT, deadline - time.monotonic()))
+            if not messages:
+                yield ": keep-alive\n\n"
+            for message in messages:
+                yield _format_sse(message)
+                last_id = message['id']
+    finally:
+        subscription.close()
+
+def _sse_response(topic, since_id, conversation_id=None):
+    # Subscribe before loading the backlog so no message falls in between
+    subscription = chat_events.subscribe(topic)
+    try:
+        if since_id or conversation_id:
+            backlog = _load_messages_after(since_id, conversation_id)
+        else:
+            # A fresh admin stream starts after the newest message instead of replaying them all
+            backlog = []
+            since_id = db.session.query(db.func.max(ChatMessage.id)).scalar() or 0
+            db.session.close()
+    except Exception:
+        subscription.close()
+        raise
+    
+    return Response(
+        _chat_event_stream(subscription, backlog, since_id, conversation_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/chat/poll/<conversation_id>', methods=['GET'])
+def poll_chat_messages(conversation_id):
+    try:
+        since_id = request.args.get('since_id', 0, type=int)
+        timeout = min(request.args.get('timeout', CHAT_POLL_TIMEOUT, type=float), CHAT_POLL_TIMEOUT)
+        
+        with chat_events.subscribe(conversation_topic(conversation_id)) as subscription:
+            messages = _load_messages_after(since_id, conversation_id)
+            if not messages:
+                messages = _wait_for_messages(subscription, since_id, conversation_id, max(timeout, 0))
+            return jsonify(messages), 200
+    except Exception as e:
+        logger.error(f"Error polling chat messages: {str(e)}")
+        return jsonify({"error": f"Failed to poll messages: {str(e)}"}), 500
+
+@app.route('/api/chat/stream/<conversation_id>', methods=['GET'])
+def stream_chat_messages(conversation_id):
+    try:
+        since_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('since_id', 0, type=int)
+        return _sse_response(conversation_topic(conversation_id), since_id, conversation_id)
+    except Exception as e:
+        logger.error(f"Error opening chat stream: {str(e)}")
+        return jsonify({"error": f"Failed to open chat stream: {str(e)}"}), 500
+
+@app.route('/api/chat/admin/stream', methods=['GET'])
+def stream_admin_chat_messages():
+    try:
+        since_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('since_id', 0, type=int)
+        return _sse_response(ADMIN_TOPIC, since_id)
+    except Exception as e:
+        logger.error(f"Error opening admin chat stream: {str(e)}")
+        return jsonify({"error": f"Failed to open chat stream: {str(e)}"}), 500
+
 @app.route('/api/chat/admin/messages', methods=['GET'])
+@replica_reads
 def get_all_chat_conversations():
     try:
-        # Get unique conversation IDs with the latest message from each
-        conversations = db.session.query(
-            ChatMessage.conversation_id,
-            db.func.max(ChatMessage.created_at).label('latest_message')
-        ).group_by(ChatMessage.conversation_id).all()
+        # Optional filters: ?since=<ISO timestamp>&limit=<n>&offset=<n>
+        try:
+            since = request.args.get('since')
+            since = datetime.fromisoformat(since) if since else None
+            limit = request.args.get('limit', type=int)
+            offset = request.args.get('offset', 0, type=int)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
         
-        result = []
+        if (limit is not None and limit < 1) or offset < 0:
+            return jsonify({"error": "limit must be positive and offset non-negative"}), 400
         
-        for conv_id, latest_date in conversations:
-            # Get the latest message in this conversation
-            latest_message = ChatMessage.query.filter_by(
-                conversation_id=conv_id, 
-                created_at=latest_date
-            ).first()
-            
-            # Count unread messages from users
-            unread_count = ChatMessage.query.filter_by(
-                conversation_id=conv_id,
-                is_admin_reply=False,
-                is_read=False
-            ).count()
-            
-            # Get user info from the first user message in the conversation
-            first_user_message = ChatMessage.query.filter_by(
-                conversation_id=conv_id,
-                is_admin_reply=False
-            ).order_by(ChatMessage.created_at).first()
-            
-            if latest_message and first_user_message:
-                result.append({
-                    'conversation_id': conv_id,
-                    'username': first_user_message.username,
-                    'email': first_user_message.email,
-                    'latest_message': latest_message.message,
-                    'latest_message_time': latest_message.created_at.isoformat(),
-                    'unread_count': unread_count,
-                    'is_latest_from_admin': latest_message.is_admin_reply
-                })
-        
-        # Sort by latest message time descending
-        result.sort(key=lambda x: x['latest_message_time'], reverse=True)
+        result, total = load_conversation_summaries(
+            db.session, ChatMessage, since=since, limit=limit, offset=offset
+        )
         
-        return jsonify(result), 200
+        response = jsonify(result)
+        if total is not None:
+            response.headers['X-Total-Count'] = str(total)
+        return response, 200
     except Exception as e:
         logger.error(f"Error fetching chat conversations: {str(e)}")
         return jsonify({"error": f"Failed to fetch conversations: {str(e)}"}), 500
@@ -802,4 +1726,11 @@ def admin_reply_to_chat():
         )
         
         db.session.add(admin_message)
-        db.session
+        db.session.commit()
+        chat_events.publish_message(admin_message.to_dict())
+        
+        return jsonify(admin_message.to_dict()), 201
+    except Exception as e:
+        logger.error(f"Error sending admin reply: {str(e)}")
+        db.session.rollback()
+        return jsonify({"error": f"Failed to send admin reply: {str(e)}"}), 500
@@ -0,0 +1,54 @@
+"""
+Time a replace import of a large feed, and a second import of the same feed over the filled catalog
+
+    cd backend && python benchmarks/bench_import.py [rows]
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+# The app module is only imported for its table definitions
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("ORDER_EXPIRY_SCHEDULER", "off")
+
+from sqlalchemy import create_engine, func, select
+
+from services.stock_import_service import StockImporter, iter_feed_rows
+
+
+def main(rows=100_000):
+    from app import OrderItem, StockItem, StockItemDetail, StockItemImage
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        StockItem.metadata.create_all(engine)
+        importer = StockImporter(engine, StockItem.__table__, order_item_table=OrderItem.__table__,
+                                 dependent_tables=(StockItemDetail.__table__, StockItemImage.__table__))
+
+        feed = "".join(
+            json.dumps({"id": n + 1, "name": f"iPhone {n % 15} {n}", "price": n % 900 + 0.5, "quantity": n % 7,
+                        "grade": "ABC"[n % 3], "location": ("US", "UK", "HK")[n % 3]}) + "\n"
+            for n in range(rows)
+        ).encode("utf-8")
+        print(f"{rows} rows, {len(feed) / 1024 / 1024:.1f} MiB of JSON lines")
+
+        for label in ("empty catalog", "same feed again", "1 in 7 quantities changed"):
+            if label == "1 in 7 quantities changed":
+                feed = feed.replace(b'"quantity": 3,', b'"quantity": 4,')
+            started = time.perf_counter()
+            report = importer.run(iter_feed_rows(io.BytesIO(feed), "jsonl"))
+            elapsed = time.perf_counter() - started
+            print(f"{label:26} {elapsed:6.2f} s  {rows / elapsed:9.0f} rows/s  "
+                  f"inserted={report['inserted']} updated={report['updated']} unchanged={report['unchanged']}")
+
+        with engine.connect() as connection:
+            assert connection.execute(select(func.count()).select_from(StockItem.__table__)).scalar() == rows
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,52 @@
+"""
+Compare the stdlib and orjson JSON providers on catalog and order payloads
+
+    cd backend && python benchmarks/bench_json.py [items]
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from json_provider import install_json_provider, orjson
+
+
+def _payloads(items):
+    stock = [{"id": n, "name": f"iPhone {n % 15} Pro {n % 4 * 128}GB", "price": n % 900 + 0.5,
+              "quantity": n % 7, "grade": "ABC"[n % 3], "location": ("US", "UK", "HK")[n % 3]}
+             for n in range(items)]
+    start = datetime(2024, 1, 1)
+    orders = [{"id": n, "user_id": f"customer{n % 300}@example.com", "total_amount": n * 1.5, "status": "pending",
+               "tracking_number": None, "created_at": start + timedelta(minutes=n),
+               "expires_at": start + timedelta(minutes=n + 30)}
+              for n in range(items // 5)]
+    return {"stock listing": stock, "orders with datetimes": orders}
+
+
+def main(items=10_000, repeat=5):
+    if orjson is None:
+        sys.exit("orjson is not installed (pip install -r requirements.txt)")
+    apps = {}
+    for name in ("stdlib", "orjson"):
+        app = Flask(name)
+        install_json_provider(app, name)
+        apps[name] = app
+
+    for label, payload in _payloads(items).items():
+        timings = {}
+        for name, app in apps.items():
+            with app.app_context():
+                body = app.json.response(payload).get_data()
+                number = 5
+                timings[name] = min(timeit.repeat(lambda: app.json.response(payload), number=number,
+                                                  repeat=repeat)) / number
+            print(f"{label:22} {name:7} {timings[name] * 1000:8.2f} ms  {len(body) / 1024:8.1f} KiB")
+        print(f"{label:22} orjson is {timings['stdlib'] / timings['orjson']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,75 @@
+"""
+Time StockSearchIndex queries over a 50k-item catalog, uncached (as after a write the query
+matches) and with the ranked result cached; exits with status 1 when an uncached median exceeds 1 ms
+
+    cd backend && python benchmarks/bench_search.py [items]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.stock_search_index import StockSearchIndex
+
+MODELS = ["iPhone 11", "iPhone 12 Pro", "iPhone 13 mini", "iPhone 14 Pro Max", "iPhone 15", "Galaxy S21",
+          "Galaxy S23 Ultra", "Pixel 7", "Pixel 8 Pro", "iPad Air", "iPad Pro 11", "MacBook Air M2"]
+QUERIES = ["i", "ip", "iphone", "iphone 13", "iphone 14 pro", "pro max 256", "galaxy ultra", "grade a",
+           "pixel 8 in london", "128gb", "ipad pro 11 grade b", "macbook", "nothing matches this"]
+# Target for the median of an uncached query
+LIMIT_MS = 1.0
+
+
+def _catalog(items):
+    rng = random.Random(7)
+    return [{"id": n, "name": f"{rng.choice(MODELS)} {rng.choice((64, 128, 256, 512))}GB {rng.choice(('Black', 'Blue', 'Gold', 'Silver'))}",
+             "price": round(rng.uniform(50, 1500), 2), "quantity": rng.randint(0, 20),
+             "grade": rng.choice(("A", "B", "C", "A+")), "location": rng.choice(("London", "New York", "Hong Kong"))}
+            for n in range(1, items + 1)]
+
+
+def _time(index, query, clear):
+    samples = []
+    for _ in range(50):
+        clear()
+        started = time.perf_counter()
+        index.search(query, limit=20)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main(items=50_000):
+    catalog = _catalog(items)
+    index = StockSearchIndex(load=lambda: catalog)
+    started = time.perf_counter()
+    index.rebuild(catalog)
+    print(f"built index over {items} items in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    print(f"{'query':22} {'hits':>6} {'uncached p50':>12} {'uncached max':>12} {'cached p50':>10}")
+    worst = 0.0
+    for query in QUERIES:
+        hits, _ = index.search(query, limit=20)
+        uncached, uncached_max = _time(index, query, index._clear_caches)
+        cached, _ = _time(index, query, lambda: None)
+        worst = max(worst, uncached)
+        print(f"{query:22} {hits:>6} {uncached:10.3f}ms {uncached_max:10.3f}ms {cached:8.3f}ms")
+
+    # A write drops only the cached results the changed item matches
+    for query in QUERIES:
+        index.search(query, limit=20)
+    started = time.perf_counter()
+    index.upsert(dict(catalog[0], name="iPhone 13 mini 128GB Green"))
+    print(f"write: {(time.perf_counter() - started) * 1000:.3f} ms, "
+          f"{len(index._result_cache)} of {len(QUERIES)} cached results kept")
+    started = time.perf_counter()
+    index.search("iphone 13", limit=20)
+    print(f"first query after a write: {(time.perf_counter() - started) * 1000:.3f} ms")
+
+    print(f"slowest uncached median: {worst:.3f} ms (target {LIMIT_MS:.1f} ms)")
+    return 0 if worst <= LIMIT_MS else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000))
@@ -28,6 +28,133 @@ ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", ",".join(DEFAULT_ORIGINS)).s
 
 # Database configuration
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///store_data.db")
+# Optional read replicas, comma-separated; read-only endpoints are spread across them
+DATABASE_READ_URLS = os.environ.get("DATABASE_READ_URLS", os.environ.get("DATABASE_READ_URL", ""))
 
 # Secret key for session
 SESSION_SECRET = os.environ.get("SESSION_SECRET", "dev_secret_key")
+
+# Stock listing pagination
+STOCK_PAGE_SIZE = int(os.environ.get("STOCK_PAGE_SIZE", 50))
+STOCK_MAX_PAGE_SIZE = int(os.environ.get("STOCK_MAX_PAGE_SIZE", 500))
+
+# Telegram notification delivery
+TELEGRAM_TIMEOUT = float(os.environ.get("TELEGRAM_TIMEOUT", 5))
+TELEGRAM_QUEUE_SIZE = int(os.environ.get("TELEGRAM_QUEUE_SIZE", 1000))
+# One of drop_newest, drop_oldest or spill (write overflow to TELEGRAM_SPILL_PATH,
+# one file per worker process with its pid before the extension)
+TELEGRAM_OVERFLOW_POLICY = os.environ.get("TELEGRAM_OVERFLOW_POLICY", "drop_oldest")
+TELEGRAM_SPILL_PATH = os.environ.get("TELEGRAM_SPILL_PATH", "telegram_spill.jsonl")
+# Minimum seconds between two messages; messages arriving in between are sent as one digest
+TELEGRAM_MIN_INTERVAL = float(os.environ.get("TELEGRAM_MIN_INTERVAL", 1))
+TELEGRAM_MAX_RETRIES = int(os.environ.get("TELEGRAM_MAX_RETRIES", 5))
+
+# Chat message fetching
+CHAT_MAX_PAGE_SIZE = int(os.environ.get("CHAT_MAX_PAGE_SIZE", 500))
+
+# Chat push channel (long-poll and Server-Sent Events)
+CHAT_POLL_TIMEOUT = float(os.environ.get("CHAT_POLL_TIMEOUT", 25))
+CHAT_STREAM_HEARTBEAT = float(os.environ.get("CHAT_STREAM_HEARTBEAT", 15))
+# Waiting streams and long-polls re-query the database this often, for messages written by other workers
+CHAT_CATCH_UP_INTERVAL = float(os.environ.get("CHAT_CATCH_UP_INTERVAL", 2))
+# Streams are closed after this many seconds; EventSource reconnects with Last-Event-ID
+CHAT_STREAM_MAX_SECONDS = float(os.environ.get("CHAT_STREAM_MAX_SECONDS", 300))
+
+# Stock import: rows validated and written per chunk
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 2000))
+
+# In-process cache of serialized /api/stock responses
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", 30))
+CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get("CATALOG_CACHE_MAX_ENTRIES", 1024))
+
+# Seconds between checks of the stored settings version by each worker
+SETTINGS_VERSION_CHECK_INTERVAL = float(os.environ.get("SETTINGS_VERSION_CHECK_INTERVAL", 1))
+
+# Production server (python run.py serve): pre-fork workers, each with a thread pool
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", (os.cpu_count() or 1) * 2 + 1))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 8))
+WEB_TIMEOUT = int(os.environ.get("WEB_TIMEOUT", 60))
+# Seconds workers get to finish in-flight requests after SIGTERM
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+# Restart a worker after this many requests (0 disables) to cap memory growth
+WEB_MAX_REQUESTS = int(os.environ.get("WEB_MAX_REQUESTS", 0))
+
+# Database connection pool, per worker process; defaults to one connection per thread
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", WEB_THREADS))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 4))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 300))
+# Pool of each read replica, per worker process
+DB_READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", DB_POOL_SIZE))
+DB_READ_MAX_OVERFLOW = int(os.environ.get("DB_READ_MAX_OVERFLOW", DB_MAX_OVERFLOW))
+# After a write, reads by the same client (and by this worker) use the primary this long,
+# covering replication lag
+DB_READ_AFTER_WRITE_SECONDS = float(os.environ.get("DB_READ_AFTER_WRITE_SECONDS", 5))
+# How long SQLite waits for a lock held by another connection before failing
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", 15))
+
+# Request instrumentation: requests slower than this are logged with their query count
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+
+# Logging: root level, per-logger overrides ("sqlalchemy.engine=INFO,werkzeug=WARNING"),
+# output format (json or text) and the fraction of DEBUG records kept
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", 0.01))
+# Records waiting for the background writer; further records are dropped
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+# Stock search: largest page returned, and seconds before a worker reloads its index
+# from the database (picks up writes made by other worker processes)
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", 100))
+SEARCH_INDEX_MAX_AGE = float(os.environ.get("SEARCH_INDEX_MAX_AGE", 300))
+
+# PATCH /api/stock/batch: largest number of create, update and delete entries per request
+STOCK_BATCH_MAX_OPERATIONS = int(os.environ.get("STOCK_BATCH_MAX_OPERATIONS", 10000))
+
+# JSON encoding for responses and request bodies: auto (orjson when installed), orjson or stdlib
+JSON_PROVIDER = os.environ.get("JSON_PROVIDER", "auto")
+
+# Response compression: smallest body compressed, gzip level, brotli quality (when the
+# brotli package is installed) and memory kept for compressed bodies per worker
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 5))
+COMPRESS_CACHE_MAX_BYTES = int(os.environ.get("COMPRESS_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Schema migrations when the server starts: upgrade (apply pending ones), check (refuse
+# to start while any are pending) or off
+SCHEMA_ON_START = os.environ.get("SCHEMA_ON_START", "upgrade")
+
+# Image uploads: storage directory (default: images/ in the app's instance folder), largest
+# accepted file, resized variants as name:longest side in pixels, processes rendering them,
+# and how long browsers may cache served images (they never change under their URL)
+IMAGE_STORAGE_DIR = os.environ.get("IMAGE_STORAGE_DIR", "")
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+IMAGE_VARIANT_SIZES = os.environ.get("IMAGE_VARIANT_SIZES", "thumb:200,medium:600,large:1200")
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+IMAGE_CACHE_MAX_AGE = int(os.environ.get("IMAGE_CACHE_MAX_AGE", 365 * 24 * 3600))
+
+# Product details (description, specifications, warranty): largest accepted document,
+# per-process cache lifetime and size, and ids per bulk request
+PRODUCT_DETAIL_MAX_BYTES = int(os.environ.get("PRODUCT_DETAIL_MAX_BYTES", 64 * 1024))
+PRODUCT_DETAIL_CACHE_TTL = float(os.environ.get("PRODUCT_DETAIL_CACHE_TTL", 300))
+PRODUCT_DETAIL_CACHE_MAX_ENTRIES = int(os.environ.get("PRODUCT_DETAIL_CACHE_MAX_ENTRIES", 2048))
+PRODUCT_DETAIL_BULK_MAX_IDS = int(os.environ.get("PRODUCT_DETAIL_BULK_MAX_IDS", 200))
+
+# Catalog change feed (/api/stock/changes): days of changes kept for consumers, seconds
+# between compactions of the log per worker, and entries per page
+STOCK_CHANGE_RETENTION_DAYS = float(os.environ.get("STOCK_CHANGE_RETENTION_DAYS", 7))
+STOCK_CHANGE_COMPACT_INTERVAL = float(os.environ.get("STOCK_CHANGE_COMPACT_INTERVAL", 3600))
+STOCK_CHANGE_PAGE_SIZE = int(os.environ.get("STOCK_CHANGE_PAGE_SIZE", 500))
+STOCK_CHANGE_MAX_PAGE_SIZE = int(os.environ.get("STOCK_CHANGE_MAX_PAGE_SIZE", 5000))
+
+# Unpaid orders: minutes a pending order holds its stock (0 keeps it forever), orders
+# expired per transaction, seconds between checks and how long a worker's claim on the
+# expiry job lasts without renewal. ORDER_EXPIRY_SCHEDULER=off runs no background thread
+ORDER_RESERVATION_TTL_MINUTES = float(os.environ.get("ORDER_RESERVATION_TTL_MINUTES", 30))
+ORDER_EXPIRY_BATCH_SIZE = int(os.environ.get("ORDER_EXPIRY_BATCH_SIZE", 200))
+ORDER_EXPIRY_POLL_SECONDS = float(os.environ.get("ORDER_EXPIRY_POLL_SECONDS", 30))
+ORDER_EXPIRY_LEASE_SECONDS = float(os.environ.get("ORDER_EXPIRY_LEASE_SECONDS", 90))
+ORDER_EXPIRY_SCHEDULER = os.environ.get("ORDER_EXPIRY_SCHEDULER", "on").strip().lower()
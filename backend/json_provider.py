@@ -0,0 +1,100 @@
+"""
+JSON provider - pluggable JSON encoding for Flask responses and request bodies
+
+JSON_PROVIDER selects the implementation: "orjson" encodes with the orjson
+package, "stdlib" keeps Flask's json-module provider, and "auto" (the default)
+uses orjson when it is installed. Both produce the same documents: keys are
+sorted, datetimes, dates, UUIDs and dataclasses are converted the way Flask
+converts them, and responses are compact outside debug mode. orjson is in
+requirements.txt; without it the app still runs on the stdlib provider.
+"""
+import logging
+
+from flask.json.provider import DefaultJSONProvider
+
+from config import JSON_PROVIDER
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+PROVIDERS = ("auto", "orjson", "stdlib")
+
+logger = logging.getLogger(__name__)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson.
+
+    Calls with json.dumps/json.loads keyword arguments (indent, separators,
+    cls, ...) are passed to the stdlib provider, so existing callers keep
+    working. orjson emits UTF-8 rather than \\u escapes, which is equivalent
+    JSON and smaller for non-ASCII names.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        # Datetimes go through Flask's default() so they keep the HTTP date format
+        self._options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def _option(self, indent=False):
+        option = self._options
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    """
+    Serialize straight to UTF-8 bytes, for response bodies and cache entries
+    """
+    def dumps_bytes(self, obj, indent=False) -> bytes:
+        return orjson.dumps(obj, default=self.default, option=self._option(indent))
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+"""
+Serialize to UTF-8 bytes with whichever provider the app uses
+@param app The Flask app
+@param obj The data to serialize
+"""
+def dumps_bytes(app, obj) -> bytes:
+    provider = app.json
+    if isinstance(provider, OrjsonProvider):
+        return provider.dumps_bytes(obj)
+    return provider.dumps(obj).encode("utf-8")
+
+
+"""
+Install the JSON provider chosen by JSON_PROVIDER
+@param app The Flask app
+@param name "auto", "orjson" or "stdlib"; defaults to the JSON_PROVIDER setting
+@returns The provider name in use
+"""
+def install_json_provider(app, name=None) -> str:
+    name = (name or JSON_PROVIDER).strip().lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"JSON_PROVIDER must be one of {', '.join(PROVIDERS)}, not {name!r}")
+    if name == "orjson" and orjson is None:
+        logger.warning("JSON_PROVIDER=orjson but orjson is not installed; using the stdlib provider")
+    if name != "stdlib" and orjson is not None:
+        app.json = OrjsonProvider(app)
+        return "orjson"
+    app.json = DefaultJSONProvider(app)
+    return "stdlib"
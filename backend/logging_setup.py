@@ -0,0 +1,204 @@
+"""
+Logging setup - leveled, structured logging written by a background thread
+
+Records are put on a bounded in-memory queue by the thread that logs them and
+formatted and written by a QueueListener thread, so request threads never wait
+on stderr. Levels come from LOG_LEVEL / LOG_LEVELS, output is JSON lines (or
+plain text with LOG_FORMAT=text) carrying the id of the request being served,
+and DEBUG records are sampled at LOG_DEBUG_SAMPLE_RATE.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+from config import LOG_DEBUG_SAMPLE_RATE, LOG_FORMAT, LOG_LEVEL, LOG_LEVELS, LOG_QUEUE_SIZE
+
+REQUEST_ID_HEADER = "X-Request-ID"
+MAX_REQUEST_ID_LENGTH = 128
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "request_id"}
+
+_listener = None
+_handler = None
+_configure_lock = threading.Lock()
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamps each record with the id of the current request, or "-" outside one
+    """
+
+    def filter(self, record):
+        request_id = "-"
+        if has_request_context():
+            request_id = g.get("request_id", "-")
+        record.request_id = request_id
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """
+    Passes every record at INFO and above, and only a fraction of DEBUG records
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    The stock QueueHandler formats each record in the calling thread. Here the
+    caller only merges the message arguments (so later mutation of the
+    arguments cannot change the message) and renders any traceback; JSON
+    encoding and the write happen on the listener. When the queue is full the
+    record is dropped rather than blocking the request.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+"""
+Parse per-logger level overrides
+@param spec Comma-separated name=LEVEL pairs, e.g. "sqlalchemy.engine=INFO,werkzeug=WARNING"
+"""
+def parse_logger_levels(spec: str) -> dict:
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+"""
+Route all logging through the background writer; safe to call more than once
+"""
+def configure_logging():
+    global _listener, _handler
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stderr)
+        if LOG_FORMAT == "text":
+            output.setFormatter(logging.Formatter(
+                "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+            ))
+        else:
+            output.setFormatter(JsonFormatter())
+
+        handler = BackgroundQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+        handler.addFilter(RequestIdFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL.upper())
+        for name, level in parse_logger_levels(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        _handler = handler
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def _restart_after_fork():
+    # The writer thread does not survive fork(); give the child its own queue and writer
+    global _listener, _configure_lock
+    _configure_lock = threading.Lock()
+    if _listener is None:
+        return
+    _handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+"""
+Flush queued records and stop the writer thread
+"""
+def stop_logging():
+    global _listener
+    with _configure_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+"""
+Assign every request an id (taken from X-Request-ID when the client sends one)
+and echo it in the response
+"""
+def install_request_ids(app):
+    @app.before_request
+    def _assign_request_id():
+        request_id = request.headers.get(REQUEST_ID_HEADER, "")[:MAX_REQUEST_ID_LENGTH]
+        g.request_id = request_id or uuid.uuid4().hex
+
+    @app.after_request
+    def _echo_request_id(response):
+        request_id = g.get("request_id")
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
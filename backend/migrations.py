@@ -0,0 +1,295 @@
+"""
+Schema migrations - every change to the database schema, in version order
+
+Each step describes the tables it touches as they are at that version, not
+as the models in app.py currently declare them, so an old database and a new
+one end up with the same schema. Add a step at the end for every model change
+(new table, column or index) and never edit a step that has shipped.
+
+    python run.py migrate            Apply pending migrations
+    python run.py migrate status     Show applied and pending migrations and model drift
+    python run.py migrate check      Exit with status 1 when migrations are pending
+"""
+import logging
+import os
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    Text,
+    create_engine,
+)
+from sqlalchemy.engine import make_url
+
+from config import DATABASE_URL, SCHEMA_ON_START, SQLITE_BUSY_TIMEOUT
+from services.schema_migrator import Migration, SchemaMigrator, SchemaOutOfDate
+
+logger = logging.getLogger(__name__)
+
+# Set once the schema was prepared in this process, so preparing it again does nothing
+_schema_prepared = False
+
+
+def _initial_schema(op):
+    # The tables as the first release defined them
+    metadata = MetaData()
+    tables = [
+        Table("stock_item", metadata,
+              Column("id", Integer, primary_key=True),
+              Column("name", String(100), nullable=False),
+              Column("price", Float, nullable=False),
+              Column("quantity", Integer, nullable=False),
+              Column("grade", String(20), nullable=False),
+              Column("location", String(50), nullable=False),
+              Column("created_at", DateTime)),
+        Table("store_settings", metadata,
+              Column("id", Integer, primary_key=True),
+              Column("bankName", String(100)),
+              Column("accountNumber", String(50)),
+              Column("accountName", String(100)),
+              Column("routingNumber", String(50)),
+              Column("swiftCode", String(50))),
+        Table("payment_settings", metadata,
+              Column("id", Integer, primary_key=True),
+              Column("setting_type", String(50), nullable=False),
+              Column("settings_json", Text)),
+        Table("order", metadata,
+              Column("id", Integer, primary_key=True),
+              Column("user_id", String(100)),
+              Column("total_amount", Float, nullable=False),
+              Column("status", String(50)),
+              Column("tracking_number", String(50)),
+              Column("created_at", DateTime)),
+        Table("order_item", metadata,
+              Column("id", Integer, primary_key=True),
+              Column("order_id", Integer, ForeignKey("order.id"), nullable=False),
+              Column("stock_item_id", Integer, ForeignKey("stock_item.id"), nullable=False),
+              Column("quantity", Integer, nullable=False),
+              Column("price", Float, nullable=False)),
+        Table("payment", metadata,
+              Column("id", Integer, primary_key=True),
+              Column("order_id", Integer, ForeignKey("order.id"), nullable=False),
+              Column("payment_method", String(50), nullable=False),
+              Column("amount", Float, nullable=False),
+              Column("status", String(50)),
+              Column("transaction_id", String(100)),
+              Column("created_at", DateTime)),
+        Table("chat_message", metadata,
+              Column("id", Integer, primary_key=True),
+              Column("user_id", String(100)),
+              Column("username", String(100)),
+              Column("email", String(100)),
+              Column("message", Text, nullable=False),
+              Column("is_admin_reply", Boolean),
+              Column("is_read", Boolean),
+              Column("conversation_id", String(100), nullable=False),
+              Column("created_at", DateTime)),
+    ]
+    for table in tables:
+        op.create_table(table)
+
+
+def _stock_sync_columns(op):
+    # Used by the diff-based sync import; both nullable, so old code keeps inserting rows
+    op.add_column("stock_item", Column("content_hash", String(40)))
+    op.add_column("stock_item", Column("deleted_at", DateTime))
+
+
+def _cache_version_table(op):
+    op.create_table(Table("cache_version", MetaData(),
+                          Column("name", String(50), primary_key=True),
+                          Column("version", Integer, nullable=False)))
+
+
+def _catalog_and_chat_indexes(op):
+    metadata = MetaData()
+    stock = Table("stock_item", metadata, *(Column(name) for name in
+                  ("id", "grade", "location", "price", "created_at", "name")))
+    chat = Table("chat_message", metadata, *(Column(name) for name in
+                 ("conversation_id", "created_at", "is_admin_reply", "is_read")))
+    for index in (
+        Index("ix_stock_item_grade_price", stock.c.grade, stock.c.price, stock.c.id),
+        Index("ix_stock_item_location_price", stock.c.location, stock.c.price, stock.c.id),
+        Index("ix_stock_item_price_id", stock.c.price, stock.c.id),
+        Index("ix_stock_item_created_at_id", stock.c.created_at, stock.c.id),
+        Index("ix_stock_item_name_id", stock.c.name, stock.c.id),
+        # Also serves every lookup by conversation_id alone
+        Index("ix_chat_message_conversation_created", chat.c.conversation_id, chat.c.created_at),
+        Index("ix_chat_message_conversation_unread", chat.c.conversation_id, chat.c.is_admin_reply, chat.c.is_read),
+    ):
+        op.create_index(index, online=True)
+
+
+def _order_lookup_indexes(op):
+    # Orders by user and tracking number, and the foreign keys joined by the order
+    # assembler, the reservation check and stock deletes
+    metadata = MetaData()
+    order = Table("order", metadata, Column("user_id"), Column("tracking_number"))
+    order_item = Table("order_item", metadata, Column("order_id"), Column("stock_item_id"))
+    payment = Table("payment", metadata, Column("order_id"))
+    for index in (
+        Index("ix_order_user_id", order.c.user_id),
+        Index("ix_order_tracking_number", order.c.tracking_number),
+        Index("ix_order_item_order_id", order_item.c.order_id),
+        Index("ix_order_item_stock_item_id", order_item.c.stock_item_id),
+        Index("ix_payment_order_id", payment.c.order_id),
+    ):
+        op.create_index(index, online=True)
+
+
+def _stock_item_image_table(op):
+    metadata = MetaData()
+    Table("stock_item", metadata, Column("id", Integer, primary_key=True))
+    op.create_table(Table("stock_item_image", metadata,
+                          Column("stock_item_id", Integer, ForeignKey("stock_item.id", ondelete="CASCADE"),
+                                 primary_key=True),
+                          Column("role", String(20), primary_key=True),
+                          Column("url", String(500), nullable=False)))
+
+
+def _stock_item_detail_table(op):
+    # Product descriptions and specifications, kept out of the catalog row
+    metadata = MetaData()
+    Table("stock_item", metadata, Column("id", Integer, primary_key=True))
+    op.create_table(Table("stock_item_detail", metadata,
+                          Column("stock_item_id", Integer, ForeignKey("stock_item.id", ondelete="CASCADE"),
+                                 primary_key=True),
+                          Column("encoding", String(10), nullable=False),
+                          Column("body", LargeBinary, nullable=False),
+                          Column("updated_at", DateTime, nullable=False)))
+
+
+def _stock_change_table(op):
+    # Versioned log behind /api/stock/changes; no foreign key, entries outlive deleted items
+    metadata = MetaData()
+    change = Table("stock_change", metadata,
+                   Column("version", Integer, primary_key=True, autoincrement=False),
+                   Column("stock_item_id", Integer, primary_key=True, autoincrement=False),
+                   Column("op", String(10), nullable=False),
+                   Column("changed_at", DateTime, nullable=False))
+    op.create_table(change)
+    op.create_index(Index("ix_stock_change_item_version", change.c.stock_item_id, change.c.version))
+    op.create_index(Index("ix_stock_change_changed_at", change.c.changed_at))
+
+
+def _order_reservation_expiry(op):
+    # Reservation deadline of pending orders, and the lease that lets one worker at a
+    # time expire them
+    op.add_column("order", Column("expires_at", DateTime))
+    op.create_table(Table("scheduler_lease", MetaData(),
+                          Column("name", String(50), primary_key=True),
+                          Column("owner", String(100), nullable=False),
+                          Column("expires_at", DateTime, nullable=False)))
+
+
+def _order_expiry_index(op):
+    # Due pending orders, found by status and deadline
+    order = Table("order", MetaData(), Column("status"), Column("expires_at"))
+    op.create_index(Index("ix_order_status_expires_at", order.c.status, order.c.expires_at), online=True)
+
+MIGRATIONS = [
+    Migration(1, "initial_schema", _initial_schema),
+    Migration(2, "stock_sync_columns", _stock_sync_columns),
+    Migration(3, "cache_version_table", _cache_version_table),
+    Migration(4, "catalog_and_chat_indexes", _catalog_and_chat_indexes, transactional=False),
+    Migration(5, "order_lookup_indexes", _order_lookup_indexes, transactional=False),
+    Migration(6, "stock_item_image_table", _stock_item_image_table),
+    Migration(7, "stock_item_detail_table", _stock_item_detail_table),
+    Migration(8, "stock_change_table", _stock_change_table),
+    Migration(9, "order_reservation_expiry", _order_reservation_expiry),
+    Migration(10, "order_expiry_index", _order_expiry_index, transactional=False),
+]
+
+
+def _resolve_database_url(database_url):
+    # Flask-SQLAlchemy puts relative SQLite paths in the app's instance folder; so must we
+    url = make_url(database_url)
+    if not url.drivername.startswith("sqlite") or url.database in (None, "", ":memory:"):
+        return url
+    if url.database.startswith("file:") or os.path.isabs(url.database):
+        return url
+    instance_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+    os.makedirs(instance_path, exist_ok=True)
+    return url.set(database=os.path.join(instance_path, url.database))
+
+
+"""
+Migrator for the configured database, on an engine of its own so it can run
+before worker processes fork and without importing the app
+"""
+def build_migrator(database_url=DATABASE_URL) -> SchemaMigrator:
+    url = _resolve_database_url(database_url)
+    connect_args = {"timeout": SQLITE_BUSY_TIMEOUT} if url.drivername.startswith("sqlite") else {}
+    return SchemaMigrator(create_engine(url, connect_args=connect_args), MIGRATIONS)
+
+
+"""
+Bring the schema up to date (or verify it) before serving, as SCHEMA_ON_START says
+@param mode "upgrade", "check" or "off"; defaults to the SCHEMA_ON_START setting
+@raises SchemaOutOfDate in check mode when migrations are pending
+"""
+def prepare_schema(mode=None):
+    global _schema_prepared
+    mode = (mode or SCHEMA_ON_START).strip().lower()
+    if mode == "off" or _schema_prepared:
+        return
+    if mode not in ("upgrade", "check"):
+        raise ValueError(f"SCHEMA_ON_START must be upgrade, check or off, not {mode!r}")
+    migrator = build_migrator()
+    try:
+        if mode == "check":
+            migrator.check()
+        else:
+            applied = migrator.upgrade()
+            if applied:
+                logger.info("Schema upgraded to version %s", applied[-1].version)
+    finally:
+        migrator.engine.dispose()
+    _schema_prepared = True
+
+
+"""
+python run.py migrate [upgrade|status|check]
+@returns Process exit status
+"""
+def main(argv) -> int:
+    command = argv[0] if argv else "upgrade"
+    migrator = build_migrator()
+    try:
+        if command == "upgrade":
+            applied = migrator.upgrade()
+            for migration in applied:
+                print(f"Applied {migration.version} {migration.name}")
+            print(f"Schema is at version {migrator.current_version()}")
+            return 0
+        if command == "check":
+            try:
+                migrator.check()
+            except SchemaOutOfDate as e:
+                print(str(e))
+                return 1
+            print(f"Schema is up to date (version {migrator.current_version()})")
+            return 0
+        if command == "status":
+            applied = migrator.applied_versions()
+            for migration in migrator.migrations:
+                state = "applied" if migration.version in applied else "pending"
+                print(f"{migration.version:>4}  {migration.name:<32} {state}")
+            # Models changed without a migration show up here
+            from app import db
+            for missing in migrator.missing_objects(db.metadata):
+                print(f"Not in database: {missing}")
+            return 0
+        print(f"Unknown migrate command: {command} (use upgrade, status or check)")
+        return 2
+    finally:
+        migrator.engine.dispose()
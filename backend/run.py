@@ -1,19 +1,34 @@
-
 """
 Entry point for running the application
+
+    python run.py          Development server (Werkzeug, debugger and reloader)
+    python run.py serve    Production server (Gunicorn, see server.py)
+    python run.py migrate  Apply schema migrations (see migrations.py for status and check)
 """
-from app import app
+import sys
 from config import HOST, PORT
-import logging
+from logging_setup import configure_logging
 
-# Set up more detailed logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Logging levels and format come from the LOG_* settings in config.py
+configure_logging()
 
 if __name__ == "__main__":
-    print(f"Starting server on {HOST}:{PORT}")
-    print(f"Debug mode: {True}")
-    print(f"CORS: Enabled for all origins (debug mode)")
-    app.run(host=HOST, port=PORT, debug=True, threaded=True)
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        from migrations import main
+        sys.exit(main(sys.argv[2:]))
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from server import serve
+        serve()
+    else:
+        # Apply (or verify) schema migrations before serving; serve() does the same in the Gunicorn master
+        from migrations import SchemaOutOfDate, prepare_schema
+        try:
+            prepare_schema()
+        except SchemaOutOfDate as e:
+            sys.exit(f"{e}. Run: python run.py migrate")
+        from app import app
+        print(f"Starting server on {HOST}:{PORT}")
+        print(f"Debug mode: {True}")
+        print(f"CORS: Enabled for all origins (debug mode)")
+        app.run(host=HOST, port=PORT, debug=True, threaded=True)
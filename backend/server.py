@@ -0,0 +1,83 @@
+"""
+Production server: runs the app under Gunicorn with pre-forked, multi-threaded workers
+"""
+import logging
+import sys
+
+from config import (
+    HOST,
+    PORT,
+    WEB_GRACEFUL_TIMEOUT,
+    WEB_MAX_REQUESTS,
+    WEB_THREADS,
+    WEB_TIMEOUT,
+    WEB_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_exit(server, worker):
+    # Deliver queued notifications, stop background work (handing the expiry lease to another
+    # worker) and close pooled connections before the worker goes away
+    from app import app, db, image_store, reservation_expiry
+    from services.telegram_service import get_notification_dispatcher
+    get_notification_dispatcher().stop(timeout=WEB_GRACEFUL_TIMEOUT / 2)
+    image_store.shutdown()
+    reservation_expiry.stop()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+"""
+Gunicorn settings for the production server
+"""
+def build_options(host=HOST, port=PORT) -> dict:
+    return {
+        "bind": f"{host}:{port}",
+        "workers": WEB_WORKERS,
+        "threads": WEB_THREADS,
+        "worker_class": "gthread",
+        "timeout": WEB_TIMEOUT,
+        "graceful_timeout": WEB_GRACEFUL_TIMEOUT,
+        "keepalive": 5,
+        "max_requests": WEB_MAX_REQUESTS,
+        "max_requests_jitter": WEB_MAX_REQUESTS // 10,
+        # Each worker imports the app itself, so engines, pools and threads are created after
+        # fork and nothing needs closing in the master or sharing between workers
+        "preload_app": False,
+        "worker_exit": _worker_exit,
+    }
+
+
+def serve(options=None):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("Gunicorn is required for 'serve' mode (pip install -r requirements.txt); "
+                 "it is not available on Windows, use 'python run.py' there instead.")
+
+    class StoreApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            return app
+
+    # Migrations run here in the master, once, before any worker is forked
+    from migrations import SchemaOutOfDate, prepare_schema
+    try:
+        prepare_schema()
+    except SchemaOutOfDate as e:
+        sys.exit(f"{e}. Run: python run.py migrate")
+
+    options = options or build_options()
+    logger.info("Starting %d workers x %d threads on %s", options["workers"], options["threads"], options["bind"])
+    StoreApplication(options).run()
@@ -0,0 +1,133 @@
+"""
+CatalogCache - In-process cache of pre-serialized catalog responses with write-through invalidation
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Key prefixes: one entry per listing or facet query string, one per stock item
+LIST_PREFIX = "list:"
+FACET_PREFIX = "facets:"
+ITEM_PREFIX = "item:"
+# Entries computed over many items, dropped by any item write
+AGGREGATE_PREFIXES = (LIST_PREFIX, FACET_PREFIX)
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "headers", "expires_at", "built_at")
+
+    def __init__(self, body: bytes, headers: dict, expires_at: float):
+        self.body = body
+        self.headers = headers
+        self.expires_at = expires_at
+        self.etag = hashlib.sha1(body).hexdigest()
+        # Sent as Last-Modified; the entry is dropped by any write after this
+        self.built_at = datetime.now(timezone.utc)
+
+
+"""
+Cache key for a single stock item
+"""
+def item_key(item_id) -> str:
+    return f"{ITEM_PREFIX}{item_id}"
+
+
+"""
+Cache key for a listing, independent of query parameter order
+@param args The request query arguments
+"""
+def listing_key(args) -> str:
+    return LIST_PREFIX + _query_string(args)
+
+
+"""
+Cache key for the facet counts of a filter set
+@param args The request query arguments
+"""
+def facets_key(args) -> str:
+    return FACET_PREFIX + _query_string(args)
+
+
+def _query_string(args) -> str:
+    return "&".join(f"{key}={value}" for key, value in sorted(args.items(multi=True)))
+
+
+class CatalogCache:
+    """
+    LRU cache of serialized JSON bodies with a TTL and a maximum entry count.
+
+    Writers call invalidate_items() / invalidate_all() after committing. Each
+    invalidation bumps a generation counter; a response built from data read
+    before the bump is not stored (see put()), so a slow reader cannot put a
+    stale listing back after a write.
+
+    The cache lives in one process. Other worker processes only see a write
+    once their own entries expire, so ttl bounds cross-process staleness.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+
+    """
+    Store a serialized body
+    @param generation The generation observed before the data was read
+    @returns The new entry (also returned when it was too stale to store)
+    """
+    def put(self, key, body: bytes, headers=None, generation=None) -> CacheEntry:
+        entry = CacheEntry(body, headers or {}, self.clock() + self.ttl)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return entry
+
+    """
+    Drop the given items and every listing and facet entry, which may include them
+    """
+    def invalidate_items(self, item_ids):
+        with self._lock:
+            self._generation += 1
+            self.stats["invalidations"] += 1
+            for item_id in item_ids:
+                self._entries.pop(item_key(item_id), None)
+            for key in [key for key in self._entries if key.startswith(AGGREGATE_PREFIXES)]:
+                del self._entries[key]
+
+    def invalidate_all(self):
+        with self._lock:
+            self._generation += 1
+            self.stats["invalidations"] += 1
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), generation=self._generation)
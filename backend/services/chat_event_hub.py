@@ -0,0 +1,114 @@
+"""
+ChatEventHub - In-process publish/subscribe hub for pushing new chat messages to waiting clients
+"""
+
+import logging
+import queue
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Topic that receives every chat message, used by the admin conversation list
+ADMIN_TOPIC = "admin"
+
+
+"""
+Topic name for a single conversation
+"""
+def conversation_topic(conversation_id: str) -> str:
+    return f"conversation:{conversation_id}"
+
+
+class Subscription:
+    """A subscriber's inbox; events that do not fit in the buffer are dropped."""
+
+    def __init__(self, hub, topics, max_size):
+        self.hub = hub
+        self.topics = topics
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=max_size)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    """
+    Wait for the next event
+    @returns The event, or None if nothing arrived within the timeout
+    """
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self) -> list:
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ChatEventHub:
+    """
+    Fans published events out to the subscribers of a topic.
+
+    The hub only lives in the current process: when several worker processes
+    serve the app, a subscriber is only woken by messages written by its own
+    worker. Callers treat an event as a wake-up and read new messages with a
+    since_id query, which they also repeat while waiting to pick up the rest.
+    """
+
+    def __init__(self, max_buffered_events=100):
+        self.max_buffered_events = max_buffered_events
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, *topics) -> Subscription:
+        subscription = Subscription(self, topics, self.max_buffered_events)
+        with self._lock:
+            for topic in topics:
+                self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic, event) -> int:
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+        return len(subscribers)
+
+    """
+    Publish a serialized chat message to its conversation and to the admin topic
+    """
+    def publish_message(self, message: dict):
+        self.publish(conversation_topic(message['conversation_id']), message)
+        self.publish(ADMIN_TOPIC, message)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
@@ -0,0 +1,87 @@
+"""
+ChatSummaryService - Builds the admin conversation list in a single windowed query
+"""
+
+from sqlalchemy import case, func, select
+
+
+"""
+Build the conversation summary query
+@param model The ChatMessage model class
+@param since Only include conversations with a message newer than this datetime
+"""
+def build_conversation_summary_query(model, since=None):
+    partition = model.conversation_id
+    from_user = case((model.is_admin_reply == False, 1), else_=0)
+    unread_from_user = case(
+        ((model.is_admin_reply == False) & (model.is_read == False), 1),
+        else_=0,
+    )
+    # Non-admin messages sort first, so this picks the first message the user sent
+    first_user_order = (model.is_admin_reply, model.created_at, model.id)
+
+    ranked = select(
+        model.conversation_id,
+        model.message.label("latest_message"),
+        model.created_at.label("latest_message_time"),
+        model.is_admin_reply.label("is_latest_from_admin"),
+        func.row_number().over(
+            partition_by=partition, order_by=(model.created_at.desc(), model.id.desc())
+        ).label("latest_rank"),
+        func.sum(unread_from_user).over(partition_by=partition).label("unread_count"),
+        func.max(from_user).over(partition_by=partition).label("has_user_message"),
+        func.first_value(model.username).over(
+            partition_by=partition, order_by=first_user_order
+        ).label("username"),
+        func.first_value(model.email).over(
+            partition_by=partition, order_by=first_user_order
+        ).label("email"),
+    ).subquery()
+
+    query = select(
+        ranked.c.conversation_id,
+        ranked.c.username,
+        ranked.c.email,
+        ranked.c.latest_message,
+        ranked.c.latest_message_time,
+        ranked.c.unread_count,
+        ranked.c.is_latest_from_admin,
+    ).where(ranked.c.latest_rank == 1, ranked.c.has_user_message == 1)
+
+    if since is not None:
+        query = query.where(ranked.c.latest_message_time > since)
+
+    return query
+
+
+"""
+Load one page of conversation summaries, most recently active first
+@param session The SQLAlchemy session
+@param model The ChatMessage model class
+@returns A tuple of (summaries, total) where total is None unless a limit was given
+"""
+def load_conversation_summaries(session, model, since=None, limit=None, offset=0):
+    query = build_conversation_summary_query(model, since)
+
+    total = None
+    if limit is not None:
+        total = session.execute(select(func.count()).select_from(query.subquery())).scalar()
+
+    query = query.order_by(query.selected_columns.latest_message_time.desc(),
+                           query.selected_columns.conversation_id)
+    if limit is not None:
+        query = query.limit(limit).offset(offset)
+
+    summaries = []
+    for row in session.execute(query):
+        summaries.append({
+            'conversation_id': row.conversation_id,
+            'username': row.username,
+            'email': row.email,
+            'latest_message': row.latest_message,
+            'latest_message_time': row.latest_message_time.isoformat() if row.latest_message_time else None,
+            'unread_count': int(row.unread_count or 0),
+            'is_latest_from_admin': bool(row.is_latest_from_admin)
+        })
+
+    return summaries, total
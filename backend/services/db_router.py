@@ -0,0 +1,149 @@
+"""
+DbRouter - Sends read-only requests to replica databases and everything else to the primary
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+# Bind key prefix of the replica engines in SQLALCHEMY_BINDS
+REPLICA_BIND_PREFIX = "replica_"
+# Set on a client after it writes; its reads use the primary until the cookie expires
+READ_PRIMARY_COOKIE = "db_read_primary"
+# Sent with the same lifetime in seconds to clients that do not send cookies
+# (the storefront fetches with credentials: 'omit'); they echo it on their
+# reads until it runs out and those reads use the primary
+READ_PRIMARY_HEADER = "X-DB-Read-Primary"
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+"""
+Parse DATABASE_READ_URLS ("url1,url2") into a list of URLs
+"""
+def parse_read_urls(value) -> list:
+    return [url.strip() for url in (value or "").split(",") if url.strip()]
+
+
+"""
+Mark a view whose reads may be served by a replica; place it below @app.route
+"""
+def replica_reads(view):
+    view.replica_reads = True
+    return view
+
+
+class RoutingSession(Session):
+    """
+    Session that runs the reads of replica-enabled requests on the replica the
+    router picked for the request.
+
+    Everything else uses the primary: flushes, INSERT / UPDATE / DELETE
+    statements, SELECT ... FOR UPDATE, and every statement after the session's
+    first write, so a request reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            replica = g.get("db_replica")
+            if replica is not None and not self.info.get("db_wrote"):
+                if self._flushing or _is_write(clause):
+                    self.info["db_wrote"] = True
+                else:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_write(clause) -> bool:
+    if clause is None:
+        return False
+    if isinstance(clause, UpdateBase):
+        return True
+    # Row locks only exist on the primary; raw text may write anything
+    return getattr(clause, "_for_update_arg", None) is not None or not hasattr(clause, "selected_columns")
+
+
+class DbRouter:
+    """
+    Chooses the engine for each request.
+
+    Views marked with @replica_reads run their reads on a replica picked at
+    random per request; all other views use the primary only. To read your own
+    writes despite replication lag:
+
+    - a request's statements after its first write use the primary (see
+      RoutingSession)
+    - after a successful write request the client gets a cookie and a
+      READ_PRIMARY_HEADER response header; for read_after_write seconds its
+      reads carrying either one use the primary, whichever worker process
+      serves them
+    - for the same time after any write in this process, all of its reads use
+      the primary, so caches filled right after a write are not filled from a
+      replica that is behind
+    - primary() forces the primary, e.g. to re-check a lookup the replica
+      answered with "not found"
+
+    With no replicas configured every request uses the primary and nothing
+    else changes.
+    """
+
+    def __init__(self, db, read_after_write=5.0, clock=time.monotonic):
+        self.db = db
+        self.read_after_write = read_after_write
+        self.clock = clock
+        self._primary_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"replica_requests": 0, "primary_requests": 0, "primary_fallbacks": 0}
+
+    def install(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def replicas(self) -> list:
+        return [engine for key, engine in self.db.engines.items()
+                if key is not None and key.startswith(REPLICA_BIND_PREFIX)]
+
+    """
+    Run the enclosed statements on the primary, e.g. a lookup the replica did not find
+    """
+    @contextmanager
+    def primary(self):
+        replica = g.pop("db_replica", None)
+        if replica is not None:
+            self.db.session.close()
+            with self._lock:
+                self.stats["primary_fallbacks"] += 1
+        try:
+            yield
+        finally:
+            if replica is not None:
+                g.db_replica = replica
+
+    def using_replica(self) -> bool:
+        return has_request_context() and g.get("db_replica") is not None
+
+    def _before_request(self):
+        view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+        replicas = self.replicas() if getattr(view, "replica_reads", False) else []
+        use_replica = (replicas and request.method not in WRITE_METHODS
+                       and not request.cookies.get(READ_PRIMARY_COOKIE)
+                       and not request.headers.get(READ_PRIMARY_HEADER)
+                       and self.clock() >= self._primary_until)
+        if use_replica:
+            g.db_replica = random.choice(replicas)
+        with self._lock:
+            self.stats["replica_requests" if use_replica else "primary_requests"] += 1
+
+    def _after_request(self, response):
+        if request.method in WRITE_METHODS and response.status_code < 400 and self.replicas():
+            with self._lock:
+                self._primary_until = self.clock() + self.read_after_write
+            seconds = max(int(self.read_after_write), 1)
+            response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=seconds, httponly=True, samesite="Lax")
+            response.headers[READ_PRIMARY_HEADER] = str(seconds)
+        return response
@@ -0,0 +1,307 @@
+"""
+ImageStore - Content-addressed image storage with resized variants rendered in a process pool
+"""
+
+import hashlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Bytes read or written per step while streaming an upload
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the accepted formats; the client's Content-Type is not trusted
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+# Output formats of the variants, by file extension
+VARIANT_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+class ImageUploadError(ValueError):
+    """Raised when an upload is not an accepted image or is too large."""
+
+
+"""
+Detect the image type from the first bytes of a file
+@returns The media type, or None when the data is not a JPEG, PNG, GIF or WebP image
+"""
+def sniff_image_type(head: bytes):
+    for signature, media_type in _SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+"""
+Parse IMAGE_VARIANT_SIZES ("thumb:200,medium:600") into {name: longest side in pixels}
+"""
+def parse_variant_sizes(value) -> dict:
+    sizes = {}
+    for part in (value or "").split(","):
+        if not part.strip():
+            continue
+        name, _, pixels = part.partition(":")
+        if not name.strip().isalnum() or not pixels.strip().isdigit():
+            raise ValueError(f"Invalid image variant: {part!r}")
+        sizes[name.strip()] = int(pixels)
+    return sizes
+
+
+class _HashingWriter:
+    """
+    File-like target for an upload stream: writes to a temporary file in the
+    store and hashes the bytes on the way, enforcing the size limit
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.head = b""
+        self._hash = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix="upload-", delete=False)
+        self.path = self._file.name
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise ImageUploadError(f"Image is larger than {self.max_bytes} bytes")
+        if len(self.head) < 16:
+            self.head += data[:16 - len(self.head)]
+        self._hash.update(data)
+        self._file.write(data)
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        # The form parser rewinds finished files; the bytes are already on disk
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def close(self):
+        self._file.close()
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _render_variants(source, targets):
+    # Runs in a pool process; Pillow is imported there only
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image.seek(0)
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        for path, longest_side, image_format in targets:
+            resized = image.copy()
+            resized.thumbnail((longest_side, longest_side), Image.LANCZOS)
+            if image_format == "jpeg" and has_alpha:
+                # JPEG has no alpha channel; put transparent areas on white
+                flattened = Image.new("RGB", resized.size, (255, 255, 255))
+                flattened.paste(resized, mask=resized.getchannel("A"))
+                resized = flattened
+            temporary = f"{path}.{os.getpid()}.tmp"
+            if image_format == "webp":
+                resized.save(temporary, "WEBP", quality=80, method=4)
+            else:
+                resized.save(temporary, "JPEG", quality=82, optimize=True, progressive=True)
+            os.replace(temporary, path)
+    return [path for path, _, _ in targets]
+
+
+class ImageStore:
+    """
+    Stores uploaded images on disk under the SHA-256 of their content.
+
+    Uploads are streamed in CHUNK_SIZE pieces into a temporary file in the
+    store (multipart bodies through stream_factory(), raw bodies through
+    save_stream()), hashed as they arrive and then renamed into place, so a
+    file is never held in memory and identical uploads share one file.
+
+    After an upload, the resized variants (each size in VARIANT_FORMATS) are
+    rendered by a process pool, never on the request thread; the pool is
+    created on first use so every worker process gets its own after forking,
+    and uses spawned processes so it does not inherit the worker's threads.
+    Variants need Pillow; without it only originals are stored and served.
+    """
+
+    def __init__(self, root, max_bytes=10 * 1024 * 1024, variant_sizes=None, workers=2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.variant_sizes = dict(variant_sizes or {})
+        self.workers = workers
+        self.variants_enabled = bool(self.variant_sizes) and importlib.util.find_spec("PIL") is not None
+        self._executor = None
+        self._executor_pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.stats = {"uploads": 0, "deduplicated": 0, "variants_rendered": 0, "variant_failures": 0}
+        for directory in ("originals", "variants", "tmp"):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    def original_path(self, digest) -> str:
+        return os.path.join(self.root, "originals", digest[:2], digest)
+
+    def variant_path(self, digest, name, image_format) -> str:
+        return os.path.join(self.root, "variants", digest[:2], digest, f"{name}.{image_format}")
+
+    def has_original(self, digest) -> bool:
+        return os.path.isfile(self.original_path(digest))
+
+    """
+    Stream factory for werkzeug's form parser: file parts are written straight into the store
+    """
+    def stream_factory(self, total_content_length=None, content_type=None, filename=None, content_length=None):
+        return _HashingWriter(os.path.join(self.root, "tmp"), self.max_bytes)
+
+    """
+    Store an image read from a binary stream, e.g. a raw request body
+    @returns See finish()
+    """
+    def save_stream(self, stream) -> dict:
+        writer = self.stream_factory()
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        except BaseException:
+            writer.discard()
+            raise
+        return self.finish(writer)
+
+    """
+    Move a completed upload into place and schedule its variants
+    @param writer A file returned by stream_factory() / save_stream()
+    @returns {"hash", "content_type", "size", "deduplicated"}
+    @raises ImageUploadError when the data is not a supported image
+    """
+    def finish(self, writer) -> dict:
+        writer.close()
+        content_type = sniff_image_type(writer.head)
+        if content_type is None:
+            writer.discard()
+            raise ImageUploadError("Unsupported image format; use JPEG, PNG, GIF or WebP")
+
+        digest = writer.hexdigest()
+        target = self.original_path(digest)
+        deduplicated = os.path.isfile(target)
+        if deduplicated:
+            writer.discard()
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(writer.path, target)
+        with self._lock:
+            self.stats["uploads"] += 1
+            self.stats["deduplicated"] += deduplicated
+        self.schedule_variants(digest)
+        return {"hash": digest, "content_type": content_type, "size": writer.size, "deduplicated": deduplicated}
+
+    """
+    Render missing variants of a stored original in the background
+    @returns True when rendering was scheduled
+    """
+    def schedule_variants(self, digest) -> bool:
+        if not self.variants_enabled:
+            return False
+        targets = [(self.variant_path(digest, name, image_format), size, image_format)
+                   for name, size in self.variant_sizes.items() for image_format in VARIANT_FORMATS]
+        targets = [target for target in targets if not os.path.isfile(target[0])]
+        if not targets:
+            return False
+        with self._lock:
+            if digest in self._pending:
+                return False
+            self._pending.add(digest)
+        os.makedirs(os.path.dirname(targets[0][0]), exist_ok=True)
+        try:
+            try:
+                future = self._pool().submit(_render_variants, self.original_path(digest), targets)
+            except BrokenProcessPool:
+                # A pool process died (e.g. killed for memory); start a new pool once
+                self._executor = None
+                future = self._pool().submit(_render_variants, self.original_path(digest), targets)
+        except Exception as e:
+            # The original is stored either way; variants are retried on the next request for them
+            with self._lock:
+                self._pending.discard(digest)
+            logger.error("Could not schedule variants of image %s: %s", digest, e)
+            return False
+        future.add_done_callback(lambda done: self._variants_done(digest, done))
+        return True
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    """
+    Find the file to serve for a variant
+    @returns (path, media type, final) where final is False when the variant is
+             not rendered (yet) and the original is returned instead, or None
+             when the image does not exist
+    """
+    def resolve(self, digest, name=None, image_format=None):
+        original = self.original_path(digest)
+        if not os.path.isfile(original):
+            return None
+        if name is not None:
+            variant = self.variant_path(digest, name, image_format)
+            if os.path.isfile(variant):
+                return variant, VARIANT_FORMATS[image_format], True
+            self.schedule_variants(digest)
+        with open(original, "rb") as file:
+            media_type = sniff_image_type(file.read(16))
+        return original, media_type, name is None
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _variants_done(self, digest, future):
+        with self._lock:
+            self._pending.discard(digest)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            with self._lock:
+                self.stats["variant_failures"] += 1
+            logger.error("Rendering variants of image %s failed: %s", digest, error)
+            return
+        with self._lock:
+            self.stats["variants_rendered"] += len(future.result())
@@ -0,0 +1,310 @@
+"""
+NotificationDispatcher - Background delivery of notifications with batching, retry and backpressure
+"""
+
+import glob
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# What to do with a new message when the queue is full
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "spill")
+
+# Separator placed between messages that are coalesced into one digest
+DIGEST_SEPARATOR = "\n──────────\n"
+
+# Room left in a digest for its "<b>N notifications</b>" header
+DIGEST_HEADER_RESERVE = 40
+
+# Appended to a message cut to fit max_message_length
+TRUNCATION_MARK = "…"
+
+# An HTML tag or character entity, which must not be cut in half
+_HTML_TOKEN = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>|&#?\w+;")
+
+
+"""
+Shorten a Telegram HTML message without cutting a tag or entity in half
+Tags still open at the cut are closed, so the result stays valid markup.
+@param text The message
+@param limit Maximum length of the result, closing tags included
+"""
+def truncate_html(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    budget = limit - len(TRUNCATION_MARK)
+    open_tags = []
+    end = 0
+    for match in _HTML_TOKEN.finditer(text):
+        # Text up to the next token can be cut anywhere, leaving room to close the open tags
+        room = budget - _closing_length(open_tags)
+        if match.start() > room:
+            break
+        tags = list(open_tags)
+        name = (match.group(2) or "").lower()
+        if name and not match.group(1):
+            tags.append(name)
+        elif name in tags:
+            del tags[len(tags) - 1 - tags[::-1].index(name)]
+        if match.end() + _closing_length(tags) > budget:
+            room = match.start()
+            break
+        open_tags = tags
+        end = match.end()
+    else:
+        room = budget - _closing_length(open_tags)
+    end = max(end, room)
+    return text[:end] + TRUNCATION_MARK + "".join(f"</{name}>" for name in reversed(open_tags))
+
+
+def _closing_length(tags) -> int:
+    return sum(len(name) + 3 for name in tags)
+
+
+class TransportError(Exception):
+    """
+    Raised by a transport when a message could not be delivered.
+
+    retry_after is the delay in seconds requested by the remote side (e.g. a
+    Telegram 429 response); retryable is False for errors that will never
+    succeed, such as a rejected message body.
+    """
+
+    def __init__(self, message, retry_after=None, retryable=True):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+class NotificationDispatcher:
+    """
+    Delivers messages through a transport on a single background thread.
+
+    Messages are queued without blocking the caller. While the dispatcher waits
+    for the rate limit (min_interval between sends), newer messages accumulate
+    and are coalesced into one digest of at most max_message_length characters.
+    Failed sends are retried with exponential backoff and jitter.
+
+    With the spill policy, each process appends its overflow to its own file
+    (spill_path with the pid inserted before the extension), so worker
+    processes never write to the same file. A file is read only after
+    renaming it away, so appends made meanwhile start a new file. On start,
+    the dispatcher also takes over the files of processes that no longer run.
+    """
+
+    def __init__(self, transport, max_queue_size=1000, overflow_policy="drop_oldest",
+                 min_interval=1.0, max_message_length=4096, max_retries=5,
+                 backoff_base=0.5, backoff_max=30.0, spill_path=None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        if overflow_policy == "spill" and not spill_path:
+            raise ValueError("The spill overflow policy requires a spill_path")
+
+        self.transport = transport
+        self.overflow_policy = overflow_policy
+        self.min_interval = min_interval
+        self.max_message_length = max_message_length
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.spill_path = spill_path
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._next_send_at = 0.0
+
+        self.stats = {"queued": 0, "sent": 0, "batches": 0, "dropped": 0,
+                      "spilled": 0, "retries": 0, "failed": 0}
+
+    def start(self):
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+            self._thread.start()
+
+    """
+    Stop the worker, delivering whatever is still queued within the timeout
+    """
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    """
+    Queue a message for delivery without blocking
+    @returns False if the message was dropped because the queue is full
+    """
+    def submit(self, message: str) -> bool:
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+
+        try:
+            self._queue.put_nowait(message)
+            self.stats["queued"] += 1
+            return True
+        except queue.Full:
+            pass
+
+        if self.overflow_policy == "spill":
+            self._spill(message)
+            return True
+
+        if self.overflow_policy == "drop_oldest":
+            try:
+                self._queue.get_nowait()
+                self.stats["dropped"] += 1
+                self._queue.put_nowait(message)
+                self.stats["queued"] += 1
+                return True
+            except (queue.Empty, queue.Full):
+                pass
+
+        self.stats["dropped"] += 1
+        logger.warning("Notification queue is full, dropping message")
+        return False
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def spill_file(self, pid=None) -> str:
+        root, extension = os.path.splitext(self.spill_path)
+        return f"{root}.{pid or os.getpid()}{extension}"
+
+    def _spill(self, message):
+        with self._spill_lock:
+            with open(self.spill_file(), "a", encoding="utf-8") as spill_file:
+                spill_file.write(json.dumps(message) + "\n")
+        self.stats["spilled"] += 1
+
+    def _orphaned_spill_files(self) -> list:
+        root, extension = os.path.splitext(self.spill_path)
+        # The unsuffixed file is where all processes spilled before files were per process
+        orphans = [self.spill_path]
+        for path in glob.glob(f"{glob.escape(root)}.*{glob.escape(extension)}"):
+            pid = path[len(root) + 1:len(path) - len(extension)]
+            if pid.isdigit() and int(pid) != os.getpid() and not _process_running(int(pid)):
+                orphans.append(path)
+        return orphans
+
+    def _drain_spill(self, adopt=False) -> list:
+        if not self.spill_path:
+            return []
+        paths = [self.spill_file()] + (self._orphaned_spill_files() if adopt else [])
+        messages = []
+        with self._spill_lock:
+            for path in paths:
+                # Renaming is atomic: a file is claimed by exactly one process, and
+                # nothing is appended to it once it has been claimed
+                claimed = f"{path}.{os.getpid()}.draining"
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue
+                with open(claimed, "r", encoding="utf-8") as spill_file:
+                    messages.extend(json.loads(line) for line in spill_file if line.strip())
+                os.remove(claimed)
+        return messages
+
+    def _drain_queue(self) -> list:
+        messages = []
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _run(self):
+        backlog = self._drain_spill(adopt=True)
+        while True:
+            if not backlog:
+                try:
+                    backlog = [self._queue.get(timeout=0.2)]
+                except queue.Empty:
+                    backlog = self._drain_spill()
+                    if not backlog:
+                        if self._stop.is_set():
+                            return
+                        continue
+
+            # Wait out the rate limit; anything queued meanwhile joins the digest
+            delay = self._next_send_at - time.monotonic()
+            if delay > 0 and not self._stop.is_set():
+                self._stop.wait(delay)
+            backlog.extend(self._drain_queue())
+            backlog.extend(self._drain_spill())
+
+            digest, backlog = self._build_digest(backlog)
+            self._deliver(digest)
+            self._next_send_at = time.monotonic() + self.min_interval
+
+    def _build_digest(self, messages):
+        """Take as many messages as fit into one send; return (text, remaining)."""
+        parts = []
+        length = 0
+        budget = self.max_message_length - DIGEST_HEADER_RESERVE
+        for index, message in enumerate(messages):
+            part = truncate_html(message, self.max_message_length)
+            added = len(part) + (len(DIGEST_SEPARATOR) if parts else 0)
+            if parts and length + added > budget:
+                return self._join(parts), messages[index:]
+            parts.append(part)
+            length += added
+        return self._join(parts), []
+
+    def _join(self, parts) -> str:
+        if len(parts) > 1:
+            self.stats["batches"] += 1
+            header = f"<b>{len(parts)} notifications</b>\n"
+            return header + DIGEST_SEPARATOR.join(parts)
+        return parts[0]
+
+    def _deliver(self, text):
+        attempt = 0
+        while True:
+            try:
+                self.transport.send(text)
+                self.stats["sent"] += 1
+                return
+            except TransportError as error:
+                retry_after = error.retry_after
+                retryable = error.retryable
+                failure = error
+            except Exception as error:
+                retry_after = None
+                retryable = True
+                failure = error
+
+            attempt += 1
+            if self._stop.is_set() or not retryable or attempt > self.max_retries:
+                self.stats["failed"] += 1
+                logger.error("Giving up on notification after %d attempt(s): %s", attempt, failure)
+                return
+
+            self.stats["retries"] += 1
+            delay = retry_after if retry_after is not None else min(
+                self.backoff_max, self.backoff_base * (2 ** (attempt - 1))
+            ) * random.uniform(0.5, 1.0)
+            logger.warning("Notification delivery failed (%s), retrying in %.2fs", failure, delay)
+            self._stop.wait(delay)
+
+
+def _process_running(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,70 @@
+"""
+OrderAssembler - Loads orders together with their line items, products and payments
+"""
+
+from sqlalchemy.orm import selectinload
+
+
+class OrderAssembler:
+    """
+    Builds the order detail payload returned by the order endpoints.
+
+    Line items (with their stock item joined in) and payments are loaded with
+    selectin loading, so assembling any number of orders costs three queries.
+    """
+
+    def __init__(self, order_model, order_item_model):
+        self.order_model = order_model
+        self.order_item_model = order_item_model
+
+    def _query(self):
+        return self.order_model.query.options(
+            selectinload(self.order_model.items).joinedload(self.order_item_model.stock_item),
+            selectinload(self.order_model.payments),
+        )
+
+    """
+    Load a single order matching the given filter criteria
+    @returns The order detail dict, or None if no order matches
+    """
+    def load_one(self, **filters):
+        order = self._query().filter_by(**filters).first()
+        return self.serialize(order) if order else None
+
+    """
+    Load a batch of orders by id, preserving the order of the given ids
+    """
+    def load_many(self, order_ids) -> list:
+        order_ids = list(order_ids)
+        if not order_ids:
+            return []
+        orders = self._query().filter(self.order_model.id.in_(order_ids)).all()
+        by_id = {order.id: order for order in orders}
+        return [self.serialize(by_id[order_id]) for order_id in order_ids if order_id in by_id]
+
+    """
+    Load every order matching the given filter criteria, oldest first
+    """
+    def load_where(self, **filters) -> list:
+        orders = self._query().filter_by(**filters).order_by(self.order_model.id).all()
+        return [self.serialize(order) for order in orders]
+
+    @staticmethod
+    def serialize(order) -> dict:
+        items = []
+        for item in order.items:
+            items.append({
+                "id": item.id,
+                "stock_item_id": item.stock_item_id,
+                "name": item.stock_item.name if item.stock_item else "Unknown",
+                "quantity": item.quantity,
+                "price": item.price
+            })
+
+        payment = order.payments[0] if order.payments else None
+
+        return {
+            "order": order.to_dict(),
+            "items": items,
+            "payment": payment.to_dict() if payment else None
+        }
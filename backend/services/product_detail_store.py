@@ -0,0 +1,215 @@
+"""
+ProductDetailStore - Compressed product descriptions and specifications, stored apart from the catalog row
+"""
+
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, update
+
+# Fields of a detail document and the type each must have
+DETAIL_FIELDS = {"productDetails": str, "specifications": dict, "warrantyInfo": str}
+
+# Stored encodings of the body column
+IDENTITY = "identity"
+ZLIB = "zlib"
+
+# Ids per IN (...) clause, kept below SQLite's bound parameter limit
+_ID_BATCH_SIZE = 500
+
+
+class ProductDetailError(ValueError):
+    """Raised when a detail document has unknown fields, wrong types or is too large."""
+
+
+"""
+Serialize a detail document for the body column
+@param details A validated detail document
+@param min_compress_size Bodies shorter than this are stored as plain JSON
+@returns (encoding, bytes)
+"""
+def encode_details(details, min_compress_size=256):
+    raw = json.dumps(details, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(raw) >= min_compress_size:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            return ZLIB, compressed
+    return IDENTITY, raw
+
+
+def decode_details(encoding, body) -> dict:
+    raw = zlib.decompress(body) if encoding == ZLIB else body
+    return json.loads(raw)
+
+
+"""
+Check a detail update and merge it into the stored document
+@param current The stored document ({} when there is none)
+@param changes Fields to set; a field set to None or "" is removed
+@returns The new document
+@raises ProductDetailError
+"""
+def merge_details(current, changes, max_bytes=64 * 1024) -> dict:
+    if not isinstance(changes, dict):
+        raise ProductDetailError("Details must be an object")
+    unknown = set(changes) - set(DETAIL_FIELDS)
+    if unknown:
+        raise ProductDetailError(f"Unknown detail fields: {', '.join(sorted(unknown))}")
+
+    merged = dict(current)
+    for field, value in changes.items():
+        if value is None or value == "":
+            merged.pop(field, None)
+            continue
+        if not isinstance(value, DETAIL_FIELDS[field]):
+            raise ProductDetailError(f"{field} must be a {DETAIL_FIELDS[field].__name__}")
+        if field == "specifications":
+            # Section name -> text, e.g. {"display": "6.1-inch OLED", "battery": "3240 mAh"}
+            value = {name: text for name, text in value.items() if text not in (None, "")}
+            if not all(isinstance(text, str) for text in value.values()):
+                raise ProductDetailError("specifications values must be strings")
+            if not value:
+                merged.pop(field, None)
+                continue
+        merged[field] = value
+
+    size = len(json.dumps(merged, ensure_ascii=False).encode("utf-8"))
+    if size > max_bytes:
+        raise ProductDetailError(f"Details are larger than {max_bytes} bytes")
+    return merged
+
+
+class ProductDetailStore:
+    """
+    Reads and writes the detail table (stock_item_id, encoding, body,
+    updated_at) and keeps decoded documents in a per-process LRU.
+
+    The catalog listing never touches this table; product pages fetch one
+    document, and pages showing several products fetch them all with
+    load_many() in one query per 500 ids. Documents are cached for ttl seconds
+    (absent documents too, so items without details cost no query either).
+
+    Writers call invalidate() after committing. As in CatalogCache, a document
+    read before an invalidation is not cached, and other worker processes see
+    a change once their entry expires.
+    """
+
+    def __init__(self, table, ttl=300.0, max_entries=2048, min_compress_size=256, clock=time.monotonic):
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.min_compress_size = min_compress_size
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes_stored": 0, "bytes_raw": 0}
+
+    """
+    Load the documents of many items
+    @param session A SQLAlchemy session
+    @param item_ids Stock item ids
+    @returns {item_id: (document, updated_at)} for the items that have details
+    """
+    def load_many(self, session, item_ids) -> dict:
+        item_ids = list(dict.fromkeys(item_ids))
+        found = {}
+        missing = []
+        now = self.clock()
+        with self._lock:
+            generation = self._generation
+            for item_id in item_ids:
+                entry = self._entries.get(item_id)
+                if entry is None or entry[0] <= now:
+                    missing.append(item_id)
+                    continue
+                self._entries.move_to_end(item_id)
+                if entry[1] is not None:
+                    found[item_id] = entry[1]
+            self.stats["hits"] += len(item_ids) - len(missing)
+            self.stats["misses"] += len(missing)
+
+        loaded = {}
+        columns = (self.table.c.stock_item_id, self.table.c.encoding, self.table.c.body, self.table.c.updated_at)
+        for start in range(0, len(missing), _ID_BATCH_SIZE):
+            chunk = missing[start:start + _ID_BATCH_SIZE]
+            rows = session.execute(select(*columns).where(self.table.c.stock_item_id.in_(chunk)))
+            for item_id, encoding, body, updated_at in rows:
+                loaded[item_id] = (decode_details(encoding, body), updated_at)
+        found.update(loaded)
+
+        with self._lock:
+            if generation == self._generation:
+                expires_at = self.clock() + self.ttl
+                for item_id in missing:
+                    self._entries[item_id] = (expires_at, loaded.get(item_id))
+                    self._entries.move_to_end(item_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+        return found
+
+    """
+    Load the document of one item
+    @returns (document, updated_at), or None when the item has no details
+    """
+    def load(self, session, item_id):
+        return self.load_many(session, [item_id]).get(item_id)
+
+    """
+    Apply a detail update in the session's transaction; the caller commits and then calls invalidate()
+    @param changes See merge_details()
+    @returns The new document
+    @raises ProductDetailError
+    """
+    def save(self, session, item_id, changes, max_bytes=64 * 1024) -> dict:
+        columns = (self.table.c.encoding, self.table.c.body)
+        # FOR UPDATE: two concurrent partial updates must not drop each other's fields
+        stored = session.execute(
+            select(*columns).where(self.table.c.stock_item_id == item_id).with_for_update()
+        ).first()
+        current = decode_details(*stored) if stored else {}
+        document = merge_details(current, changes, max_bytes)
+
+        if not document:
+            session.execute(delete(self.table).where(self.table.c.stock_item_id == item_id))
+            return document
+        encoding, body = encode_details(document, self.min_compress_size)
+        values = {"encoding": encoding, "body": body, "updated_at": datetime.utcnow()}
+        if stored:
+            session.execute(update(self.table).where(self.table.c.stock_item_id == item_id).values(**values))
+        else:
+            session.execute(insert(self.table).values(stock_item_id=item_id, **values))
+        with self._lock:
+            self.stats["bytes_stored"] += len(body)
+            self.stats["bytes_raw"] += len(json.dumps(document, ensure_ascii=False).encode("utf-8"))
+        return document
+
+    """
+    Delete the documents of removed items in the session's transaction
+    """
+    def delete_items(self, session, item_ids):
+        item_ids = list(item_ids)
+        for start in range(0, len(item_ids), _ID_BATCH_SIZE):
+            chunk = item_ids[start:start + _ID_BATCH_SIZE]
+            session.execute(delete(self.table).where(self.table.c.stock_item_id.in_(chunk)))
+
+    def invalidate(self, item_ids):
+        with self._lock:
+            self._generation += 1
+            for item_id in item_ids:
+                self._entries.pop(item_id, None)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries))
+
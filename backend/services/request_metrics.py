@@ -0,0 +1,215 @@
+"""
+RequestMetrics - Per-endpoint latency, SQL and response size metrics exposed in Prometheus text format
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+def _labels(**labels) -> str:
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class RequestMetrics:
+    """
+    Collects request metrics for one process.
+
+    install() hooks Flask before/after request handlers and SQLAlchemy cursor
+    events, so every request records its latency, status, response size, SQL
+    statement count and time spent in the database. The response size is the
+    body as sent: the after_request handler runs after every other one, so
+    compressed bodies count compressed, and streamed bodies without a
+    Content-Length are counted as their chunks go out. Requests slower than
+    slow_request_ms are logged together with their query count, which makes
+    N+1 patterns stand out. Gauges registered with add_gauge() (cache sizes,
+    queue depths) are sampled when the metrics are rendered.
+
+    With several worker processes each one reports its own numbers.
+    """
+
+    def __init__(self, slow_request_ms=500):
+        self.slow_request_ms = slow_request_ms
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._queries = {}
+        self._requests = defaultdict(int)
+        self._response_bytes = defaultdict(int)
+        self._db_queries = defaultdict(int)
+        self._db_seconds = defaultdict(float)
+        self._gauges = []
+
+    def install(self, app):
+        app.before_request(self._before_request)
+        # Flask runs after_request handlers in reverse order of registration; first in the
+        # list runs last, after compression and any other change to the body
+        app.after_request_funcs.setdefault(None, []).insert(0, self._after_request)
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+
+    """
+    Register a gauge sampled at render time
+    @param read Callable returning a number, or a dict of {label value: number}
+    @param label Label name used when read returns a dict
+    """
+    def add_gauge(self, name, help_text, read, label=None):
+        self._gauges.append((name, help_text, read, label))
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_seconds = 0.0
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and "metrics_started" in g:
+            conn.info.setdefault("metrics_query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_query_started")
+        if not started or not has_request_context() or "metrics_started" not in g:
+            return
+        g.metrics_queries += 1
+        g.metrics_db_seconds += time.perf_counter() - started.pop()
+
+    def _after_request(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+
+        duration = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        method = request.method
+        queries = g.get("metrics_queries", 0)
+        db_seconds = g.get("metrics_db_seconds", 0.0)
+        key = (endpoint, method)
+        if not response.is_streamed:
+            size = response.calculate_content_length() or 0
+        elif "Content-Length" in response.headers:
+            size = response.content_length or 0
+        else:
+            size = 0
+            response.response = self._count_streamed(response.response, key)
+
+        with self._lock:
+            self._latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self._queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(queries)
+            self._requests[(endpoint, method, response.status_code)] += 1
+            self._response_bytes[key] += size
+            self._db_queries[key] += queries
+            self._db_seconds[key] += db_seconds
+
+        if duration * 1000 >= self.slow_request_ms:
+            logger.warning(
+                "Slow request: %s %s took %.1f ms, %d queries, %.1f ms in database, status %s",
+                method, request.path, duration * 1000, queries, db_seconds * 1000, response.status_code
+            )
+        return response
+
+    def _count_streamed(self, body, key):
+        sent = 0
+        try:
+            for chunk in body:
+                sent += len(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+                yield chunk
+        finally:
+            with self._lock:
+                self._response_bytes[key] += sent
+            close = getattr(body, "close", None)
+            if close is not None:
+                close()
+
+    """
+    Render all metrics in the Prometheus text exposition format
+    """
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            self._render_histograms(lines, "http_request_duration_seconds",
+                                    "Request latency by endpoint", self._latency)
+            self._render_histograms(lines, "db_queries_per_request",
+                                    "SQL statements executed per request", self._queries)
+
+            lines.append("# HELP http_requests_total Requests by endpoint, method and status")
+            lines.append("# TYPE http_requests_total counter")
+            for (endpoint, method, status), value in sorted(self._requests.items()):
+                lines.append(f"http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {value}")
+
+            lines.append("# HELP http_request_errors_total Requests that ended with a 5xx status")
+            lines.append("# TYPE http_request_errors_total counter")
+            errors = defaultdict(int)
+            for (endpoint, method, status), value in self._requests.items():
+                if status >= 500:
+                    errors[(endpoint, method)] += value
+            for (endpoint, method), value in sorted(errors.items()):
+                lines.append(f"http_request_errors_total{_labels(endpoint=endpoint, method=method)} {value}")
+
+            for name, help_text, values in (
+                ("http_response_bytes_total", "Response body bytes sent, after compression", self._response_bytes),
+                ("db_queries_total", "SQL statements executed", self._db_queries),
+                ("db_query_seconds_total", "Time spent executing SQL", self._db_seconds),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for (endpoint, method), value in sorted(values.items()):
+                    lines.append(f"{name}{_labels(endpoint=endpoint, method=method)} {value:g}")
+
+        for name, help_text, read, label in self._gauges:
+            try:
+                value = read()
+            except Exception as error:
+                logger.error("Failed to read metric %s: %s", name, error)
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for label_value, number in sorted(value.items()):
+                    lines.append(f"{name}{_labels(**{label: label_value})} {number:g}")
+            else:
+                lines.append(f"{name} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines, name, help_text, histograms):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for (endpoint, method), histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(endpoint=endpoint, method=method, le=f'{bound:g}')} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(endpoint=endpoint, method=method, le='+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(endpoint=endpoint, method=method)} {histogram.total:g}")
+            lines.append(f"{name}_count{_labels(endpoint=endpoint, method=method)} {histogram.count}")
@@ -0,0 +1,292 @@
+"""
+ReservationExpiry - Releases the stock held by pending orders once their reservation deadline passes
+"""
+
+import heapq
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    MetaData,
+    String,
+    Table,
+    and_,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# Status given to orders whose reservation ran out
+EXPIRED = "expired"
+
+_lease_metadata = MetaData()
+# One row per background job that must run in a single process at a time
+scheduler_lease = Table(
+    "scheduler_lease", _lease_metadata,
+    Column("name", String(50), primary_key=True),
+    Column("owner", String(100), nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+)
+
+
+class ManualClock:
+    """
+    Clock for tests: returns a fixed naive UTC time until advanced.
+
+        clock = ManualClock(datetime(2024, 1, 1))
+        expiry = ReservationExpiry(..., clock=clock)
+        clock.advance(minutes=31)
+        expiry.run_once(engine)
+    """
+
+    def __init__(self, start=None):
+        self.now = start or datetime.utcnow()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **delta):
+        self.now += timedelta(**delta)
+        return self.now
+
+
+class ReservationExpiry:
+    """
+    create_order reserves stock by decrementing it and stores the order's
+    deadline in order.expires_at. Once a pending order's deadline passes,
+    expire_due() marks it expired and puts its quantities back with one
+    set-based UPDATE per batch of orders, in the same transaction as the
+    status change, so stock is released exactly once even if payment
+    confirmation races with it (only orders still pending are expired).
+
+    A single background thread per worker waits on a heap of known deadlines:
+    its own orders are pushed by schedule(), and after every sweep the
+    earliest pending deadline in the database is pushed too, which covers
+    orders taken by other workers and deadlines from before a restart. The
+    thread also wakes every poll_interval seconds.
+
+    Only the worker holding the database lease sweeps; the lease expires
+    lease_ttl seconds after its holder last renewed it, so another worker
+    takes over when the holder dies. Without a thread (tests, scripts),
+    run_once() does one lease-guarded sweep on demand, and clock can be a
+    ManualClock.
+    """
+
+    def __init__(self, order_table, order_item_table, stock_table, batch_size=200,
+                 poll_interval=30.0, lease_ttl=90.0, clock=datetime.utcnow, on_released=None,
+                 record_changes=None, lease_name="reservation_expiry"):
+        self.order_table = order_table
+        self.order_item_table = order_item_table
+        self.stock_table = stock_table
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_ttl = lease_ttl
+        self.clock = clock
+        # Called with the ids of the stock items whose quantity went back up, after commit
+        self.on_released = on_released
+        # Called as record_changes(connection, item_ids) inside each batch's transaction
+        self.record_changes = record_changes
+        self.lease_name = lease_name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._deadlines = []
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._engine = None
+        self._start_lock = threading.Lock()
+        self.stats = {"sweeps": 0, "expired_orders": 0, "released_units": 0, "lease_held": 0, "errors": 0}
+
+    """
+    Start the background thread (once per process)
+    @param engine Engine of the primary database
+    """
+    def start(self, engine):
+        with self._start_lock:
+            if self.running():
+                return
+            self._engine = engine
+            self._stop.clear()
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="reservation-expiry", daemon=True)
+            self._thread.start()
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._engine is not None:
+            try:
+                self.release_lease(self._engine)
+            except Exception as e:
+                logger.warning("Could not release the reservation expiry lease: %s", e)
+
+    """
+    Tell the thread about a new deadline, e.g. right after an order commits
+    """
+    def schedule(self, deadline):
+        if deadline is None:
+            return
+        with self._wakeup:
+            if self._deadlines and self._deadlines[0] == deadline:
+                return
+            heapq.heappush(self._deadlines, deadline)
+            if self._deadlines[0] == deadline:
+                self._wakeup.notify()
+
+    def pending_deadlines(self) -> int:
+        return len(self._deadlines)
+
+    """
+    Acquire or renew the lease
+    @returns True when this instance holds it until now + lease_ttl
+    """
+    def acquire_lease(self, engine) -> bool:
+        now = self.clock()
+        until = now + timedelta(seconds=self.lease_ttl)
+        lease = scheduler_lease
+        try:
+            with engine.begin() as connection:
+                taken = connection.execute(
+                    update(lease)
+                    .where(lease.c.name == self.lease_name,
+                           or_(lease.c.owner == self.owner, lease.c.expires_at < now))
+                    .values(owner=self.owner, expires_at=until)
+                ).rowcount
+                if not taken:
+                    exists = connection.execute(select(lease.c.name).where(lease.c.name == self.lease_name)).first()
+                    if exists:
+                        return False
+                    connection.execute(insert(lease).values(name=self.lease_name, owner=self.owner, expires_at=until))
+        except IntegrityError:
+            # Another process created the row first
+            return False
+        return True
+
+    def release_lease(self, engine):
+        lease = scheduler_lease
+        with engine.begin() as connection:
+            connection.execute(
+                update(lease).where(lease.c.name == self.lease_name, lease.c.owner == self.owner)
+                .values(expires_at=datetime(1970, 1, 1))
+            )
+
+    """
+    One sweep, if this instance holds (or gets) the lease
+    @returns Number of orders expired, or None without the lease
+    """
+    def run_once(self, engine):
+        if not self.acquire_lease(engine):
+            self.stats["lease_held"] = 0
+            return None
+        self.stats["lease_held"] = 1
+        return self.expire_due(engine)
+
+    """
+    Expire every pending order whose deadline has passed, in batches of batch_size orders
+    @returns Number of orders expired
+    """
+    def expire_due(self, engine) -> int:
+        expired = 0
+        while True:
+            orders, item_ids, units = self._expire_batch(engine, self.clock())
+            if not orders:
+                break
+            expired += len(orders)
+            self.stats["expired_orders"] += len(orders)
+            self.stats["released_units"] += units
+            logger.info("Expired %d unpaid orders and released %d units of %d stock items",
+                        len(orders), units, len(item_ids))
+            if self.on_released is not None and item_ids:
+                self.on_released(item_ids)
+            if len(orders) < self.batch_size:
+                break
+        self.stats["sweeps"] += 1
+        return expired
+
+    """
+    Earliest deadline of a pending order in the database, or None
+    """
+    def next_deadline(self, engine):
+        order = self.order_table
+        with engine.connect() as connection:
+            return connection.execute(
+                select(func.min(order.c.expires_at)).where(order.c.status == "pending", order.c.expires_at.isnot(None))
+            ).scalar()
+
+    def _expire_batch(self, engine, now):
+        order = self.order_table
+        order_item = self.order_item_table
+        stock = self.stock_table
+        due = and_(order.c.status == "pending", order.c.expires_at.isnot(None), order.c.expires_at <= now)
+
+        with engine.begin() as connection:
+            candidates = select(order.c.id).where(due).order_by(order.c.expires_at).limit(self.batch_size)
+            if connection.dialect.update_returning:
+                # Only the orders this statement moved out of pending; a concurrent payment wins
+                orders = connection.execute(
+                    update(order).where(order.c.id.in_(candidates.scalar_subquery()), due)
+                    .values(status=EXPIRED).returning(order.c.id)
+                ).scalars().all()
+            else:
+                orders = connection.execute(candidates.with_for_update()).scalars().all()
+                if orders:
+                    connection.execute(update(order).where(order.c.id.in_(orders), due).values(status=EXPIRED))
+            if not orders:
+                return [], [], 0
+
+            released = select(order_item.c.stock_item_id, func.sum(order_item.c.quantity).label("quantity")) \
+                .where(order_item.c.order_id.in_(orders)).group_by(order_item.c.stock_item_id)
+            totals = dict(connection.execute(released).all())
+            # One UPDATE per batch: each item gets back the sum of its lines in the expired orders
+            returned = select(func.sum(order_item.c.quantity)).where(
+                order_item.c.order_id.in_(orders), order_item.c.stock_item_id == stock.c.id
+            ).scalar_subquery()
+            connection.execute(
+                update(stock).where(stock.c.id.in_(list(totals))).values(quantity=stock.c.quantity + returned)
+            )
+            if self.record_changes is not None:
+                self.record_changes(connection, list(totals))
+        return orders, list(totals), sum(totals.values())
+
+    def _run(self):
+        # Renew the lease well before it runs out
+        renew_every = min(self.poll_interval, self.lease_ttl / 3)
+        while not self._stop.is_set():
+            try:
+                if self.run_once(self._engine) is not None:
+                    upcoming = self.next_deadline(self._engine)
+                    if upcoming is not None:
+                        self.schedule(upcoming)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error("Reservation expiry sweep failed: %s", e)
+
+            with self._wakeup:
+                timeout = renew_every
+                if self._deadlines:
+                    timeout = min(timeout, max((self._deadlines[0] - self.clock()).total_seconds(), 0.05))
+                if not self._stop.is_set():
+                    self._wakeup.wait(timeout)
+                # Deadlines reached now are handled by the sweep at the top of the loop
+                now = self.clock()
+                while self._deadlines and self._deadlines[0] <= now:
+                    heapq.heappop(self._deadlines)
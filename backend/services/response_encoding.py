@@ -0,0 +1,158 @@
+"""
+ResponseEncoding - Conditional GET (strong ETags, Last-Modified, 304) and gzip/brotli compression
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import g, request
+from werkzeug.http import remove_entity_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Media types worth compressing; images and archives are compressed already
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "text/")
+
+
+"""
+Set Last-Modified on a response
+@param response The response
+@param when An aware datetime, or None to leave the header out
+@param validator False when the time does not move with every change to the
+       body (e.g. an order's created_at, while its status can still change);
+       the header is then only informational and If-Modified-Since is ignored
+"""
+def set_last_modified(response, when, validator=True):
+    if when is None:
+        return
+    response.last_modified = when
+    if not validator:
+        g.last_modified_advisory = True
+
+
+class ResponseEncoding:
+    """
+    after_request middleware for successful GET and HEAD responses.
+
+    Every buffered response gets Cache-Control: no-cache, so clients
+    revalidate instead of guessing freshness, and every body in a
+    compressible media type (JSON, text) gets a strong ETag: the SHA-1 of the
+    body, unless the route set one. Other media types (images, archives) are
+    not hashed; they keep the route's ETag, if any, and Last-Modified. A
+    request whose If-None-Match names the current ETag, or, without
+    If-None-Match, whose If-Modified-Since is not older than Last-Modified, is
+    answered 304 with no body.
+
+    Bodies of at least min_size bytes in a compressible media type are sent
+    gzip- or brotli-encoded, whichever the client accepts (brotli when the
+    package is installed and preferred equally). Each encoding is its own
+    representation, so its ETag carries a suffix ("<sha1>-gzip"); any of the
+    suffixed tags validates the body they share. Encoded bodies are kept in a
+    small LRU keyed by ETag, so the catalog listing is compressed once per
+    change rather than once per request.
+
+    Streamed responses (SSE, progress imports) and responses that already
+    have a Content-Encoding are left alone.
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5, cache_max_bytes=32 * 1024 * 1024):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_max_bytes = cache_max_bytes
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+        self._lock = threading.Lock()
+        self._encoded = OrderedDict()
+        self._encoded_bytes = 0
+        # Bytes "saved" are body bytes a 304 did not send
+        self.stats = {"not_modified": 0, "not_modified_bytes_saved": 0,
+                      "compressed": 0, "compressed_bytes_in": 0, "compressed_bytes_out": 0}
+
+    def install(self, app):
+        app.after_request(self._after_request)
+
+    def _after_request(self, response):
+        if (request.method not in ("GET", "HEAD") or response.status_code != 200
+                or response.is_streamed or response.direct_passthrough
+                or "Content-Encoding" in response.headers):
+            return response
+
+        body = response.get_data()
+        if "Cache-Control" not in response.headers:
+            response.headers["Cache-Control"] = "no-cache"
+
+        compressible = response.mimetype.startswith(COMPRESSIBLE_TYPES)
+        if compressible:
+            response.vary.add("Accept-Encoding")
+        large = compressible and len(body) >= self.min_size
+        encoding = request.accept_encodings.best_match(self.encodings) if large else None
+
+        etag, _ = response.get_etag()
+        if etag is None and compressible:
+            # Small bodies too: an order or a chat history is a few hundred bytes and still
+            # deserves a 304; only compression is gated on min_size
+            etag = hashlib.sha1(body).hexdigest()
+        if etag is not None:
+            response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+
+        if self._not_modified(response, etag):
+            with self._lock:
+                self.stats["not_modified"] += 1
+                self.stats["not_modified_bytes_saved"] += len(body)
+            response.status_code = 304
+            response.set_data(b"")
+            remove_entity_headers(response.headers)
+            return response
+
+        if encoding:
+            encoded = self._encode(etag, encoding, body)
+            response.set_data(encoded)
+            response.headers["Content-Encoding"] = encoding
+            with self._lock:
+                self.stats["compressed"] += 1
+                self.stats["compressed_bytes_in"] += len(body)
+                self.stats["compressed_bytes_out"] += len(encoded)
+        return response
+
+    def _not_modified(self, response, etag) -> bool:
+        if request.if_none_match:
+            tags = request.if_none_match
+            if etag is None:
+                return tags.star_tag
+            return tags.star_tag or any(tags.contains(tag) for tag in self._representation_tags(etag))
+        if request.if_modified_since and response.last_modified and not g.get("last_modified_advisory"):
+            return response.last_modified.replace(microsecond=0) <= request.if_modified_since
+        return False
+
+    def _representation_tags(self, etag):
+        yield etag
+        for encoding in self.encodings:
+            yield f"{etag}-{encoding}"
+
+    def _encode(self, etag, encoding, body) -> bytes:
+        key = (etag, encoding)
+        with self._lock:
+            encoded = self._encoded.get(key)
+            if encoded is not None:
+                self._encoded.move_to_end(key)
+                return encoded
+
+        if encoding == "br":
+            encoded = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            encoded = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+        if len(encoded) <= self.cache_max_bytes // 8:
+            with self._lock:
+                if key not in self._encoded:
+                    self._encoded[key] = encoded
+                    self._encoded_bytes += len(encoded)
+                while self._encoded_bytes > self.cache_max_bytes:
+                    _, evicted = self._encoded.popitem(last=False)
+                    self._encoded_bytes -= len(evicted)
+        return encoded
@@ -0,0 +1,54 @@
+"""
+RowSerializer - Response dicts built straight from column-selected rows, without loading ORM objects
+"""
+
+from sqlalchemy import DateTime, select
+
+
+class RowSerializer:
+    """
+    Selects a model's response columns and turns the result rows into the
+    dicts its to_dict() builds.
+
+    List endpoints fetch plain row tuples this way: no ORM instances, no
+    identity-map bookkeeping and no instrumented attribute access per field,
+    only one dict(zip()) per row. Datetime columns are returned as ISO 8601
+    strings, as to_dict() returns them. Columns selected after the response
+    columns (e.g. a sort key needed for a cursor) are left out of the dicts.
+    """
+
+    def __init__(self, model, fields):
+        self.fields = tuple(fields)
+        self.columns = tuple(getattr(model, field) for field in self.fields)
+        self._datetime_fields = tuple(
+            field for field, column in zip(self.fields, self.columns) if isinstance(column.type, DateTime)
+        )
+
+    """
+    Build a select() over the response columns
+    @param extra Further columns to select after them
+    """
+    def select(self, *extra):
+        return select(*self.columns, *extra)
+
+    """
+    Restrict an ORM query to the response columns, keeping its filters and ordering
+    @param query A Model.query based query
+    @param extra Further columns to select after them
+    """
+    def restrict(self, query, *extra):
+        return query.with_entities(*self.columns, *extra)
+
+    def dicts(self, rows) -> list:
+        fields = self.fields
+        if not self._datetime_fields:
+            return [dict(zip(fields, row)) for row in rows]
+        result = []
+        for row in rows:
+            item = dict(zip(fields, row))
+            for field in self._datetime_fields:
+                value = item[field]
+                if value is not None:
+                    item[field] = value.isoformat()
+            result.append(item)
+        return result
@@ -0,0 +1,205 @@
+"""
+SchemaMigrator - Versioned, idempotent schema migrations recorded in the database
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger(__name__)
+
+_version_metadata = MetaData()
+# One row per applied migration
+schema_migration = Table(
+    "schema_migration", _version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class SchemaOutOfDate(RuntimeError):
+    """Raised by check() when migrations are pending."""
+
+    def __init__(self, pending):
+        names = ", ".join(f"{migration.version} {migration.name}" for migration in pending)
+        super().__init__(f"Database schema is behind; pending migrations: {names}")
+        self.pending = pending
+
+
+class Migration:
+    """
+    One schema step. upgrade(op) receives a MigrationOps bound to the
+    connection. Steps must be safe to run against a database that already has
+    some of their objects (databases created before migrations existed), which
+    the MigrationOps helpers take care of.
+
+    transactional=False runs the step on an autocommit connection, needed for
+    statements such as CREATE INDEX CONCURRENTLY on PostgreSQL.
+    """
+    __slots__ = ("version", "name", "upgrade", "transactional")
+
+    def __init__(self, version, name, upgrade, transactional=True):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        self.transactional = transactional
+
+
+class MigrationOps:
+    """
+    Additive schema operations that skip objects which already exist.
+
+    Only expanding changes are offered (new tables, nullable columns, indexes)
+    so a migration can run while the previous release is still serving:
+    old code ignores the new objects. Dropping or renaming a column is done in
+    a later release, once no running code reads it.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.dialect = connection.dialect.name
+
+    def _inspector(self):
+        # Fresh per call: earlier operations in the same step change the answers
+        return inspect(self.connection)
+
+    def has_table(self, name) -> bool:
+        return self._inspector().has_table(name)
+
+    def create_table(self, table):
+        if not self.has_table(table.name):
+            table.create(self.connection)
+            logger.info("Created table %s", table.name)
+
+    """
+    Add a column to an existing table
+    @param column A nullable Column (or one with a server default), so existing rows stay valid
+    """
+    def add_column(self, table_name, column):
+        existing = {info["name"] for info in self._inspector().get_columns(table_name)}
+        if column.name in existing:
+            return
+        column_type = column.type.compile(dialect=self.connection.dialect)
+        preparer = self.connection.dialect.identifier_preparer
+        self.connection.exec_driver_sql(
+            f"ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {preparer.quote(column.name)} {column_type}"
+        )
+        logger.info("Added column %s.%s", table_name, column.name)
+
+    """
+    Create an index
+    @param index A sqlalchemy Index bound to a Table
+    @param online Build without blocking writes where the database supports it
+           (PostgreSQL CONCURRENTLY; the step must be transactional=False)
+    """
+    def create_index(self, index, online=False):
+        table_name = index.table.name
+        existing = {info["name"] for info in self._inspector().get_indexes(table_name)}
+        if index.name in existing:
+            return
+        if online and self.dialect == "postgresql":
+            index.dialect_options["postgresql"]["concurrently"] = True
+        # IF NOT EXISTS: another process may be building the same index right now
+        self.connection.execute(CreateIndex(index, if_not_exists=True))
+        logger.info("Created index %s on %s", index.name, table_name)
+
+
+class SchemaMigrator:
+    """
+    Applies migrations in version order and records each one in the
+    schema_migration table in the same transaction as its changes.
+
+    Several processes may start at once: the version row is inserted before
+    the step runs, so a second process blocks on it (or fails on the primary
+    key) until the first commits, then skips the step.
+    """
+
+    def __init__(self, engine, migrations):
+        self.engine = engine
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        versions = [migration.version for migration in self.migrations]
+        if len(versions) != len(set(versions)):
+            raise ValueError("Migration versions must be unique")
+
+    def applied_versions(self) -> set:
+        with self.engine.connect() as connection:
+            if not inspect(connection).has_table(schema_migration.name):
+                return set()
+            return set(connection.execute(select(schema_migration.c.version)).scalars())
+
+    def pending(self) -> list:
+        applied = self.applied_versions()
+        return [migration for migration in self.migrations if migration.version not in applied]
+
+    def current_version(self) -> int:
+        applied = self.applied_versions()
+        return max(applied) if applied else 0
+
+    """
+    Raise SchemaOutOfDate when migrations are pending
+    """
+    def check(self):
+        pending = self.pending()
+        if pending:
+            raise SchemaOutOfDate(pending)
+
+    """
+    Apply pending migrations
+    @param target Highest version to apply; all when None
+    @returns The migrations applied by this call
+    """
+    def upgrade(self, target=None) -> list:
+        with self.engine.begin() as connection:
+            schema_migration.create(connection, checkfirst=True)
+
+        applied = []
+        for migration in self.pending():
+            if target is not None and migration.version > target:
+                break
+            if self._apply(migration):
+                applied.append(migration)
+        return applied
+
+    def _apply(self, migration) -> bool:
+        record = schema_migration.insert().values(
+            version=migration.version, name=migration.name, applied_at=datetime.utcnow()
+        )
+        logger.info("Applying migration %s %s", migration.version, migration.name)
+        try:
+            if migration.transactional:
+                with self.engine.begin() as connection:
+                    connection.execute(record)
+                    migration.upgrade(MigrationOps(connection))
+            else:
+                with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    migration.upgrade(MigrationOps(connection))
+                with self.engine.begin() as connection:
+                    connection.execute(record)
+        except IntegrityError:
+            logger.info("Migration %s was applied by another process", migration.version)
+            return False
+        return True
+
+    """
+    Compare the database with the model metadata
+    @param metadata The application's MetaData
+    @returns Descriptions of tables, columns and indexes the models declare but the database lacks
+    """
+    def missing_objects(self, metadata) -> list:
+        missing = []
+        with self.engine.connect() as connection:
+            inspector = inspect(connection)
+            for table in metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    missing.append(f"table {table.name}")
+                    continue
+                columns = {info["name"] for info in inspector.get_columns(table.name)}
+                missing.extend(f"column {table.name}.{column.name}"
+                               for column in table.columns if column.name not in columns)
+                indexes = {info["name"] for info in inspector.get_indexes(table.name)}
+                missing.extend(f"index {index.name}" for index in table.indexes if index.name not in indexes)
+        return missing
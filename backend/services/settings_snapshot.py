@@ -0,0 +1,71 @@
+"""
+SettingsSnapshot - Versioned in-memory snapshot of rarely changing settings, served as precomputed JSON
+"""
+
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class Snapshot:
+    __slots__ = ("version", "data", "body", "etag", "built_at")
+
+    def __init__(self, version, data, body: bytes):
+        self.version = version
+        self.data = data
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.built_at = datetime.now(timezone.utc)
+
+
+class SettingsSnapshot:
+    """
+    Keeps settings parsed and serialized in memory under a version number.
+
+    load() builds the settings payload from the database and read_version()
+    returns the version stored alongside it, which writers bump in the same
+    transaction as their change. Readers check that version at most every
+    check_interval seconds (one primary-key lookup) and rebuild only when it
+    moved, so every worker process converges on the latest settings. Writers
+    in this process call invalidate() after committing to see their change at once.
+
+    A snapshot is replaced as a whole, so readers never see a partial update.
+    """
+
+    def __init__(self, load, read_version, serialize, check_interval=1.0, clock=time.monotonic):
+        self.load = load
+        self.read_version = read_version
+        self.serialize = serialize
+        self.check_interval = check_interval
+        self.clock = clock
+        self._snapshot = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    """
+    Get the current snapshot, rebuilding it if the stored version changed
+    """
+    def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        now = self.clock()
+        if snapshot is not None and self._checked_at is not None \
+                and now - self._checked_at < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            version = self.read_version()
+            self._checked_at = self.clock()
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._build(version)
+            return self._snapshot
+
+    """
+    Force a version check on the next get(), e.g. right after this process committed a change
+    """
+    def invalidate(self):
+        self._checked_at = None
+
+    def _build(self, version) -> Snapshot:
+        data = self.load()
+        return Snapshot(version, data, self.serialize(data))
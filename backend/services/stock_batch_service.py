@@ -0,0 +1,288 @@
+"""
+StockBatchService - Bulk stock creates, updates, rule-based adjustments and deletes in one transaction
+"""
+
+from sqlalchemy import Integer, Numeric, bindparam, case, cast, delete, func, insert, select, update
+
+from services.stock_import_service import HASHED_FIELDS, stock_content_hash, validate_fields, validate_row
+from services.stock_query_service import apply_stock_filters
+
+# Operations accepted per field in an adjustment's "set"
+NUMERIC_FIELDS = ("price", "quantity")
+ADJUST_OPERATIONS = ("set", "add", "multiply")
+
+# Ids per IN (...) clause, kept below SQLite's bound parameter limit
+_ID_BATCH_SIZE = 500
+
+
+class StockBatchError(Exception):
+    """
+    Raised when a batch cannot be applied; nothing has been written.
+
+    errors holds one entry per offending operation with the section
+    (create, update, adjust, delete), its index, the item id where there is
+    one, a machine-readable reason (invalid, duplicate, not_found, referenced)
+    and a message.
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors[0]["error"] if errors else "Batch rejected")
+        self.errors = errors
+
+
+def _error(section, index, reason, message, item_id=None) -> dict:
+    return {"op": section, "index": index, "id": item_id, "reason": reason, "error": message}
+
+
+def _as_id(value):
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError(f"Invalid item id: {value!r}")
+    return value
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), _ID_BATCH_SIZE):
+        yield ids[start:start + _ID_BATCH_SIZE]
+
+
+def _parse_where(where) -> dict:
+    # Same filter shape as the listing query string, given as JSON
+    if not isinstance(where, dict) or not where:
+        raise ValueError("where must be a non-empty object; use {\"all\": true} to match every item")
+    unknown = set(where) - {"all", "ids", "grade", "location", "min_price", "max_price", "q"}
+    if unknown:
+        raise ValueError(f"Unsupported filter: {', '.join(sorted(unknown))}")
+    if set(where) == {"all"} and where["all"] is not True:
+        raise ValueError("all must be true")
+
+    def as_list(value):
+        return [str(part) for part in (value if isinstance(value, list) else [value])]
+
+    def as_price(key):
+        value = where.get(key)
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{key} must be a number")
+        return float(value)
+
+    return {
+        "ids": [_as_id(item_id) for item_id in as_list(where["ids"])] if "ids" in where else None,
+        "grades": as_list(where["grade"]) if "grade" in where else [],
+        "locations": as_list(where["location"]) if "location" in where else [],
+        "min_price": as_price("min_price"),
+        "max_price": as_price("max_price"),
+        "q": str(where.get("q") or "").strip(),
+    }
+
+
+def _parse_assignments(assignments, stock) -> dict:
+    # {"price": {"multiply": 0.95}, "quantity": {"add": -1}, "location": "Leeds"}
+    if not isinstance(assignments, dict) or not assignments:
+        raise ValueError("set must be a non-empty object")
+    values = {}
+    for field, spec in assignments.items():
+        if field not in HASHED_FIELDS:
+            raise ValueError(f"Unsupported field: {field}")
+        if not isinstance(spec, dict):
+            spec = {"set": spec}
+        if len(spec) != 1 or next(iter(spec)) not in ADJUST_OPERATIONS:
+            raise ValueError(f"{field} takes exactly one of {', '.join(ADJUST_OPERATIONS)}")
+        operation, operand = next(iter(spec.items()))
+        if operation == "set":
+            values[field] = validate_fields({field: operand})[field]
+            continue
+        if field not in NUMERIC_FIELDS:
+            raise ValueError(f"{operation} only applies to {' and '.join(NUMERIC_FIELDS)}")
+        if isinstance(operand, bool) or not isinstance(operand, (int, float)):
+            raise ValueError(f"{field} {operation} needs a number")
+        if field == "quantity" and operand != int(operand):
+            raise ValueError("quantity adjustments must be whole numbers")
+
+        column = stock.c[field]
+        if operation == "add":
+            expression = column + (int(operand) if field == "quantity" else operand)
+        else:
+            expression = column * operand
+            if field == "quantity":
+                expression = cast(func.round(expression), Integer)
+        if field == "price":
+            expression = func.round(cast(expression, Numeric), 2)
+        # Never push a value below zero
+        values[field] = case((expression < 0, 0), else_=expression)
+    return values
+
+
+"""
+Apply a batch of stock changes inside the caller's transaction
+@param session The SQLAlchemy session whose transaction the changes join
+@param stock_table The stock_item table
+@param order_item_table The order_item table, checked before deleting items
+@param max_operations Largest accepted number of create, update and delete entries together
+@param payload Dict with any of:
+    create: [{name, price, quantity, grade, location}]
+    update: [{id, ...fields to change}]
+    adjust: [{where: {grade, location, min_price, max_price, q, ids} or {all: true},
+              set: {field: value | {set|add|multiply: number}}}]
+    delete: [id]
+@returns Per-item results for every section, plus "touched" (ids created or changed)
+         and "removed" (ids deleted) for cache and index maintenance
+@raises StockBatchError listing every operation that cannot be applied
+
+Everything is validated before the first write; the caller must roll back
+when this raises. Sections run in the order create, update, adjust, delete,
+each as a handful of set-based statements: one INSERT for all creates, one
+executemany UPDATE per distinct set of updated fields, one UPDATE per
+adjustment rule and one DELETE per id chunk. The INSERT uses RETURNING, so
+SQLite must be 3.35 or newer.
+"""
+def apply_stock_batch(session, stock_table, order_item_table, payload, max_operations=None) -> dict:
+    stock = stock_table
+    if not isinstance(payload, dict):
+        raise StockBatchError([_error("batch", None, "invalid", "Request body must be an object")])
+    errors = []
+
+    sections = {}
+    for section in ("create", "update", "adjust", "delete"):
+        entries = payload.get(section) or []
+        if not isinstance(entries, list):
+            errors.append(_error(section, None, "invalid", f"{section} must be a list"))
+            entries = []
+        sections[section] = entries
+
+    operations = len(sections["create"]) + len(sections["update"]) + len(sections["delete"])
+    if max_operations is not None and operations > max_operations:
+        raise StockBatchError([_error("batch", None, "invalid",
+                                      f"Batch has {operations} operations; the limit is {max_operations}")])
+
+    creates = []
+    for index, raw in enumerate(sections["create"]):
+        try:
+            if isinstance(raw, dict) and raw.get("id") not in (None, ""):
+                raise ValueError("id is assigned by the server")
+            row = validate_row(raw)
+            del row["id"]
+            creates.append(row)
+        except ValueError as e:
+            errors.append(_error("create", index, "invalid", str(e)))
+
+    updates = {}
+    for index, raw in enumerate(sections["update"]):
+        try:
+            item_id = _as_id(raw.get("id") if isinstance(raw, dict) else None)
+            fields = validate_fields(raw)
+            if not fields:
+                raise ValueError("No fields to update")
+        except ValueError as e:
+            errors.append(_error("update", index, "invalid", str(e), raw.get("id") if isinstance(raw, dict) else None))
+            continue
+        if item_id in updates:
+            errors.append(_error("update", index, "duplicate", f"Item {item_id} is updated twice", item_id))
+            continue
+        updates[item_id] = (index, fields)
+
+    adjustments = []
+    for index, raw in enumerate(sections["adjust"]):
+        try:
+            if not isinstance(raw, dict):
+                raise ValueError("Adjustment must be an object")
+            adjustments.append((index, _parse_where(raw.get("where")), _parse_assignments(raw.get("set"), stock)))
+        except ValueError as e:
+            errors.append(_error("adjust", index, "invalid", str(e)))
+
+    deletes = {}
+    for index, raw in enumerate(sections["delete"]):
+        try:
+            item_id = _as_id(raw)
+        except ValueError as e:
+            errors.append(_error("delete", index, "invalid", str(e), raw))
+            continue
+        if item_id in deletes:
+            errors.append(_error("delete", index, "duplicate", f"Item {item_id} is deleted twice", item_id))
+            continue
+        deletes[item_id] = index
+
+    # Existence and order references, one query per id chunk
+    existing = set()
+    for chunk in _chunks(set(updates) | set(deletes)):
+        existing.update(session.execute(
+            select(stock.c.id).where(stock.c.id.in_(chunk), stock.c.deleted_at.is_(None))
+        ).scalars())
+    referenced = set()
+    for chunk in _chunks(deletes):
+        referenced.update(session.execute(
+            select(order_item_table.c.stock_item_id).where(order_item_table.c.stock_item_id.in_(chunk)).distinct()
+        ).scalars())
+
+    for item_id, (index, _) in updates.items():
+        if item_id not in existing:
+            errors.append(_error("update", index, "not_found", f"Stock item with ID {item_id} not found", item_id))
+    for item_id, index in deletes.items():
+        if item_id not in existing:
+            errors.append(_error("delete", index, "not_found", f"Stock item with ID {item_id} not found", item_id))
+        elif item_id in referenced:
+            errors.append(_error("delete", index, "referenced",
+                                 "Cannot delete item that is referenced in orders", item_id))
+
+    if errors:
+        raise StockBatchError(errors)
+
+    results = {"created": [], "updated": [], "adjusted": [], "deleted": []}
+    touched = set()
+
+    if creates:
+        for row in creates:
+            row["content_hash"] = stock_content_hash(row)
+        inserted = session.execute(insert(stock).returning(stock.c.id, stock.c.content_hash), creates).all()
+        # Pair returned ids with request positions by content, whatever order the database used
+        positions = {}
+        for index, row in enumerate(creates):
+            positions.setdefault(row["content_hash"], []).append(index)
+        created = [None] * len(creates)
+        for item_id, content_hash in inserted:
+            created[positions[content_hash].pop(0)] = item_id
+        results["created"] = [{"index": index, "id": item_id, "status": "created"}
+                              for index, item_id in enumerate(created)]
+        touched.update(created)
+
+    # Updates that change the same set of fields share one executemany UPDATE
+    groups = {}
+    for item_id, (index, fields) in updates.items():
+        groups.setdefault(tuple(sorted(fields)), []).append(dict(fields, item_id=item_id))
+    for field_names, rows in groups.items():
+        session.execute(
+            update(stock)
+            .where(stock.c.id == bindparam("item_id"))
+            .values({name: bindparam(name) for name in field_names})
+            .values(content_hash=None),
+            rows
+        )
+    results["updated"] = [{"index": index, "id": item_id, "status": "updated"}
+                          for item_id, (index, _) in sorted(updates.items(), key=lambda entry: entry[1][0])]
+    touched.update(updates)
+
+    for index, where, values in adjustments:
+        query = select(stock.c.id).where(stock.c.deleted_at.is_(None))
+        if where["ids"] is not None:
+            query = query.where(stock.c.id.in_(where["ids"]))
+        query = apply_stock_filters(query, stock.c, dict(where))
+        matched = session.execute(query.order_by(stock.c.id)).scalars().all()
+        for chunk in _chunks(matched):
+            session.execute(
+                update(stock).where(stock.c.id.in_(chunk)).values(values).values(content_hash=None)
+                .execution_options(synchronize_session=False)
+            )
+        results["adjusted"].append({"index": index, "status": "adjusted", "count": len(matched), "ids": matched})
+        touched.update(matched)
+
+    for chunk in _chunks(deletes):
+        session.execute(delete(stock).where(stock.c.id.in_(chunk)).execution_options(synchronize_session=False))
+    results["deleted"] = [{"index": index, "id": item_id, "status": "deleted"}
+                          for item_id, index in sorted(deletes.items(), key=lambda entry: entry[1])]
+
+    results["touched"] = sorted(touched - set(deletes))
+    results["removed"] = sorted(deletes)
+    return results
@@ -0,0 +1,209 @@
+"""
+StockChangeLog - Versioned log of stock item changes behind the incremental catalog feed
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, exists, func, insert, or_, select, update
+
+logger = logging.getLogger(__name__)
+
+# Rows of the cache_version table holding the latest catalog version and the
+# oldest version the feed can still answer from
+VERSION_NAME = "stock_changes"
+FLOOR_NAME = "stock_changes_floor"
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# Rows per INSERT / ids per IN (...) clause, kept below SQLite's bound parameter limit
+_ID_BATCH_SIZE = 500
+
+
+class ChangeFeedExpired(Exception):
+    """
+    Raised by read() when the requested version is older than the log
+    retains (compacted, or the catalog was replaced by a full import); the
+    consumer must download the full catalog and continue from its version.
+    """
+
+    def __init__(self, since, floor, version):
+        super().__init__(f"Changes since version {since} are no longer available; "
+                         f"reload the catalog (oldest available version is {floor})")
+        self.floor = floor
+        self.version = version
+
+
+class StockChangeLog:
+    """
+    Every transaction that changes stock items calls record() with the ids
+    it inserted or updated and the ids it deleted. record() increments the
+    catalog version and logs one (version, item id, op) row per item, all in
+    the caller's transaction, so the log commits or rolls back with the
+    change itself.
+
+    The version is a counter row in cache_version. Incrementing it locks the
+    row until commit, so versions become visible in the order they were
+    assigned and a consumer that has read version N never later finds a new
+    entry at or below N. Callers therefore record as the last statement
+    before committing, which keeps that lock short and always acquired after
+    any row locks on stock items.
+
+    The log only names what changed; readers return each item's current
+    state, so replaying an entry twice is harmless. compact() drops entries
+    superseded by a newer entry for the same item (a consumer past the old
+    one still gets the new one) and everything older than the retention
+    period, raising the floor below which read() raises ChangeFeedExpired.
+    A full catalog replacement calls reset(), which does the same for the
+    whole log.
+    """
+
+    def __init__(self, change_table, version_table, retention=timedelta(days=7),
+                 compact_interval=3600.0, clock=time.monotonic):
+        self.change_table = change_table
+        self.version_table = version_table
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self.clock = clock
+        self._next_compaction = 0.0
+        self._lock = threading.Lock()
+
+    """
+    Log changed items in the caller's transaction
+    @param connection A Connection or Session with an open transaction
+    @param upserted Ids of inserted or updated items
+    @param deleted Ids of deleted (or soft-deleted) items
+    @returns The new catalog version, or None when nothing changed
+    """
+    def record(self, connection, upserted=(), deleted=()):
+        ops = dict.fromkeys(upserted, UPSERT)
+        ops.update(dict.fromkeys(deleted, DELETE))
+        if not ops:
+            return None
+        version = self._bump(connection, VERSION_NAME)
+        now = datetime.utcnow()
+        rows = [{"version": version, "stock_item_id": item_id, "op": op, "changed_at": now}
+                for item_id, op in ops.items()]
+        for start in range(0, len(rows), _ID_BATCH_SIZE):
+            connection.execute(insert(self.change_table), rows[start:start + _ID_BATCH_SIZE])
+        return version
+
+    """
+    Start the log over after the whole catalog was replaced; every consumer reloads it
+    @returns The new catalog version
+    """
+    def reset(self, connection) -> int:
+        version = self._bump(connection, VERSION_NAME)
+        self._set_floor(connection, version)
+        connection.execute(delete(self.change_table))
+        return version
+
+    """
+    @returns (current version, floor)
+    """
+    def versions(self, connection):
+        table = self.version_table
+        values = dict(connection.execute(
+            select(table.c.name, table.c.version).where(table.c.name.in_((VERSION_NAME, FLOOR_NAME)))
+        ).all())
+        return values.get(VERSION_NAME, 0), values.get(FLOOR_NAME, 0)
+
+    """
+    Read the entries after a position in the log
+    @param since Catalog version the consumer is at
+    @param after Item id of the last entry read within version since+1 when the
+           previous page ended inside it, else None
+    @param limit Entries per page
+    @returns {"changes": [(version, item id, op)], "has_more", "version", "after"}
+             where version / after are the position to continue from
+    @raises ChangeFeedExpired when since is older than the floor
+    """
+    def read(self, connection, since, after=None, limit=500) -> dict:
+        current, floor = self.versions(connection)
+        if since < floor:
+            raise ChangeFeedExpired(since, floor, current)
+
+        changes = self.change_table
+        position = changes.c.version > since
+        if after is not None:
+            position = or_(and_(changes.c.version == since + 1, changes.c.stock_item_id > after),
+                           changes.c.version > since + 1)
+        rows = connection.execute(
+            select(changes.c.version, changes.c.stock_item_id, changes.c.op)
+            .where(position, changes.c.version <= current)
+            .order_by(changes.c.version, changes.c.stock_item_id)
+            .limit(limit + 1)
+        ).all()
+
+        has_more = len(rows) > limit
+        rows = [tuple(row) for row in rows[:limit]]
+        if not has_more:
+            return {"changes": rows, "has_more": False, "version": max(current, since), "after": None}
+        last_version, last_id, _ = rows[-1]
+        # Continue inside the last version unless the page ended exactly at its end
+        return {"changes": rows, "has_more": True, "version": last_version - 1, "after": last_id}
+
+    """
+    Compact the log if compact_interval has passed since this process last did
+    @param engine Engine to compact on, in a transaction of its own
+    """
+    def maybe_compact(self, engine):
+        with self._lock:
+            now = self.clock()
+            if now < self._next_compaction:
+                return
+            self._next_compaction = now + self.compact_interval
+        try:
+            with engine.begin() as connection:
+                self.compact(connection)
+        except Exception as e:
+            logger.error("Compacting the stock change log failed: %s", e)
+
+    """
+    Drop superseded entries and entries older than the retention period
+    @returns {"superseded": n, "expired": n, "floor": version}
+    """
+    def compact(self, connection, now=None) -> dict:
+        changes = self.change_table
+        newer = changes.alias("newer")
+        superseded = connection.execute(
+            delete(changes).where(exists().where(
+                newer.c.stock_item_id == changes.c.stock_item_id, newer.c.version > changes.c.version
+            ))
+        ).rowcount
+
+        cutoff = (now or datetime.utcnow()) - self.retention
+        horizon = connection.execute(
+            select(func.max(changes.c.version)).where(changes.c.changed_at < cutoff)
+        ).scalar()
+        expired = 0
+        _, floor = self.versions(connection)
+        if horizon is not None and horizon > floor:
+            expired = connection.execute(delete(changes).where(changes.c.version <= horizon)).rowcount
+            self._set_floor(connection, horizon)
+            floor = horizon
+        if superseded or expired:
+            logger.info("Compacted the stock change log: %s superseded and %s expired entries removed",
+                        superseded, expired)
+        return {"superseded": superseded, "expired": expired, "floor": floor}
+
+    def _bump(self, connection, name) -> int:
+        table = self.version_table
+        updated = connection.execute(
+            update(table).where(table.c.name == name).values(version=table.c.version + 1)
+        )
+        if updated.rowcount == 0:
+            connection.execute(insert(table).values(name=name, version=1))
+        return connection.execute(select(table.c.version).where(table.c.name == name)).scalar_one()
+
+    def _set_floor(self, connection, version):
+        table = self.version_table
+        updated = connection.execute(
+            update(table).where(table.c.name == FLOOR_NAME, table.c.version < version).values(version=version)
+        )
+        if updated.rowcount == 0 and connection.execute(
+                select(table.c.version).where(table.c.name == FLOOR_NAME)).first() is None:
+            connection.execute(insert(table).values(name=FLOOR_NAME, version=version))
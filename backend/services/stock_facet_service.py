@@ -0,0 +1,107 @@
+"""
+StockFacetService - Grouped counts and price histograms for the catalog filter sidebar
+"""
+
+from sqlalchemy import case, func, select
+
+from services.stock_query_service import StockQueryError, apply_stock_filters
+
+# Price histogram bucket count when ?buckets= is not given, and the largest accepted
+DEFAULT_PRICE_BUCKETS = 10
+MAX_PRICE_BUCKETS = 50
+
+
+"""
+Parse the ?buckets= parameter of GET /api/stock/facets
+@param args The request query arguments
+"""
+def parse_bucket_count(args) -> int:
+    try:
+        buckets = int(args.get("buckets", DEFAULT_PRICE_BUCKETS))
+    except ValueError:
+        raise StockQueryError(f"Invalid value for buckets: {args.get('buckets')}")
+    if buckets < 1:
+        raise StockQueryError("buckets must be a positive integer")
+    return min(buckets, MAX_PRICE_BUCKETS)
+
+
+def _active(model, *columns):
+    return select(*columns).where(model.deleted_at.is_(None))
+
+
+def _stats(model):
+    return (
+        func.count(model.id),
+        func.coalesce(func.sum(model.quantity), 0),
+        func.min(model.price),
+        func.max(model.price),
+    )
+
+
+def _stats_dict(row) -> dict:
+    count, quantity, min_price, max_price = row
+    return {"count": count, "quantity": int(quantity or 0), "min_price": min_price, "max_price": max_price}
+
+
+def _group_facet(session, model, params, column, name) -> list:
+    query = apply_stock_filters(_active(model, column, *_stats(model)), model, params, exclude=(name,))
+    rows = session.execute(query.group_by(column).order_by(column))
+    return [dict(_stats_dict(row[1:]), value=row[0]) for row in rows]
+
+
+def _price_facet(session, model, params, buckets) -> dict:
+    # The price facet ignores the price range filter, so the slider shows the full range
+    def base_filters(query):
+        return apply_stock_filters(query, model, params, exclude=("price",))
+
+    count, quantity, low, high = session.execute(base_filters(_active(model, *_stats(model)))).one()
+    facet = {"min": low, "max": high, "buckets": []}
+    if not count:
+        return facet
+
+    width = (high - low) / buckets if high > low else 0
+    if width:
+        bounds = [(low + width * index, high if index == buckets - 1 else low + width * (index + 1))
+                  for index in range(buckets)]
+    else:
+        bounds = [(low, high)]
+
+    # One pass over the filtered rows, one conditional count and sum per bucket;
+    # the last bucket is closed so the maximum price is counted
+    columns = []
+    for index, (start, end) in enumerate(bounds):
+        in_bucket = model.price >= start
+        if index < len(bounds) - 1:
+            in_bucket = in_bucket & (model.price < end)
+        columns.append(func.sum(case((in_bucket, 1), else_=0)))
+        columns.append(func.sum(case((in_bucket, model.quantity), else_=0)))
+    row = session.execute(base_filters(_active(model, *columns))).one()
+
+    facet["buckets"] = [
+        {"min": start, "max": end, "count": int(row[index * 2] or 0), "quantity": int(row[index * 2 + 1] or 0)}
+        for index, (start, end) in enumerate(bounds)
+    ]
+    return facet
+
+
+"""
+Compute the facet counts for the filter sidebar
+@param session The SQLAlchemy session
+@param model The StockItem model class
+@param params Parsed parameters from parse_stock_query
+@param buckets Number of equal-width price buckets
+@returns Totals for the full filter set, plus per-grade, per-location and price facets
+
+Each facet applies every filter except its own (the grade counts ignore the
+selected grades, and so on), so the sidebar shows what selecting another value
+would return. All aggregation runs in the database: five queries regardless of
+catalog size.
+"""
+def load_stock_facets(session, model, params: dict, buckets=DEFAULT_PRICE_BUCKETS) -> dict:
+    totals = session.execute(apply_stock_filters(_active(model, *_stats(model)), model, params)).one()
+    return {
+        "total": _stats_dict(totals),
+        "grades": _group_facet(session, model, params, model.grade, "grade"),
+        "locations": _group_facet(session, model, params, model.location, "location"),
+        "price": _price_facet(session, model, params, buckets),
+    }
@@ -0,0 +1,648 @@
+"""
+StockImportService - Streaming, chunked bulk import of supplier stock feeds
+"""
+
+import codecs
+import csv
+import hashlib
+import json
+import logging
+import math
+import time
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    and_,
+    bindparam,
+    case,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    text,
+    update,
+)
+
+logger = logging.getLogger(__name__)
+
+# Supported feed formats and the content types that select them
+FEED_FORMATS = {
+    "json": ("application/json",),
+    "jsonl": ("application/x-ndjson", "application/jsonl", "application/json-lines", "application/x-jsonlines"),
+    "csv": ("text/csv", "application/csv"),
+}
+
+# Only this many per-row errors are listed in a report; the rest are counted
+ERROR_REPORT_LIMIT = 100
+
+_READ_SIZE = 64 * 1024
+
+# Columns covered by StockItem.content_hash
+HASHED_FIELDS = ("name", "price", "quantity", "grade", "location")
+
+# Ids per IN (...) clause, kept below SQLite's bound parameter limit
+_ID_BATCH_SIZE = 500
+
+# Column lengths of the text fields of StockItem
+_TEXT_LENGTHS = {"name": 100, "grade": 20, "location": 50}
+
+
+class ImportFormatError(ValueError):
+    """Raised when the feed cannot be parsed at all (as opposed to a single bad row)."""
+
+
+"""
+Hash the catalog-visible content of a stock row
+@param row A dict or object with the HASHED_FIELDS
+"""
+def stock_content_hash(row) -> str:
+    get = row.get if isinstance(row, dict) else lambda field: getattr(row, field)
+    values = [
+        get("name"),
+        float(get("price")) if get("price") is not None else None,
+        int(get("quantity")) if get("quantity") is not None else None,
+        get("grade"),
+        get("location"),
+    ]
+    payload = json.dumps(values, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+"""
+Pick the feed format from an explicit ?format= value or the request content type
+"""
+def detect_feed_format(mimetype: str, explicit: str = None) -> str:
+    if explicit:
+        if explicit not in FEED_FORMATS:
+            raise ImportFormatError(f"Unsupported import format: {explicit}")
+        return explicit
+    for feed_format, mimetypes in FEED_FORMATS.items():
+        if mimetype in mimetypes:
+            return feed_format
+    return "json"
+
+
+"""
+Iterate over the raw rows of a feed without reading it into memory
+@param stream A binary file-like object (e.g. request.stream)
+@returns Tuples of (row number, parsed row or None, parse error or None)
+"""
+def iter_feed_rows(stream, feed_format: str):
+    if feed_format == "csv":
+        return _iter_csv(stream)
+    if feed_format == "jsonl":
+        return _iter_json_lines(stream)
+    return _iter_json_array(stream)
+
+
+def _iter_lines(stream):
+    # Reading fixed-size blocks is much faster than readline() on request streams.
+    # Lines end at "\n" only: splitlines() would also split on "\r", "\x1c",
+    # "\u2028" and others, which can occur inside values. A "\r\n" split across
+    # two blocks needs no care: the "\r" stays with its line until the "\n" arrives.
+    utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+    remainder = ""
+    while True:
+        chunk = stream.read(_READ_SIZE)
+        text_chunk = remainder + utf8.decode(chunk, final=not chunk)
+        if not chunk:
+            if text_chunk:
+                yield text_chunk
+            return
+        lines = text_chunk.split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line + "\n"
+
+
+def _iter_csv(stream):
+    reader = csv.DictReader(_iter_lines(stream))
+    for row_number, row in enumerate(reader, start=1):
+        yield row_number, row, None
+
+
+def _iter_json_lines(stream):
+    row_number = 0
+    for line in _iter_lines(stream):
+        line = line.strip()
+        if not line:
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line), None
+        except ValueError as error:
+            yield row_number, None, f"Invalid JSON: {error}"
+
+
+def _iter_json_array(stream):
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = stream.read(_READ_SIZE)
+        if not chunk:
+            eof = True
+            buffer = buffer[position:] + utf8.decode(b"", final=True)
+        else:
+            buffer = buffer[position:] + utf8.decode(chunk)
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if position >= len(buffer) or buffer[position] != "[":
+        raise ImportFormatError("Expected a JSON array of stock items")
+    position += 1
+
+    row_number = 0
+    expect_value = True
+    while True:
+        skip_whitespace()
+        if position >= len(buffer):
+            raise ImportFormatError("Unexpected end of JSON array")
+        char = buffer[position]
+        if char == "]":
+            return
+        if char == ",":
+            if expect_value:
+                raise ImportFormatError(f"Unexpected ',' after row {row_number}")
+            position += 1
+            expect_value = True
+            continue
+        if not expect_value:
+            raise ImportFormatError(f"Expected ',' after row {row_number}")
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                break
+            except ValueError:
+                if eof:
+                    raise ImportFormatError(f"Invalid JSON in row {row_number + 1}")
+                fill()
+        position = end
+        row_number += 1
+        expect_value = False
+        yield row_number, value, None
+
+
+def _as_text(value, field, max_length):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        raise ValueError(f"{field} is required")
+    value = str(value).strip()
+    if len(value) > max_length:
+        raise ValueError(f"{field} must be at most {max_length} characters")
+    return value
+
+
+def _as_number(value, field, cast):
+    if value is None or value == "":
+        raise ValueError(f"{field} is required")
+    if isinstance(value, bool):
+        raise ValueError(f"{field} must be a number")
+    try:
+        number = float(value)
+        if not math.isfinite(number):
+            raise ValueError
+        number = cast(number)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{field} must be a number")
+    if cast is int and float(value) != number:
+        raise ValueError(f"{field} must be a whole number")
+    if number < 0:
+        raise ValueError(f"{field} must not be negative")
+    return number
+
+
+"""
+Validate and normalise one feed row
+@returns The row ready for insertion
+@raises ValueError describing the first problem found
+"""
+def validate_row(raw) -> dict:
+    if not isinstance(raw, dict):
+        raise ValueError("Row must be an object")
+
+    item_id = raw.get("id")
+    if item_id in ("", None):
+        item_id = None
+    else:
+        item_id = _as_number(item_id, "id", int)
+        if item_id == 0:
+            raise ValueError("id must be positive")
+
+    return dict({"id": item_id}, **{field: _validate_field(field, raw.get(field)) for field in HASHED_FIELDS})
+
+
+"""
+Validate and normalise the catalog fields present in a partial update
+@returns Only the fields that were given
+@raises ValueError describing the first problem found
+"""
+def validate_fields(raw) -> dict:
+    if not isinstance(raw, dict):
+        raise ValueError("Row must be an object")
+    return {field: _validate_field(field, raw[field]) for field in HASHED_FIELDS if field in raw}
+
+
+def _validate_field(field, value):
+    if field == "price":
+        return _as_number(value, field, float)
+    if field == "quantity":
+        return _as_number(value, field, int)
+    return _as_text(value, field, _TEXT_LENGTHS[field])
+
+
+class StockImporter:
+    """
+    Replaces the stock catalog with the contents of a feed.
+
+    Rows are validated and bulk-inserted in chunks into a temporary staging
+    table on a dedicated connection. Only when the whole feed has been read
+    and the number of rejected rows is within max_errors is the catalog
+    swapped in, in one short transaction of set-based statements against
+    the staging table:
+
+    - items whose id is in the feed are updated in place (only when their
+      content hash differs or they were soft-deleted), so their ids, order
+      lines, details and images stay valid
+    - feed rows with a new id, or without one, are inserted
+    - items missing from the feed are soft-deleted when order lines still
+      reference them (order_item_table), and otherwise deleted together
+      with their rows in dependent_tables (tables keyed by stock_item_id)
+
+    Any failure before the swap leaves the live catalog untouched. With a
+    change_log, the swap resets it in the same transaction, so change feed
+    consumers reload the catalog.
+    """
+
+    def __init__(self, engine, stock_table, chunk_size=2000, max_errors=0, change_log=None,
+                 order_item_table=None, dependent_tables=()):
+        self.engine = engine
+        self.stock_table = stock_table
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.change_log = change_log
+        self.order_item_table = order_item_table
+        self.dependent_tables = tuple(dependent_tables)
+
+        metadata = MetaData()
+        self.staging_table = Table(
+            "stock_item_import_staging", metadata,
+            Column("row_number", Integer, primary_key=True),
+            Column("id", Integer, index=True),
+            Column("name", String(100), nullable=False),
+            Column("price", Float, nullable=False),
+            Column("quantity", Integer, nullable=False),
+            Column("grade", String(20), nullable=False),
+            Column("location", String(50), nullable=False),
+            Column("content_hash", String(40), nullable=False),
+            prefixes=["TEMPORARY"],
+        )
+
+    """
+    Run the import to completion
+    @param rows Iterable from iter_feed_rows
+    @returns The final import report
+    """
+    def run(self, rows) -> dict:
+        report = None
+        for report in self.iter_run(rows):
+            pass
+        return report
+
+    """
+    Run the import, yielding a progress snapshot after each staged chunk
+    The last value yielded is the final report (with "done" set to True)
+    """
+    def iter_run(self, rows):
+        report = {
+            "processed": 0,
+            "valid": 0,
+            "imported": 0,
+            "rejected": 0,
+            "errors": [],
+            "inserted": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "deleted": 0,
+            "retired": 0,
+            "swapped": False,
+            "done": False,
+            "duration_ms": 0,
+        }
+        started = time.perf_counter()
+        seen_ids = set()
+
+        with self.engine.connect() as conn:
+            self.staging_table.create(conn)
+            conn.commit()
+            try:
+                chunk = []
+                for row_number, raw, parse_error in rows:
+                    report["processed"] += 1
+                    try:
+                        if parse_error:
+                            raise ValueError(parse_error)
+                        row = validate_row(raw)
+                        if row["id"] is not None:
+                            if row["id"] in seen_ids:
+                                raise ValueError(f"Duplicate id {row['id']}")
+                            seen_ids.add(row["id"])
+                    except ValueError as error:
+                        self._reject(report, row_number, str(error))
+                        continue
+
+                    row["row_number"] = row_number
+                    row["content_hash"] = stock_content_hash(row)
+                    chunk.append(row)
+                    if len(chunk) >= self.chunk_size:
+                        self._stage(conn, chunk, report)
+                        chunk = []
+                        yield self._snapshot(report)
+
+                if chunk:
+                    self._stage(conn, chunk, report)
+                    yield self._snapshot(report)
+
+                if report["rejected"] > self.max_errors:
+                    logger.warning("Stock import aborted: %d invalid rows", report["rejected"])
+                else:
+                    report.update(self._swap(conn))
+                    report["swapped"] = True
+                    report["imported"] = report["valid"]
+            finally:
+                conn.rollback()
+                self.staging_table.drop(conn, checkfirst=True)
+                conn.commit()
+
+        report["done"] = True
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        yield report
+
+    @staticmethod
+    def _snapshot(report) -> dict:
+        return {key: report[key] for key in ("processed", "valid", "rejected")}
+
+    def _reject(self, report, row_number, message):
+        report["rejected"] += 1
+        if len(report["errors"]) < ERROR_REPORT_LIMIT:
+            report["errors"].append({"row": row_number, "error": message})
+
+    def _stage(self, conn, chunk, report):
+        conn.execute(insert(self.staging_table), chunk)
+        conn.commit()
+        report["valid"] += len(chunk)
+        logger.debug("Stock import progress: %d rows read, %d rejected", report["processed"], report["rejected"])
+
+    """
+    Apply the staged feed to the catalog and commit
+    @returns Counts of inserted, updated, unchanged, deleted and retired (soft-deleted) items
+    """
+    def _swap(self, conn) -> dict:
+        stock = self.stock_table
+        staging = self.staging_table
+        columns = HASHED_FIELDS + ("content_hash",)
+        now = datetime.utcnow()
+        created_at = literal(now, DateTime())
+        in_feed = exists().where(staging.c.id == stock.c.id)
+
+        # Items missing from the feed, before any feed rows are inserted
+        missing = ~in_feed
+        referenced = None
+        if self.order_item_table is not None:
+            order_item = self.order_item_table
+            referenced = exists().where(order_item.c.stock_item_id == stock.c.id)
+        retired = 0
+        if referenced is not None:
+            retired = conn.execute(
+                update(stock).where(missing, referenced, stock.c.deleted_at.is_(None)).values(deleted_at=now)
+            ).rowcount
+        removable = and_(missing, ~referenced) if referenced is not None else missing
+        for table in self.dependent_tables:
+            # Not left to ON DELETE CASCADE: SQLite only enforces foreign keys when asked to
+            conn.execute(delete(table).where(table.c.stock_item_id.in_(select(stock.c.id).where(removable))))
+        deleted = conn.execute(delete(stock).where(removable)).rowcount
+
+        updated = conn.execute(
+            update(stock)
+            .where(stock.c.id == staging.c.id,
+                   or_(stock.c.content_hash.is_distinct_from(staging.c.content_hash), stock.c.deleted_at.isnot(None)))
+            .values({name: staging.c[name] for name in columns})
+            .values(deleted_at=None)
+        ).rowcount
+        matched = conn.execute(
+            select(func.count()).select_from(staging).where(exists().where(stock.c.id == staging.c.id))
+        ).scalar()
+
+        # Rows with a new id keep it, rows without an id get one from the database
+        inserted = conn.execute(insert(stock).from_select(
+            ("id", "created_at") + columns,
+            select(staging.c.id, created_at, *(staging.c[name] for name in columns))
+            .where(staging.c.id.isnot(None), ~exists().where(stock.c.id == staging.c.id))
+            .order_by(staging.c.row_number),
+        )).rowcount
+        inserted += conn.execute(insert(stock).from_select(
+            ("created_at",) + columns,
+            select(created_at, *(staging.c[name] for name in columns))
+            .where(staging.c.id.is_(None)).order_by(staging.c.row_number),
+        )).rowcount
+
+        if conn.dialect.name == "postgresql":
+            # Explicit ids do not advance the serial sequence
+            conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence(:table, 'id'), COALESCE(MAX(id), 1)) FROM " + stock.name
+            ), {"table": stock.name})
+
+        if self.change_log is not None:
+            self.change_log.reset(conn)
+        conn.commit()
+        return {"inserted": inserted, "updated": updated, "unchanged": matched - updated,
+                "deleted": deleted, "retired": retired}
+
+
+class StockSynchronizer:
+    """
+    Applies a feed as a minimal changeset instead of replacing the catalog.
+
+    Every feed row must carry the id of the stock item it describes. Its
+    content hash is compared with StockItem.content_hash: new ids are
+    inserted, rows whose hash differs (or that were soft-deleted) are
+    updated, and active rows missing from the feed are soft-deleted by
+    setting deleted_at. Row ids, and therefore order references, never change.
+
+    Unchanged rows cost nothing but a hash comparison; only the changeset is
+    held in memory and written, in a single transaction. After a successful
+    run, applied_changes holds the full changeset (inserted and updated rows,
+    deleted ids) for callers that maintain derived data such as search indexes.
+    With a change_log, the changeset is also logged in the same transaction.
+
+    The feed quantity counts units that pending orders still hold. Given the
+    order tables, an updated row gets the feed quantity minus those units (not
+    below zero), so the reservations survive and expiring them later restores
+    the feed quantity rather than adding to it; the applied rows carry the
+    stored quantity. Unchanged rows keep their quantity as it is.
+    """
+
+    def __init__(self, engine, stock_table, max_errors=0, change_log=None, order_table=None,
+                 order_item_table=None):
+        self.engine = engine
+        self.stock_table = stock_table
+        self.max_errors = max_errors
+        self.change_log = change_log
+        self.order_table = order_table
+        self.order_item_table = order_item_table
+        self.applied_changes = None
+
+    def _load_stored(self) -> dict:
+        stock = self.stock_table
+        with self.engine.connect() as conn:
+            result = conn.execute(select(stock.c.id, stock.c.content_hash, stock.c.deleted_at))
+            return {row.id: (row.content_hash, row.deleted_at is not None) for row in result}
+
+    """
+    Diff the feed against the catalog and apply the changes
+    @param rows Iterable from iter_feed_rows
+    @returns The sync report including a summary of the changeset
+    """
+    def run(self, rows) -> dict:
+        report = {
+            "mode": "sync",
+            "processed": 0,
+            "rejected": 0,
+            "errors": [],
+            "inserted": 0,
+            "updated": 0,
+            "deleted": 0,
+            "unchanged": 0,
+            "applied": False,
+            "changes": {"inserted": [], "updated": [], "deleted": []},
+            "duration_ms": 0,
+        }
+        started = time.perf_counter()
+        stored = self._load_stored()
+        seen_ids = set()
+        inserts = []
+        updates = []
+
+        for row_number, raw, parse_error in rows:
+            report["processed"] += 1
+            try:
+                if parse_error:
+                    raise ValueError(parse_error)
+                row = validate_row(raw)
+                if row["id"] is None:
+                    raise ValueError("id is required in sync mode")
+                if row["id"] in seen_ids:
+                    raise ValueError(f"Duplicate id {row['id']}")
+            except ValueError as error:
+                report["rejected"] += 1
+                if len(report["errors"]) < ERROR_REPORT_LIMIT:
+                    report["errors"].append({"row": row_number, "error": str(error)})
+                continue
+
+            seen_ids.add(row["id"])
+            row["content_hash"] = stock_content_hash(row)
+            current = stored.get(row["id"])
+            if current is None:
+                inserts.append(row)
+            elif current[0] != row["content_hash"] or current[1]:
+                updates.append(row)
+            else:
+                report["unchanged"] += 1
+
+        deletes = [item_id for item_id, (_, deleted) in stored.items()
+                   if not deleted and item_id not in seen_ids]
+
+        if report["rejected"] > self.max_errors:
+            logger.warning("Stock sync aborted: %d invalid rows", report["rejected"])
+        else:
+            self._apply(inserts, updates, deletes)
+            self.applied_changes = {"upserted": inserts + updates, "deleted": deletes}
+            report["applied"] = True
+            report["inserted"] = len(inserts)
+            report["updated"] = len(updates)
+            report["deleted"] = len(deletes)
+            report["changes"] = {
+                "inserted": [row["id"] for row in inserts[:ERROR_REPORT_LIMIT]],
+                "updated": [row["id"] for row in updates[:ERROR_REPORT_LIMIT]],
+                "deleted": deletes[:ERROR_REPORT_LIMIT],
+            }
+
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return report
+
+    def _unreserved(self, quantity):
+        stock, order, order_item = self.stock_table, self.order_table, self.order_item_table
+        # Correlated per row, in the same statement, so a reservation cannot slip in between
+        held = select(func.coalesce(func.sum(order_item.c.quantity), 0)).where(
+            order_item.c.stock_item_id == stock.c.id,
+            order_item.c.order_id == order.c.id,
+            order.c.status == "pending",
+        ).scalar_subquery()
+        return case((quantity - held < 0, 0), else_=quantity - held)
+
+    def _load_quantities(self, conn, rows):
+        stock = self.stock_table
+        by_id = {row["id"]: row for row in rows}
+        ids = list(by_id)
+        for start in range(0, len(ids), _ID_BATCH_SIZE):
+            query = select(stock.c.id, stock.c.quantity).where(stock.c.id.in_(ids[start:start + _ID_BATCH_SIZE]))
+            for item_id, quantity in conn.execute(query):
+                by_id[item_id]["quantity"] = quantity
+
+    def _apply(self, inserts, updates, deletes):
+        stock = self.stock_table
+        now = datetime.utcnow()
+
+        with self.engine.begin() as conn:
+            if inserts:
+                conn.execute(insert(stock), [dict(row, created_at=now) for row in inserts])
+            if updates:
+                values = {name: bindparam(name) for name in HASHED_FIELDS + ("content_hash",)}
+                if self.order_table is not None:
+                    values["quantity"] = self._unreserved(bindparam("quantity"))
+                statement = (
+                    update(stock)
+                    .where(stock.c.id == bindparam("item_id"))
+                    .values(values)
+                    .values(deleted_at=None)
+                )
+                conn.execute(statement, [
+                    dict({name: row[name] for name in HASHED_FIELDS + ("content_hash",)}, item_id=row["id"])
+                    for row in updates
+                ])
+                if self.order_table is not None:
+                    self._load_quantities(conn, updates)
+            for start in range(0, len(deletes), _ID_BATCH_SIZE):
+                batch = deletes[start:start + _ID_BATCH_SIZE]
+                conn.execute(update(stock).where(stock.c.id.in_(batch)).values(deleted_at=now))
+
+            if inserts and conn.dialect.name == "postgresql":
+                conn.execute(text(
+                    "SELECT setval(pg_get_serial_sequence(:table, 'id'), COALESCE(MAX(id), 1)) FROM " + stock.name
+                ), {"table": stock.name})
+
+            if self.change_log is not None:
+                self.change_log.record(conn, upserted=[row["id"] for row in inserts + updates], deleted=deletes)
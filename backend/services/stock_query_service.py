@@ -0,0 +1,171 @@
+"""
+StockQueryService - Server-side filtering, sorting and keyset pagination for the stock catalog
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from config import STOCK_PAGE_SIZE, STOCK_MAX_PAGE_SIZE
+
+# Query string parameters that switch GET /api/stock into query mode
+QUERY_PARAMS = ("limit", "cursor", "sort", "grade", "location", "min_price", "max_price", "q")
+
+# Columns that can be used as sort keys; the primary key is always the tie-breaker
+SORT_KEYS = ("id", "created_at", "price", "name", "quantity")
+
+
+class StockQueryError(ValueError):
+    """Raised when the query string cannot be turned into a stock query."""
+
+
+"""
+Check whether the request asks for a filtered/paginated listing
+@param args The request query arguments
+"""
+def is_query_mode(args) -> bool:
+    return any(key in args for key in QUERY_PARAMS)
+
+
+def _parse_float(args, key):
+    value = args.get(key)
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise StockQueryError(f"Invalid value for {key}: {value}")
+
+
+def _parse_list(args, key):
+    values = []
+    for raw in args.getlist(key):
+        values.extend(part.strip() for part in raw.split(",") if part.strip())
+    return values
+
+
+"""
+Parse and validate the query string of GET /api/stock
+@param args The request query arguments
+"""
+def parse_stock_query(args) -> dict:
+    try:
+        limit = int(args.get("limit", STOCK_PAGE_SIZE))
+    except ValueError:
+        raise StockQueryError(f"Invalid value for limit: {args.get('limit')}")
+    if limit < 1:
+        raise StockQueryError("limit must be a positive integer")
+
+    sort = args.get("sort", "id")
+    descending = sort.startswith("-")
+    sort_key = sort.lstrip("-")
+    if sort_key not in SORT_KEYS:
+        raise StockQueryError(f"Unsupported sort key: {sort_key}")
+
+    params = {
+        "limit": min(limit, STOCK_MAX_PAGE_SIZE),
+        "sort_key": sort_key,
+        "descending": descending,
+        "grades": _parse_list(args, "grade"),
+        "locations": _parse_list(args, "location"),
+        "min_price": _parse_float(args, "min_price"),
+        "max_price": _parse_float(args, "max_price"),
+        "q": (args.get("q") or "").strip(),
+        "cursor": None,
+    }
+
+    if args.get("cursor"):
+        params["cursor"] = decode_cursor(args["cursor"], sort_key)
+
+    return params
+
+
+"""
+Apply the grade, location, price range and name filters to a query
+@param query The base StockItem query (or a select() over the stock table)
+@param model The StockItem model class
+@param params Parsed parameters from parse_stock_query
+@param exclude Filters to leave out ("grade", "location", "price"), e.g. for facet counts
+"""
+def apply_stock_filters(query, model, params: dict, exclude=()):
+    if params["grades"] and "grade" not in exclude:
+        query = query.filter(model.grade.in_(params["grades"]))
+    if params["locations"] and "location" not in exclude:
+        query = query.filter(model.location.in_(params["locations"]))
+    if params["min_price"] is not None and "price" not in exclude:
+        query = query.filter(model.price >= params["min_price"])
+    if params["max_price"] is not None and "price" not in exclude:
+        query = query.filter(model.price <= params["max_price"])
+    if params["q"]:
+        pattern = params["q"].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(model.name.ilike(f"%{pattern}%", escape="\\"))
+    return query
+
+
+"""
+Order the query by the requested sort key and apply the keyset cursor
+@param query A filtered StockItem query
+@param model The StockItem model class
+@param params Parsed parameters from parse_stock_query
+"""
+def apply_stock_ordering(query, model, params: dict):
+    column = getattr(model, params["sort_key"])
+    descending = params["descending"]
+    cursor = params["cursor"]
+
+    if cursor is not None:
+        value, last_id = cursor
+        if params["sort_key"] == "id":
+            query = query.filter(model.id < last_id if descending else model.id > last_id)
+        elif descending:
+            query = query.filter((column < value) | ((column == value) & (model.id < last_id)))
+        else:
+            query = query.filter((column > value) | ((column == value) & (model.id > last_id)))
+
+    if params["sort_key"] == "id":
+        return query.order_by(model.id.desc() if descending else model.id.asc())
+    if descending:
+        return query.order_by(column.desc(), model.id.desc())
+    return query.order_by(column.asc(), model.id.asc())
+
+
+"""
+Fetch one page of results
+@returns A tuple of (items, next_cursor) where next_cursor is None on the last page
+"""
+def fetch_stock_page(query, model, params: dict):
+    limit = params["limit"]
+    rows = apply_stock_ordering(query, model, params).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1], params["sort_key"])
+
+
+"""
+Encode the position after the given item as an opaque cursor string
+"""
+def encode_cursor(item, sort_key: str) -> str:
+    value = getattr(item, sort_key)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort_key, value, item.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+"""
+Decode a cursor produced by encode_cursor
+@returns A tuple of (sort value, last id)
+"""
+def decode_cursor(cursor: str, sort_key: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key, value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if key == "created_at" and value is not None:
+            value = datetime.fromisoformat(value)
+        last_id = int(last_id)
+    except (ValueError, TypeError):
+        raise StockQueryError("Invalid cursor")
+    if key != sort_key:
+        raise StockQueryError("Cursor does not match the requested sort order")
+    return value, last_id
@@ -0,0 +1,129 @@
+"""
+StockReservationService - Atomic, set-based stock decrements for order creation
+"""
+
+from sqlalchemy import case, select, update
+
+
+class StockReservationError(Exception):
+    """
+    Raised when an order cannot be reserved.
+
+    errors holds one entry per offending line item, each with the item id,
+    a machine-readable reason (invalid, not_found, insufficient) and a message.
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors[0]["error"] if errors else "Stock reservation failed")
+        self.errors = errors
+
+    @property
+    def not_found(self) -> bool:
+        return any(error["reason"] == "not_found" for error in self.errors)
+
+
+"""
+Sum the requested quantity per stock item id
+@param lines Order lines as dicts with "id" and "quantity"
+@raises StockReservationError if a line has an invalid id or quantity
+"""
+def merge_order_lines(lines) -> dict:
+    requested = {}
+    errors = []
+    for line in lines:
+        item_id = line.get("id")
+        quantity = line.get("quantity")
+        if isinstance(item_id, str) and item_id.isdigit():
+            item_id = int(item_id)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0 \
+                or isinstance(item_id, bool) or not isinstance(item_id, int):
+            errors.append({"item_id": item_id, "reason": "invalid",
+                           "error": f"Invalid item data: {line}"})
+            continue
+        requested[item_id] = requested.get(item_id, 0) + quantity
+    if errors:
+        raise StockReservationError(errors)
+    return requested
+
+
+"""
+Reserve stock for an order inside the caller's transaction
+@param session The SQLAlchemy session whose transaction the decrement joins
+@param stock_table The stock_item table
+@param requested Mapping of stock item id to quantity, from merge_order_lines
+@returns Mapping of stock item id to its row (id, name, quantity after the decrement)
+@raises StockReservationError listing every item that cannot be reserved
+
+The caller must roll back its transaction when this raises. Items are read
+in one query (locked FOR UPDATE where the database supports it) and
+decremented by a single conditional UPDATE, which only succeeds for rows that
+still have enough stock; concurrent checkouts therefore cannot oversell.
+
+content_hash is left alone: it describes the row as the last import or edit
+wrote it, so a sync import of an unchanged feed row keeps the reserved
+quantity instead of resetting it to the feed's figure.
+"""
+def reserve_stock(session, stock_table, requested: dict) -> dict:
+    if not requested:
+        return {}
+
+    stock = stock_table
+    item_ids = sorted(requested)
+
+    query = (
+        select(stock.c.id, stock.c.name, stock.c.quantity)
+        .where(stock.c.id.in_(item_ids), stock.c.deleted_at.is_(None))
+        .order_by(stock.c.id)
+    )
+    if session.get_bind().dialect.name != "sqlite":
+        query = query.with_for_update()
+    rows = {row.id: row for row in session.execute(query)}
+
+    errors = _check_availability(rows, requested)
+    if errors:
+        raise StockReservationError(errors)
+
+    amount = case(requested, value=stock.c.id)
+    statement = (
+        update(stock)
+        .where(stock.c.id.in_(item_ids), stock.c.deleted_at.is_(None), stock.c.quantity >= amount)
+        .values(quantity=stock.c.quantity - amount)
+        .execution_options(synchronize_session=False)
+    )
+    returning = session.get_bind().dialect.update_returning
+    if returning:
+        # The quantities this UPDATE left, not the ones read before it
+        result = session.execute(statement.returning(stock.c.id, stock.c.name, stock.c.quantity))
+        updated = {row.id: row for row in result}
+    else:
+        updated_count = session.execute(statement).rowcount
+
+    if (len(updated) if returning else updated_count) != len(item_ids):
+        # Another checkout took the stock between the read and the update
+        current = {row.id: row for row in session.execute(
+            select(stock.c.id, stock.c.name, stock.c.quantity).where(stock.c.id.in_(item_ids))
+        )}
+        raise StockReservationError(_check_availability(current, requested) or [
+            {"item_id": None, "reason": "insufficient", "error": "Insufficient stock"}
+        ])
+
+    if returning:
+        return updated
+    # The rows are locked by this transaction now, so a re-read sees the decrement only
+    return {row.id: row for row in session.execute(
+        select(stock.c.id, stock.c.name, stock.c.quantity).where(stock.c.id.in_(item_ids))
+    )}
+
+
+def _check_availability(rows, requested) -> list:
+    errors = []
+    for item_id, quantity in requested.items():
+        row = rows.get(item_id)
+        if row is None:
+            errors.append({"item_id": item_id, "reason": "not_found",
+                           "error": f"Stock item with ID {item_id} not found"})
+        elif row.quantity < quantity:
+            errors.append({"item_id": item_id, "reason": "insufficient",
+                           "error": f"Insufficient stock for item {row.name}",
+                           "requested": quantity, "available": row.quantity})
+    return errors
@@ -0,0 +1,406 @@
+"""
+StockSearchIndex - In-memory inverted index for catalog search and typeahead
+"""
+
+import heapq
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Score of a term hit per field; the name outweighs grade and location
+FIELD_WEIGHTS = {"name": 3.0, "grade": 2.0, "location": 1.0}
+# Share of the score a prefix match earns compared to a whole-term match
+PREFIX_MATCH_FACTOR = 0.6
+# Query words that only describe a field ("Grade A", "in London") and match nothing themselves
+STOP_WORDS = frozenset({"grade", "in", "at", "the", "of", "and"})
+# Score combinations walked before falling back to scoring every match
+MAX_COMBINATIONS = 256
+# Ranked results kept per query between writes, and how many of them
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_DEPTH = 100
+# Documents placed out of tie-break order by writes before the index is renumbered
+MAX_UNORDERED = 1024
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_ALNUM_PARTS = re.compile(r"[a-z]+|[0-9]+")
+_ID_BITS = 32
+
+
+"""
+Split text into lower-case search terms
+@returns Terms in order; mixed tokens such as "128gb" also yield "128" and "gb"
+"""
+def tokenize(text) -> list:
+    terms = []
+    for token in _TOKEN_PATTERN.findall(str(text or "").lower()):
+        terms.append(token)
+        parts = _ALNUM_PARTS.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+"""
+Positions of the set bits of a mask, lowest first
+@param limit Stop after this many
+"""
+def _ordinals(mask, limit=None) -> list:
+    bits = bin(mask)[:1:-1]
+    found = []
+    position = bits.find("1")
+    while position != -1 and (limit is None or len(found) < limit):
+        found.append(position)
+        position = bits.find("1", position + 1)
+    return found
+
+
+def _mask(ordinals) -> int:
+    bits = bytearray((max(ordinals) >> 3) + 1)
+    for ordinal in ordinals:
+        bits[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(bits, "little")
+
+
+"""
+Whether a document with these terms can be among the results of a query
+@param query Query terms; the last one also matches as a prefix
+"""
+def _could_match(query, terms) -> bool:
+    return all(term in terms for term in query[:-1]) and any(term.startswith(query[-1]) for term in terms)
+
+
+class TermMatch:
+    """
+    Documents matching one query term, as bit masks over document ordinals:
+    tiers of equal score (highest first), and all of them together
+    """
+    __slots__ = ("tiers", "docs")
+
+    def __init__(self, weighted):
+        # A document in several (score, mask) pairs keeps its best score
+        self.tiers = []
+        docs = 0
+        for score, mask in sorted(weighted, key=lambda pair: pair[0], reverse=True):
+            mask &= ~docs
+            if mask:
+                self.tiers.append((score, mask))
+                docs |= mask
+        self.docs = docs
+
+
+class StockSearchIndex:
+    """
+    Inverted index over stock item name, grade and location.
+
+    Every query term must match (AND); the last term also matches as a prefix
+    so partial input works for typeahead. Results are ranked by the summed
+    field weights of the matching terms, then by shorter name and id. The
+    indexed documents carry the listing fields, so a search never touches the
+    database.
+
+    Documents are numbered in tie-break order (name length, then id), and
+    every posting list is a bit mask over those ordinals, one per field
+    weight. The postings of every term prefix are kept as well, so the
+    typeahead match of a partial word is a lookup rather than a vocabulary
+    scan. Matching is integer AND, the number of matches is a bit count, and
+    the first results of a set are its lowest bits. Large result sets are not
+    scored one by one: each term's matches are split into tiers of equal
+    score and tier combinations are visited best score first until enough
+    results are collected. A bit mask costs one bit per document up to its
+    highest ordinal, about 6 KB per term and prefix at 50k items.
+
+    Writes keep a document's ordinal when its name length is unchanged;
+    otherwise it gets a new ordinal past the end, out of tie-break order, and
+    such documents are merged in by sort key when results are taken. After
+    MAX_UNORDERED of them the index is renumbered. The ranked top of recent
+    queries is cached; a write drops only the cached queries the changed
+    document matched before or matches after.
+
+    upsert() / remove() keep the index current after single writes. rebuild()
+    replaces everything at once: the new index is built aside and swapped in,
+    so searches keep using the old one meanwhile. Other worker processes have
+    their own index; max_age bounds how long they serve stale entries.
+    """
+
+    def __init__(self, load=None, max_age=300.0, clock=time.monotonic):
+        self.load = load
+        self.max_age = max_age
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._ordinals = {}
+        self._docs = {}
+        self._doc_terms = {}
+        self._postings = {}
+        self._prefixes = {}
+        self._next_ordinal = 0
+        self._unordered = 0
+        self._unordered_count = 0
+        self._result_cache = OrderedDict()
+        self._built_at = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    """
+    Replace the whole index
+    @param items Iterable of stock item dicts (id, name, price, quantity, grade, location)
+    """
+    def rebuild(self, items):
+        built = self._build((item, self._weigh(item)) for item in items)
+        with self._lock:
+            self._install(built)
+            self._built_at = self.clock()
+
+    """
+    Mark the index stale so the next search reloads it, e.g. after a full catalog replace
+    """
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def upsert(self, item):
+        terms = self._weigh(item)
+        with self._lock:
+            ordinal = self._ordinals.get(item["id"])
+            if ordinal is not None and self._sort_key(self._docs[ordinal]) == self._sort_key(item):
+                # Same place in tie-break order: reindex in place
+                before = self._unindex(ordinal)
+            else:
+                before = self._remove_locked(item["id"])
+                ordinal = self._next_ordinal
+                self._next_ordinal += 1
+                self._ordinals[item["id"]] = ordinal
+                self._unordered |= 1 << ordinal
+                self._unordered_count += 1
+            self._docs[ordinal] = item
+            self._index(ordinal, terms)
+            self._forget_results(before, terms)
+            if self._unordered_count > MAX_UNORDERED:
+                self._install(self._build([(doc, self._doc_terms[ordinal]) for ordinal, doc in self._docs.items()]))
+
+    """
+    Change fields that are returned but not searched, e.g. quantity after an order
+    """
+    def update_fields(self, item_id, **fields):
+        with self._lock:
+            ordinal = self._ordinals.get(item_id)
+            if ordinal is not None:
+                self._docs[ordinal] = dict(self._docs[ordinal], **fields)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._forget_results(self._remove_locked(item_id))
+
+    """
+    Search the catalog
+    @param query Free text, e.g. "iphone 13 pro 128gb grade a"
+    @param limit Maximum number of items returned
+    @param offset Number of ranked items to skip
+    @returns (total number of matches, list of item dicts in rank order)
+    """
+    def search(self, query, limit=20, offset=0):
+        self._ensure_fresh()
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term not in STOP_WORDS]
+        if not terms:
+            return 0, []
+
+        wanted = offset + limit
+        with self._lock:
+            cache_key = tuple(terms)
+            cached = self._result_cache.get(cache_key)
+            if cached is not None and (len(cached[1]) >= wanted or len(cached[1]) == cached[0]):
+                self._result_cache.move_to_end(cache_key)
+                total, ranked = cached
+            else:
+                total, ranked = self._rank(terms, max(wanted, RESULT_CACHE_DEPTH))
+                self._result_cache[cache_key] = (total, ranked)
+                if len(self._result_cache) > RESULT_CACHE_SIZE:
+                    self._result_cache.popitem(last=False)
+            return total, [self._docs[ordinal] for ordinal in ranked[offset:wanted]]
+
+    def _rank(self, terms, wanted):
+        matches = [self._match(term, prefix=(index == len(terms) - 1))
+                   for index, term in enumerate(terms)]
+        hits = matches[0].docs
+        for match in matches[1:]:
+            hits &= match.docs
+        if not hits:
+            return 0, []
+        # Only the tiers' documents that match every term take part in ranking
+        tiers = [[(score, mask & hits) for score, mask in match.tiers if mask & hits] for match in matches]
+        return hits.bit_count(), self._rank_by_tiers(tiers, wanted)
+
+    def _clear_caches(self):
+        self._result_cache.clear()
+
+    def _forget_results(self, *term_sets):
+        # A cached ranking changes only if the changed document matched it before or matches it now
+        term_sets = [terms for terms in term_sets if terms]
+        stale = [query for query in self._result_cache
+                 if any(_could_match(query, terms) for terms in term_sets)]
+        for query in stale:
+            del self._result_cache[query]
+
+    def _rank_by_score(self, tiers, wanted) -> list:
+        scores = {}
+        for term_tiers in tiers:
+            for score, mask in term_tiers:
+                for ordinal in _ordinals(mask):
+                    scores[ordinal] = scores.get(ordinal, 0) + score
+        return heapq.nsmallest(wanted, scores, key=lambda ordinal: (-round(scores[ordinal], 6),
+                                                                    self._sort_key(self._docs[ordinal])))
+
+    def _rank_by_tiers(self, tiers, wanted) -> list:
+        # Visit tier combinations in order of falling total score; all documents
+        # of one total are collected before taking them in tie-break order
+        def total(combination):
+            return round(sum(term_tiers[tier][0] for term_tiers, tier in zip(tiers, combination)), 6)
+
+        start = (0,) * len(tiers)
+        heap = [(-total(start), start)]
+        seen = {start}
+        ranked = []
+        visited = 0
+        while heap and len(ranked) < wanted:
+            score, combination = heapq.heappop(heap)
+            group = [combination]
+            while heap and heap[0][0] == score:
+                group.append(heapq.heappop(heap)[1])
+            visited += len(group)
+            if visited > MAX_COMBINATIONS:
+                return self._rank_by_score(tiers, wanted)
+
+            docs = 0
+            for combination in group:
+                found = -1
+                for term_tiers, tier in zip(tiers, combination):
+                    found &= term_tiers[tier][1]
+                    if not found:
+                        break
+                docs |= found
+                for position, term_tiers in enumerate(tiers):
+                    if combination[position] + 1 < len(term_tiers):
+                        neighbour = combination[:position] + (combination[position] + 1,) + combination[position + 1:]
+                        if neighbour not in seen:
+                            seen.add(neighbour)
+                            heapq.heappush(heap, (-total(neighbour), neighbour))
+            if docs:
+                ranked.extend(self._first(docs, wanted - len(ranked)))
+        return ranked
+
+    def _first(self, mask, count) -> list:
+        # Ordinals below the unordered ones are in tie-break order already
+        unordered = mask & self._unordered
+        ordinals = _ordinals(mask ^ unordered, count)
+        if unordered:
+            ordinals = heapq.nsmallest(count, ordinals + _ordinals(unordered),
+                                       key=lambda ordinal: self._sort_key(self._docs[ordinal]))
+        return ordinals
+
+    def _match(self, term, prefix) -> TermMatch:
+        weighted = list(self._postings.get(term, {}).items())
+        if prefix:
+            weighted.extend((round(weight * PREFIX_MATCH_FACTOR, 6), mask)
+                            for weight, mask in self._prefixes.get(term, {}).items())
+        return TermMatch(weighted)
+
+    def _ensure_fresh(self):
+        if self.load is None:
+            return
+        built_at = self._built_at
+        if built_at is not None and self.clock() - built_at < self.max_age:
+            return
+        if not self._build_lock.acquire(blocking=built_at is None):
+            return  # another thread is rebuilding; keep serving the current index
+        try:
+            if self._built_at == built_at:
+                self.rebuild(self.load())
+        finally:
+            self._build_lock.release()
+
+    """
+    Number documents in tie-break order and build their postings
+    @param weighed Iterable of (item dict, its weighed terms)
+    """
+    def _build(self, weighed) -> dict:
+        weighed = sorted(weighed, key=lambda pair: self._sort_key(pair[0]))
+        ordinals, docs, doc_terms, collected = {}, {}, {}, {}
+        for ordinal, (item, terms) in enumerate(weighed):
+            ordinals[item["id"]] = ordinal
+            docs[ordinal] = item
+            doc_terms[ordinal] = terms
+            for term, weight in terms.items():
+                collected.setdefault(term, {}).setdefault(weight, []).append(ordinal)
+        postings = {term: {weight: _mask(found) for weight, found in weights.items()}
+                    for term, weights in collected.items()}
+        # A prefix matches the documents of every longer term that starts with it
+        prefixes = {}
+        for term, weights in postings.items():
+            for end in range(1, len(term)):
+                masks = prefixes.setdefault(term[:end], {})
+                for weight, mask in weights.items():
+                    masks[weight] = masks.get(weight, 0) | mask
+        return {"ordinals": ordinals, "docs": docs, "doc_terms": doc_terms,
+                "postings": postings, "prefixes": prefixes, "next_ordinal": len(weighed)}
+
+    def _install(self, built):
+        self._ordinals, self._docs, self._doc_terms = built["ordinals"], built["docs"], built["doc_terms"]
+        self._postings, self._prefixes = built["postings"], built["prefixes"]
+        self._next_ordinal = built["next_ordinal"]
+        self._unordered = 0
+        self._unordered_count = 0
+        self._clear_caches()
+
+    def _index(self, ordinal, terms):
+        bit = 1 << ordinal
+        self._doc_terms[ordinal] = terms
+        for term, weight in terms.items():
+            for postings in self._posting_lists(term):
+                postings[weight] = postings.get(weight, 0) | bit
+
+    def _unindex(self, ordinal) -> dict:
+        keep = ~(1 << ordinal)
+        terms = self._doc_terms.pop(ordinal, {})
+        for term, weight in terms.items():
+            for postings in self._posting_lists(term):
+                mask = postings.get(weight, 0) & keep
+                if mask:
+                    postings[weight] = mask
+                else:
+                    postings.pop(weight, None)
+        for term in terms:
+            if not self._postings.get(term, True):
+                del self._postings[term]
+            for end in range(1, len(term)):
+                if not self._prefixes.get(term[:end], True):
+                    del self._prefixes[term[:end]]
+        return terms
+
+    def _posting_lists(self, term):
+        yield self._postings.setdefault(term, {})
+        for end in range(1, len(term)):
+            yield self._prefixes.setdefault(term[:end], {})
+
+    def _remove_locked(self, item_id) -> dict:
+        ordinal = self._ordinals.pop(item_id, None)
+        if ordinal is None:
+            return {}
+        del self._docs[ordinal]
+        if self._unordered >> ordinal & 1:
+            self._unordered &= ~(1 << ordinal)
+        return self._unindex(ordinal)
+
+    @staticmethod
+    def _sort_key(item) -> int:
+        # Shorter names first (the closest match to the query), then lower ids
+        return (min(len(item.get("name") or ""), 0xFFFF) << _ID_BITS) | item["id"]
+
+    @staticmethod
+    def _weigh(item) -> dict:
+        terms = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(item.get(field)):
+                terms[term] = max(terms.get(term, 0), weight)
+        return terms
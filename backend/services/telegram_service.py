@@ -3,8 +3,21 @@
 TelegramService - Sends notifications to a Telegram bot
 """
 
+import atexit
+import threading
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+
+from config import (
+    TELEGRAM_MAX_RETRIES,
+    TELEGRAM_MIN_INTERVAL,
+    TELEGRAM_OVERFLOW_POLICY,
+    TELEGRAM_QUEUE_SIZE,
+    TELEGRAM_SPILL_PATH,
+    TELEGRAM_TIMEOUT,
+)
+from services.notification_dispatcher import NotificationDispatcher, TransportError
 
 logger = logging.getLogger(__name__)
 
@@ -12,26 +25,99 @@ TELEGRAM_BOT_TOKEN = "7806541153:AAEQ3Yl9IH3kn2elnW7wqLodPZaJ3iQelm0"
 TELEGRAM_CHAT_ID = "6777655739"
 TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
 
+
+class TelegramTransport:
+    """
+    Sends messages to the Telegram Bot API over a pooled HTTP session.
+
+    api_url can point at a local stub server to exercise the dispatcher
+    without talking to Telegram.
+    """
+
+    def __init__(self, api_url=TELEGRAM_API_URL, chat_id=TELEGRAM_CHAT_ID, timeout=TELEGRAM_TIMEOUT):
+        self.api_url = api_url
+        self.chat_id = chat_id
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+    def send(self, text: str) -> None:
+        try:
+            response = self.session.post(
+                self.api_url,
+                json={
+                    "chat_id": self.chat_id,
+                    "text": text,
+                    "parse_mode": "HTML",
+                },
+                timeout=self.timeout,
+            )
+        except requests.RequestException as error:
+            raise TransportError(f"Telegram request failed: {error}")
+
+        if response.ok:
+            return
+
+        try:
+            error_data = response.json()
+        except ValueError:
+            error_data = {"description": response.text}
+
+        retry_after = (error_data.get("parameters") or {}).get("retry_after")
+        # 4xx responses other than rate limiting will not succeed on retry
+        retryable = response.status_code == 429 or response.status_code >= 500
+        raise TransportError(f"Telegram API error {response.status_code}: {error_data}",
+                             retry_after=retry_after, retryable=retryable)
+
+
+_transport = TelegramTransport()
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
 """
-Send a message to Telegram
+Get the process-wide background dispatcher, creating it on first use
+"""
+def get_notification_dispatcher() -> NotificationDispatcher:
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(
+                _transport,
+                max_queue_size=TELEGRAM_QUEUE_SIZE,
+                overflow_policy=TELEGRAM_OVERFLOW_POLICY,
+                min_interval=TELEGRAM_MIN_INTERVAL,
+                max_retries=TELEGRAM_MAX_RETRIES,
+                spill_path=TELEGRAM_SPILL_PATH,
+            )
+            atexit.register(_dispatcher.stop)
+        return _dispatcher
+
+"""
+Queue a message for delivery to Telegram without waiting for the API
+@param message The message to send
+@returns False if the message was dropped because the queue is full
+"""
+def queue_telegram_message(message: str) -> bool:
+    return get_notification_dispatcher().submit(message)
+
+"""
+Delivery counters and queue depth of the dispatcher, without starting it
+@returns An empty dict if nothing was queued in this process yet
+"""
+def notification_stats() -> dict:
+    dispatcher = _dispatcher
+    if dispatcher is None:
+        return {}
+    return dict(dispatcher.stats, pending=dispatcher.pending())
+
+"""
+Send a message to Telegram and wait for the result
 @param message The message to send
 """
 def send_telegram_message(message: str) -> None:
     try:
-        response = requests.post(
-            TELEGRAM_API_URL,
-            json={
-                "chat_id": TELEGRAM_CHAT_ID,
-                "text": message,
-                "parse_mode": "HTML",
-            },
-        )
-
-        if not response.ok:
-            error_data = response.json()
-            logger.error(f"Error sending Telegram notification: {error_data}")
-            return
-
+        _transport.send(message)
         logger.info("Telegram notification sent successfully")
     except Exception as error:
         logger.error(f"Failed to send Telegram notification: {error}")
@@ -0,0 +1,46 @@
+"""
+Test fixtures - the app runs against a throwaway SQLite database created by the migrations
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# config.py reads the environment at import, so point it at a scratch directory first
+_scratch = tempfile.mkdtemp(prefix="store-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'store.db')}"
+os.environ["DATABASE_READ_URLS"] = ""
+os.environ["IMAGE_STORAGE_DIR"] = os.path.join(_scratch, "images")
+os.environ["ORDER_EXPIRY_SCHEDULER"] = "off"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app():
+    # As run.py does before serving; importing the app leaves the schema alone
+    from migrations import prepare_schema
+    prepare_schema("upgrade")
+    import app as app_module
+    return app_module.app
+
+
+@pytest.fixture
+def db(app):
+    import app as app_module
+    database = app_module.db
+    with app.app_context():
+        with database.engine.begin() as connection:
+            for table in reversed(database.metadata.sorted_tables):
+                connection.execute(table.delete())
+    app_module.catalog_cache.invalidate_all()
+    app_module.product_details.invalidate_all()
+    app_module.stock_search.invalidate()
+    return database
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
@@ -0,0 +1,74 @@
+"""
+Catalog cache entries expire after their TTL, the least recently used go first, and a fill that read
+data before an invalidation is not stored
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from services.catalog_cache import CatalogCache, facets_key, item_key, listing_key
+
+
+@pytest.fixture
+def clock():
+    return SimpleNamespace(now=0.0)
+
+
+def _cache(clock, **options):
+    return CatalogCache(clock=lambda: clock.now, **options)
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = _cache(clock, ttl=30)
+    cache.put("list:", b"[]")
+    clock.now = 29.9
+    assert cache.get("list:").body == b"[]"
+    clock.now = 30
+    assert cache.get("list:") is None
+    assert cache.snapshot()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = _cache(clock, max_entries=2)
+    cache.put("a", b"a")
+    cache.put("b", b"b")
+    assert cache.get("a") is not None
+    cache.put("c", b"c")
+    assert cache.get("b") is None
+    assert (cache.get("a").body, cache.get("c").body) == (b"a", b"c")
+    assert cache.stats["evictions"] == 1
+
+
+def test_fill_started_before_an_invalidation_is_not_stored(clock):
+    cache = _cache(clock)
+    generation = cache.generation
+    # A write commits and invalidates while the reader is still building its response
+    cache.invalidate_items([1])
+    entry = cache.put("list:", b"stale", generation=generation)
+    assert entry.body == b"stale"
+    assert cache.get("list:") is None
+
+    cache.put("list:", b"fresh", generation=cache.generation)
+    assert cache.get("list:").body == b"fresh"
+
+
+def test_item_write_drops_the_item_and_every_aggregate(clock):
+    cache = _cache(clock)
+    args = SimpleNamespace(items=lambda multi: [("grade", "A")])
+    for key in (item_key(1), item_key(2), listing_key(args), facets_key(args)):
+        cache.put(key, b"{}")
+    cache.invalidate_items([1])
+    assert [key for key in (item_key(1), item_key(2), listing_key(args), facets_key(args))
+            if cache.get(key) is not None] == [item_key(2)]
+
+
+def test_listing_is_served_from_cache_until_a_write(client, db):
+    import app as app_module
+    client.post("/api/stock", json={"name": "Phone", "price": 100, "quantity": 5, "grade": "A", "location": "US"})
+    assert len(client.get("/api/stock").json) == 1
+    hits = app_module.catalog_cache.stats["hits"]
+    assert len(client.get("/api/stock").json) == 1
+    assert app_module.catalog_cache.stats["hits"] == hits + 1
+
+    client.post("/api/stock", json={"name": "Tablet", "price": 100, "quantity": 5, "grade": "A", "location": "US"})
+    assert len(client.get("/api/stock").json) == 2
@@ -0,0 +1,94 @@
+"""
+Long-polls and streams see messages written by other worker processes, which never reach this process's hub
+"""
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def app_module(monkeypatch, client):
+    import app as app_module
+    monkeypatch.setattr(app_module, "CHAT_CATCH_UP_INTERVAL", 0.05)
+    monkeypatch.setattr(app_module, "CHAT_STREAM_HEARTBEAT", 0.5)
+    return app_module
+
+
+def _write(app_module, text, conversation_id="conv_1", publish=False):
+    # publish=False is a message another worker wrote: it is only in the database
+    with app_module.app.app_context():
+        message = app_module.ChatMessage(user_id="u", username="Guest User", message=text,
+                                         conversation_id=conversation_id)
+        app_module.db.session.add(message)
+        app_module.db.session.commit()
+        if publish:
+            app_module.chat_events.publish_message(message.to_dict())
+        return message.id
+
+
+def _later(action, delay=0.2):
+    timer = threading.Timer(delay, action)
+    timer.start()
+    return timer
+
+
+def test_poll_catches_up_with_other_workers(client, app_module):
+    timer = _later(lambda: _write(app_module, "from another worker"))
+    started = time.monotonic()
+    messages = client.get("/api/chat/poll/conv_1?timeout=5").json
+    timer.join()
+    assert [m["message"] for m in messages] == ["from another worker"]
+    assert time.monotonic() - started < 2
+
+
+def test_publish_wakes_the_poll(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "CHAT_CATCH_UP_INTERVAL", 30)
+    timer = _later(lambda: _write(app_module, "same worker", publish=True))
+    started = time.monotonic()
+    messages = client.get("/api/chat/poll/conv_1?timeout=5").json
+    timer.join()
+    assert [m["message"] for m in messages] == ["same worker"]
+    assert time.monotonic() - started < 2
+
+
+def test_poll_times_out_empty(client, app_module):
+    _write(app_module, "old")
+    since_id = _write(app_module, "other conversation", conversation_id="conv_2")
+    assert client.get(f"/api/chat/poll/conv_1?since_id={since_id}&timeout=0.2").json == []
+
+
+def _events(response):
+    for chunk in response.response:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith("id: "):
+            yield int(chunk.split("\n", 1)[0][4:])
+        elif chunk.startswith(": keep-alive"):
+            yield None
+
+
+def test_stream_delivers_in_order_across_workers(client, app_module):
+    backlog = _write(app_module, "before")
+    response = client.get("/api/chat/stream/conv_1", buffered=False)
+    try:
+        events = _events(response)
+        assert next(events) == backlog
+        # The published message must not let the stream skip the one only in the database
+        other = _write(app_module, "from another worker")
+        local = _write(app_module, "same worker", publish=True)
+        assert [next(events), next(events)] == [other, local]
+        assert next(events) is None
+    finally:
+        response.close()
+    assert app_module.chat_events.subscriber_count() == 0
+
+
+def test_admin_stream_starts_after_the_newest_message(client, app_module):
+    _write(app_module, "old", conversation_id="conv_2")
+    response = client.get("/api/chat/admin/stream", buffered=False)
+    try:
+        events = _events(response)
+        new = _write(app_module, "new")
+        assert next(events) == new
+    finally:
+        response.close()
@@ -0,0 +1,150 @@
+"""
+Read-after-write routing for clients that echo the read-primary header instead of sending cookies,
+and statement routing between two real SQLite files, the replica lagging behind the primary
+"""
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask, g, jsonify, request
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import insert, select
+from sqlalchemy.orm import DeclarativeBase
+
+from services.db_router import READ_PRIMARY_COOKIE, READ_PRIMARY_HEADER, DbRouter, RoutingSession, replica_reads
+
+
+@pytest.fixture
+def router_client():
+    app = Flask(__name__)
+    db = SimpleNamespace(engines={None: "primary", "replica_0": "replica"})
+    clock = SimpleNamespace(now=0.0)
+    router = DbRouter(db, read_after_write=5.0, clock=lambda: clock.now)
+    router.install(app)
+
+    @app.route("/orders", methods=["GET"])
+    @replica_reads
+    def read():
+        return jsonify(replica=g.get("db_replica"))
+
+    @app.route("/orders", methods=["POST"])
+    def write():
+        return jsonify(ok=True), 201
+
+    # Like the storefront, which fetches with credentials: 'omit'
+    return app.test_client(use_cookies=False), clock
+
+
+def test_write_response_tells_the_client_how_long_to_read_the_primary(router_client):
+    client, _ = router_client
+    assert client.post("/orders").headers[READ_PRIMARY_HEADER] == "5"
+    assert READ_PRIMARY_HEADER not in client.get("/orders").headers
+
+
+def test_echoed_header_routes_reads_to_the_primary(router_client):
+    client, clock = router_client
+    client.post("/orders")
+    # Past this worker's own window, as if another worker served the read
+    clock.now = 10.0
+    assert client.get("/orders").json["replica"] == "replica"
+    assert client.get("/orders", headers={READ_PRIMARY_HEADER: "1"}).json["replica"] is None
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    class Base(DeclarativeBase):
+        pass
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'primary.db'}"
+    app.config["SQLALCHEMY_BINDS"] = {"replica_0": f"sqlite:///{tmp_path / 'replica.db'}"}
+    db = SQLAlchemy(app, model_class=Base, session_options={"class_": RoutingSession})
+
+    class Note(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        text = db.Column(db.String(50))
+
+    clock = SimpleNamespace(now=0.0)
+    router = DbRouter(db, read_after_write=5.0, clock=lambda: clock.now)
+    router.install(app)
+
+    def texts(statement=None):
+        return [note.text for note in db.session.scalars(statement if statement is not None else select(Note))]
+
+    @app.route("/notes", methods=["GET"])
+    @replica_reads
+    def list_notes():
+        return jsonify(texts())
+
+    @app.route("/notes", methods=["POST"])
+    def add_note():
+        db.session.add(Note(text=request.json["text"]))
+        db.session.flush()
+        # After the flush, reads in the same request see the primary
+        listed = texts()
+        db.session.commit()
+        return jsonify(listed), 201
+
+    @app.route("/notes/locked", methods=["GET"])
+    @replica_reads
+    def locked_notes():
+        return jsonify(texts(select(Note).with_for_update()))
+
+    @app.route("/notes/draft", methods=["GET"])
+    @replica_reads
+    def draft_note():
+        # A replica-enabled view that writes: the flush and everything after it use the primary
+        db.session.add(Note(text="draft"))
+        db.session.flush()
+        listed = texts()
+        db.session.rollback()
+        return jsonify(listed)
+
+    with app.app_context():
+        engines = {"primary": db.engines[None], "replica": db.engines["replica_0"]}
+        for name, engine in engines.items():
+            Base.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(insert(Note.__table__).values(text=f"{name} row"))
+
+    def stored(name):
+        with engines[name].connect() as connection:
+            return connection.execute(select(Note.__table__.c.text)).scalars().all()
+
+    return app, clock, stored
+
+
+def test_reads_use_the_replica_and_writes_the_primary(replicated):
+    app, _, stored = replicated
+    client = app.test_client(use_cookies=False)
+    assert client.get("/notes").json == ["replica row"]
+
+    response = client.post("/notes", json={"text": "new"})
+    assert response.json == ["primary row", "new"]
+    assert stored("primary") == ["primary row", "new"]
+    # Replication has not caught up
+    assert stored("replica") == ["replica row"]
+
+    assert client.get("/notes/locked").json == ["primary row", "new"]
+    assert client.get("/notes/draft").json == ["primary row", "new", "draft"]
+    assert stored("primary") == ["primary row", "new"]
+
+
+def test_writes_pin_reads_to_the_primary(replicated):
+    app, clock, _ = replicated
+    client = app.test_client(use_cookies=False)
+    response = client.post("/notes", json={"text": "new"})
+    seconds = response.headers[READ_PRIMARY_HEADER]
+    assert READ_PRIMARY_COOKIE in response.headers["Set-Cookie"]
+
+    # This worker reads the primary for a while after any write
+    assert client.get("/notes").json == ["primary row", "new"]
+    clock.now = 10.0
+    assert client.get("/notes").json == ["replica row"]
+
+    # Other workers rely on the client: the echoed header or the cookie
+    assert client.get("/notes", headers={READ_PRIMARY_HEADER: seconds}).json == ["primary row", "new"]
+    with_cookies = app.test_client()
+    with_cookies.post("/notes", json={"text": "newer"})
+    clock.now = 20.0
+    assert with_cookies.get("/notes").json == ["primary row", "new", "newer"]
+    assert app.test_client().get("/notes").json == ["replica row"]
@@ -0,0 +1,27 @@
+"""
+Variants that are not rendered redirect to the original's immutable URL
+"""
+import hashlib
+import os
+
+
+def test_missing_variant_redirects_to_original(client):
+    png = b"\x89PNG\r\n\x1a\n" + os.urandom(2000)
+    digest = client.post("/api/upload/image", data=png, content_type="image/png").json["hash"]
+    assert digest == hashlib.sha256(png).hexdigest()
+
+    response = client.get(f"/api/images/{digest}/thumb.webp")
+    assert response.status_code == 307
+    assert response.headers["Location"].endswith(f"/api/images/{digest}")
+    assert "no-cache" in response.headers["Cache-Control"]
+
+    original = client.get(response.headers["Location"])
+    assert original.data == png
+    assert "immutable" in original.headers["Cache-Control"]
+    original.close()
+
+
+def test_unknown_variant_is_not_found(client):
+    digest = "0" * 64
+    assert client.get(f"/api/images/{digest}/thumb.webp").status_code == 404
+    assert client.get(f"/api/images/{digest}/huge.webp").status_code == 404
@@ -0,0 +1,25 @@
+"""
+The orjson and stdlib providers produce the same documents
+"""
+import json
+import uuid
+from datetime import date, datetime
+
+import pytest
+from flask import Flask
+
+from json_provider import install_json_provider, orjson
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+def test_providers_agree():
+    payload = {"b": [1, 2.5, None, True], "a": "Ünïcode", "when": datetime(2024, 1, 2, 3, 4, 5),
+               "day": date(2024, 1, 2), "id": uuid.UUID(int=7)}
+    bodies = {}
+    for name in ("stdlib", "orjson"):
+        app = Flask(name)
+        assert install_json_provider(app, name) == name
+        with app.app_context():
+            bodies[name] = app.json.response(payload).get_data()
+    assert json.loads(bodies["orjson"]) == json.loads(bodies["stdlib"])
+    assert list(json.loads(bodies["orjson"])) == list(json.loads(bodies["stdlib"]))
@@ -0,0 +1,191 @@
+"""
+Delivery through stub transports: retries and backoff, digests, overflow policies and per-process
+spill files; long messages are cut without breaking their HTML
+"""
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import services.notification_dispatcher as notification_dispatcher
+from services.notification_dispatcher import NotificationDispatcher, TransportError, truncate_html
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, text):
+        self.sent.append(text)
+
+
+class FailingTransport(RecordingTransport):
+    """Raises the given errors in turn, then delivers"""
+
+    def __init__(self, *errors):
+        super().__init__()
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def send(self, text):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        super().send(text)
+
+
+class BlockingTransport(RecordingTransport):
+    """Holds the first send until released, so messages pile up behind it"""
+
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def send(self, text):
+        self.entered.set()
+        self.release.wait(5)
+        super().send(text)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def retrying(monkeypatch):
+    # Jitter at its upper bound, and the backoff waits recorded instead of slept
+    monkeypatch.setattr(notification_dispatcher.random, "uniform", lambda low, high: high)
+
+    def make(transport, **options):
+        dispatcher = NotificationDispatcher(transport, **options)
+        delays = []
+        monkeypatch.setattr(dispatcher._stop, "wait", delays.append)
+        return dispatcher, delays
+
+    return make
+
+
+def test_retries_with_exponential_backoff(retrying):
+    transport = FailingTransport(OSError("reset"), TransportError("502"), TransportError("502"))
+    dispatcher, delays = retrying(transport, backoff_base=0.5, backoff_max=30.0)
+    dispatcher._deliver("hello")
+    assert transport.sent == ["hello"]
+    assert delays == [0.5, 1.0, 2.0]
+    assert (dispatcher.stats["retries"], dispatcher.stats["sent"], dispatcher.stats["failed"]) == (3, 1, 0)
+
+
+def test_backoff_is_capped_and_gives_up(retrying):
+    transport = FailingTransport(*[TransportError("down")] * 10)
+    dispatcher, delays = retrying(transport, max_retries=4, backoff_base=1.0, backoff_max=3.0)
+    dispatcher._deliver("hello")
+    assert transport.sent == [] and transport.attempts == 5
+    assert delays == [1.0, 2.0, 3.0, 3.0]
+    assert dispatcher.stats["failed"] == 1
+
+
+def test_retry_after_overrides_backoff(retrying):
+    transport = FailingTransport(TransportError("429", retry_after=7))
+    dispatcher, delays = retrying(transport, backoff_base=0.5)
+    dispatcher._deliver("hello")
+    assert delays == [7]
+    assert transport.sent == ["hello"]
+
+
+def test_non_retryable_errors_are_not_retried(retrying):
+    transport = FailingTransport(TransportError("400 bad request", retryable=False))
+    dispatcher, delays = retrying(transport)
+    dispatcher._deliver("hello")
+    assert delays == [] and transport.attempts == 1
+    assert dispatcher.stats["failed"] == 1
+
+
+def test_messages_queued_during_a_send_are_coalesced():
+    transport = BlockingTransport()
+    dispatcher = NotificationDispatcher(transport, min_interval=0)
+    try:
+        dispatcher.submit("first")
+        assert transport.entered.wait(5)
+        for text in ("second", "third", "fourth"):
+            dispatcher.submit(text)
+        transport.release.set()
+        _wait_for(lambda: len(transport.sent) == 2)
+    finally:
+        dispatcher.stop()
+    assert transport.sent[0] == "first"
+    header, body = transport.sent[1].split("\n", 1)
+    assert header == "<b>3 notifications</b>"
+    assert body.split(notification_dispatcher.DIGEST_SEPARATOR) == ["second", "third", "fourth"]
+    assert dispatcher.stats["batches"] == 1
+
+
+def test_digest_is_split_at_the_message_length():
+    dispatcher = NotificationDispatcher(RecordingTransport(), max_message_length=100)
+    digest, remaining = dispatcher._build_digest(["a" * 30, "b" * 30, "c" * 30])
+    assert len(digest) <= 100 and "a" * 30 in digest and "b" * 30 not in digest
+    assert remaining == ["b" * 30, "c" * 30]
+
+
+@pytest.mark.parametrize("policy, accepted, delivered", [
+    ("drop_newest", False, ["first", "second"]),
+    ("drop_oldest", True, ["first", "third"]),
+    ("spill", True, ["first", "second", "third"]),
+])
+def test_overflow_policies(tmp_path, policy, accepted, delivered):
+    transport = BlockingTransport()
+    dispatcher = NotificationDispatcher(transport, max_queue_size=1, overflow_policy=policy, min_interval=0,
+                                        spill_path=str(tmp_path / "spill.jsonl"))
+    try:
+        dispatcher.submit("first")
+        assert transport.entered.wait(5)
+        assert dispatcher.submit("second")
+        assert dispatcher.submit("third") is accepted
+        transport.release.set()
+        _wait_for(lambda: all(text in "".join(transport.sent) for text in delivered))
+    finally:
+        dispatcher.stop()
+    assert dispatcher.stats["dropped"] == (0 if policy == "spill" else 1)
+    assert dispatcher.stats["spilled"] == (1 if policy == "spill" else 0)
+    assert not [text for text in ("first", "second", "third")
+                if text not in delivered and text in "".join(transport.sent)]
+    assert os.listdir(tmp_path) == []
+
+
+def test_truncate_html_closes_open_tags_and_keeps_entities_whole():
+    message = "<b>Order &amp; payment</b>\n<i>Items: <a href=\"https://example.com\">iPhone 13</a></i> and more"
+    for limit in range(12, len(message)):
+        result = truncate_html(message, limit)
+        assert len(result) <= limit
+        assert result.count("<b>") == result.count("</b>")
+        assert result.count("<i>") == result.count("</i>")
+        assert result.count("<a ") == result.count("</a>")
+        assert "&" not in result or "&amp;" in result
+    assert truncate_html(message, len(message)) == message
+
+
+def test_spill_files_are_per_process(tmp_path):
+    base = tmp_path / "spill.jsonl"
+    dispatcher = NotificationDispatcher(RecordingTransport(), max_queue_size=1, overflow_policy="spill",
+                                        spill_path=str(base))
+    dispatcher._spill("overflow")
+    assert os.listdir(tmp_path) == [f"spill.{os.getpid()}.jsonl"]
+    assert dispatcher._drain_spill() == ["overflow"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_spill_files_of_exited_processes_are_adopted(tmp_path):
+    base = tmp_path / "spill.jsonl"
+    dead_pid = 2 ** 22 + 1  # above the kernel's pid_max
+    (tmp_path / f"spill.{dead_pid}.jsonl").write_text(json.dumps("from a dead worker") + "\n")
+    base.write_text(json.dumps("from the shared file") + "\n")
+    live = tmp_path / f"spill.{os.getppid()}.jsonl"
+    live.write_text(json.dumps("still owned") + "\n")
+
+    dispatcher = NotificationDispatcher(RecordingTransport(), overflow_policy="spill", spill_path=str(base))
+    assert sorted(dispatcher._drain_spill(adopt=True)) == ["from a dead worker", "from the shared file"]
+    assert os.listdir(tmp_path) == [live.name]
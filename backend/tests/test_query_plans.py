@@ -0,0 +1,65 @@
+"""
+The hot queries use the indexes the migrations create, checked with SQLite's EXPLAIN QUERY PLAN
+"""
+import pytest
+from sqlalchemy import text
+from werkzeug.datastructures import MultiDict
+
+from services.stock_query_service import apply_stock_filters, apply_stock_ordering, parse_stock_query
+
+
+def _plan(db, query) -> str:
+    statement = getattr(query, "statement", query)
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}))
+    with db.engine.connect() as connection:
+        return "\n".join(row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+def _stock_query(app_module, **args):
+    params = parse_stock_query(MultiDict(args))
+    StockItem = app_module.StockItem
+    query = apply_stock_filters(app_module.active_stock_query(), StockItem, params)
+    return apply_stock_ordering(query, StockItem, params).limit(params["limit"] + 1)
+
+
+@pytest.mark.parametrize("args, index", [
+    ({"grade": "A", "sort": "price"}, "ix_stock_item_grade_price"),
+    ({"location": "US", "sort": "price"}, "ix_stock_item_location_price"),
+    ({"sort": "-price"}, "ix_stock_item_price_id"),
+    ({"sort": "-created_at"}, "ix_stock_item_created_at_id"),
+    ({"sort": "name"}, "ix_stock_item_name_id"),
+])
+def test_stock_listing_uses_index(app, db, args, index):
+    import app as app_module
+    with app.app_context():
+        plan = _plan(db, _stock_query(app_module, **args))
+    assert index in plan, plan
+    assert "USE TEMP B-TREE FOR ORDER BY" not in plan, plan
+
+
+def test_order_lookups_use_indexes(app, db):
+    import app as app_module
+    Order, OrderItem, Payment = app_module.Order, app_module.OrderItem, app_module.Payment
+    with app.app_context():
+        plans = {
+            "ix_order_user_id": _plan(db, Order.query.filter(Order.user_id == "u")),
+            "ix_order_tracking_number": _plan(db, Order.query.filter(Order.tracking_number == "T")),
+            "ix_order_item_order_id": _plan(db, OrderItem.query.filter(OrderItem.order_id.in_([1, 2]))),
+            "ix_order_item_stock_item_id": _plan(db, OrderItem.query.filter(OrderItem.stock_item_id == 1)),
+            "ix_payment_order_id": _plan(db, Payment.query.filter(Payment.order_id.in_([1, 2]))),
+            "ix_order_status_expires_at": _plan(db, Order.query.filter(
+                Order.status == "pending", Order.expires_at <= app_module.datetime(2024, 1, 1))),
+        }
+    for index, plan in plans.items():
+        assert index in plan, plan
+
+
+def test_chat_messages_use_conversation_indexes(app, db):
+    import app as app_module
+    ChatMessage = app_module.ChatMessage
+    with app.app_context():
+        messages = _plan(db, ChatMessage.query.filter_by(conversation_id="c")
+                         .order_by(ChatMessage.created_at, ChatMessage.id))
+        unread = _plan(db, ChatMessage.query.filter_by(conversation_id="c", is_admin_reply=True, is_read=False))
+    assert "ix_chat_message_conversation_created" in messages, messages
+    assert "ix_chat_message_conversation_unread" in unread, unread
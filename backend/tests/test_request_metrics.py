@@ -0,0 +1,35 @@
+"""
+http_response_bytes_total counts bodies as sent: compressed, and streamed ones included
+"""
+import json
+import re
+
+
+def _bytes_sent(client, endpoint, method):
+    metrics = client.get("/api/metrics").data.decode()
+    pattern = rf'^http_response_bytes_total{{endpoint="{re.escape(endpoint)}",method="{method}"}} (\S+)$'
+    match = re.search(pattern, metrics, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_compressed_bodies_count_compressed(client):
+    rows = [{"id": n, "name": f"Phone {n}", "price": 1, "quantity": 1, "grade": "A", "location": "US"}
+            for n in range(1, 301)]
+    client.post("/api/import-stock", data=json.dumps(rows), content_type="application/json")
+    before = _bytes_sent(client, "/api/stock", "GET")
+    response = client.get("/api/stock", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert _bytes_sent(client, "/api/stock", "GET") - before == len(response.data)
+
+
+def test_streamed_bodies_are_counted(client):
+    rows = "\n".join(json.dumps({"name": f"Phone {n}", "price": 1, "quantity": 1, "grade": "A", "location": "US"})
+                     for n in range(50))
+    before = _bytes_sent(client, "/api/import-stock", "POST")
+    response = client.post("/api/import-stock?progress=1&chunk_size=10", data=rows,
+                           content_type="application/x-ndjson")
+    assert response.is_streamed
+    body = response.get_data()
+    response.close()
+    assert body.count(b"\n") == 6
+    assert _bytes_sent(client, "/api/import-stock", "POST") - before == len(body)
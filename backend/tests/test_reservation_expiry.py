@@ -0,0 +1,134 @@
+"""
+Pending orders release their stock once the reservation deadline passes, in one worker at a time
+"""
+import uuid
+
+import pytest
+
+from services.reservation_expiry import EXPIRED, ManualClock, ReservationExpiry
+
+
+@pytest.fixture
+def app_module(client):
+    import app as app_module
+    return app_module
+
+
+@pytest.fixture
+def clock():
+    return ManualClock()
+
+
+@pytest.fixture
+def make_expiry(app_module, clock):
+    created = []
+
+    def make(**options):
+        # A lease of its own, so other tests' sweeps do not hold it
+        options.setdefault("lease_name", f"test-{uuid.uuid4().hex[:8]}")
+        options.setdefault("on_released", app_module._reservations_released)
+        expiry = ReservationExpiry(app_module.Order.__table__, app_module.OrderItem.__table__,
+                                   app_module.StockItem.__table__, clock=clock, **options)
+        created.append(expiry)
+        return expiry
+
+    yield make
+    with app_module.app.app_context():
+        for expiry in created:
+            expiry.release_lease(app_module.db.engine)
+
+
+def _stock(client, quantity=10):
+    return client.post("/api/stock", json={"name": "Phone", "price": 100, "quantity": quantity,
+                                           "grade": "A", "location": "US"}).json["id"]
+
+
+def _order(client, item_id, quantity=3):
+    response = client.post("/api/orders", json={"user_id": "u", "total_amount": 100 * quantity,
+                                                "items": [{"id": item_id, "quantity": quantity, "price": 100}]})
+    assert response.status_code == 201
+    return response.json["order_id"]
+
+
+def _quantity(client, item_id):
+    return client.get(f"/api/stock/{item_id}").json["quantity"]
+
+
+def _status(client, order_id):
+    return client.get(f"/api/orders/{order_id}").json["order"]["status"]
+
+
+def _sweep(app_module, expiry):
+    with app_module.app.app_context():
+        return expiry.run_once(app_module.db.engine)
+
+
+def test_expires_once_the_deadline_passes(client, app_module, clock, make_expiry):
+    item_id = _stock(client)
+    order_id = _order(client, item_id)
+    expiry = make_expiry()
+
+    # Nothing is released before the deadline
+    assert _sweep(app_module, expiry) == 0
+    clock.advance(minutes=app_module.ORDER_RESERVATION_TTL_MINUTES - 1)
+    assert _sweep(app_module, expiry) == 0
+    assert (_quantity(client, item_id), _status(client, order_id)) == (7, "pending")
+
+    clock.advance(minutes=2)
+    assert _sweep(app_module, expiry) == 1
+    assert (_quantity(client, item_id), _status(client, order_id)) == (10, EXPIRED)
+    assert expiry.stats["released_units"] == 3
+
+    # Released exactly once
+    assert _sweep(app_module, expiry) == 0
+    assert _quantity(client, item_id) == 10
+
+
+def test_payment_confirmed_before_the_sweep_wins(client, app_module, clock, make_expiry):
+    item_id = _stock(client)
+    order_id = _order(client, item_id)
+    payment = client.post("/api/payments", json={"order_id": order_id, "payment_method": "card", "amount": 300}).json
+    assert client.post(f"/api/payments/{payment['id']}/confirm").status_code == 200
+
+    clock.advance(minutes=app_module.ORDER_RESERVATION_TTL_MINUTES + 1)
+    assert _sweep(app_module, make_expiry()) == 0
+    assert (_quantity(client, item_id), _status(client, order_id)) == (7, "paid")
+
+
+def test_confirming_an_expired_order_conflicts(client, app_module, clock, make_expiry):
+    order_id = _order(client, _stock(client))
+    payment = client.post("/api/payments", json={"order_id": order_id, "payment_method": "card", "amount": 300}).json
+    clock.advance(minutes=app_module.ORDER_RESERVATION_TTL_MINUTES + 1)
+    assert _sweep(app_module, make_expiry()) == 1
+    assert client.post(f"/api/payments/{payment['id']}/confirm").status_code == 409
+
+
+def test_lease_is_taken_over_after_its_ttl(client, app_module, clock, make_expiry):
+    lease_name = f"test-{uuid.uuid4().hex[:8]}"
+    first = make_expiry(lease_name=lease_name, lease_ttl=90)
+    second = make_expiry(lease_name=lease_name, lease_ttl=90)
+
+    assert _sweep(app_module, first) == 0
+    assert _sweep(app_module, second) is None
+    clock.advance(seconds=60)
+    # Renewing keeps it
+    assert _sweep(app_module, first) == 0
+    clock.advance(seconds=60)
+    assert _sweep(app_module, second) is None
+
+    # The holder stopped renewing
+    clock.advance(seconds=91)
+    assert _sweep(app_module, second) == 0
+    assert _sweep(app_module, first) is None
+    assert (first.stats["lease_held"], second.stats["lease_held"]) == (0, 1)
+
+
+def test_sweeps_more_orders_than_one_batch(client, app_module, clock, make_expiry):
+    item_id = _stock(client, quantity=20)
+    orders = [_order(client, item_id, quantity=2) for _ in range(5)]
+    assert _quantity(client, item_id) == 10
+
+    clock.advance(minutes=app_module.ORDER_RESERVATION_TTL_MINUTES + 1)
+    assert _sweep(app_module, make_expiry(batch_size=2)) == 5
+    assert _quantity(client, item_id) == 20
+    assert {_status(client, order_id) for order_id in orders} == {EXPIRED}
@@ -0,0 +1,91 @@
+"""
+Bytes saved by compression and 304 responses, and which responses revalidate with a 304
+"""
+import gzip
+import json
+
+import pytest
+
+from services.response_encoding import brotli
+
+
+@pytest.fixture
+def catalog(client):
+    rows = [{"id": n, "name": f"iPhone {n % 15} Pro {n % 4 * 128}GB", "price": n % 900 + 0.5,
+             "quantity": n % 7, "grade": "ABC"[n % 3], "location": ("US", "UK", "HK")[n % 3]}
+            for n in range(1, 501)]
+    assert client.post("/api/import-stock", data=json.dumps(rows), content_type="application/json").status_code == 200
+    return client.get("/api/stock", headers={"Accept-Encoding": "identity"}).data
+
+
+def _saved(app_module):
+    stats = app_module.response_encoding.stats
+    return stats["compressed_bytes_in"] - stats["compressed_bytes_out"], stats["not_modified_bytes_saved"]
+
+
+@pytest.mark.parametrize("encoding", ["gzip", pytest.param("br", marks=pytest.mark.skipif(
+    brotli is None, reason="Brotli is not installed"))])
+def test_compression_saves_most_of_the_catalog(client, catalog, encoding):
+    import app as app_module
+    saved_before, _ = _saved(app_module)
+    response = client.get("/api/stock", headers={"Accept-Encoding": encoding})
+    assert response.headers["Content-Encoding"] == encoding
+    body = gzip.decompress(response.data) if encoding == "gzip" else brotli.decompress(response.data)
+    assert body == catalog
+
+    saved, _ = _saved(app_module)
+    assert saved - saved_before == len(catalog) - len(response.data)
+    # Repetitive JSON: at least 80% smaller
+    assert len(response.data) < len(catalog) * 0.2, (len(response.data), len(catalog))
+
+
+def test_not_modified_saves_the_whole_body(client, catalog):
+    import app as app_module
+    etag = client.get("/api/stock", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    _, saved_before = _saved(app_module)
+    response = client.get("/api/stock", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b""
+    _, saved = _saved(app_module)
+    assert saved - saved_before == len(catalog)
+
+
+def test_small_bodies_are_hashed_but_not_compressed(client):
+    response = client.get("/api/ping", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["ETag"]
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def _revalidates(client, url):
+    first = client.get(url)
+    assert first.status_code == 200
+    again = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+    return first
+
+
+def test_order_revalidates(client, db):
+    item = client.post("/api/stock", json={"name": "Phone", "price": 100, "quantity": 5,
+                                            "grade": "A", "location": "US"}).get_json()
+    order = client.post("/api/orders", json={"user_id": "u", "total_amount": 100,
+                                              "items": [{"id": item["id"], "quantity": 1, "price": 100}]})
+    first = _revalidates(client, f"/api/orders/{order.get_json()['order_id']}")
+    assert first.headers["Last-Modified"]
+
+
+def test_chat_history_revalidates(client, db):
+    import app as app_module
+    with app_module.app.app_context():
+        app_module.db.session.add(app_module.ChatMessage(user_id="u", username="Guest User", message="Hello",
+                                                         conversation_id="conv_1"))
+        app_module.db.session.commit()
+    first = _revalidates(client, "/api/chat/messages/conv_1")
+    assert first.headers["Last-Modified"]
+    # Advisory only: If-Modified-Since alone does not answer 304
+    again = client.get("/api/chat/messages/conv_1", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert again.status_code == 200
+
+
+def test_payment_settings_revalidate(client, db):
+    _revalidates(client, "/api/payment-settings")
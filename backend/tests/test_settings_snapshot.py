@@ -0,0 +1,62 @@
+"""
+The payment settings snapshot is rebuilt only when the stored version moves, and a settings update
+is served at once by its own worker and within the check interval by the others
+"""
+from types import SimpleNamespace
+
+from services.settings_snapshot import SettingsSnapshot
+
+
+def _snapshot(state, clock):
+    def load():
+        state.loads += 1
+        return {"bank": state.bank}
+
+    return SettingsSnapshot(load, lambda: state.version, lambda data: data["bank"].encode(),
+                            check_interval=1.0, clock=lambda: clock.now)
+
+
+def test_rebuilds_only_when_the_version_moves():
+    state = SimpleNamespace(version=1, bank="First", loads=0)
+    clock = SimpleNamespace(now=0.0)
+    snapshot = _snapshot(state, clock)
+    first = snapshot.get()
+    assert (first.data, state.loads) == ({"bank": "First"}, 1)
+
+    # Another worker changed the settings; seen once the check interval has passed
+    state.version, state.bank = 2, "Second"
+    clock.now = 0.5
+    assert snapshot.get() is first
+    clock.now = 1.5
+    second = snapshot.get()
+    assert (second.data, state.loads) == ({"bank": "Second"}, 2)
+    assert second.etag != first.etag
+
+    # Same version: checked again, not rebuilt
+    clock.now = 3.0
+    assert snapshot.get() is second and state.loads == 2
+
+    # This worker's own write is seen at once
+    state.version, state.bank = 3, "Third"
+    snapshot.invalidate()
+    assert snapshot.get().data == {"bank": "Third"}
+
+
+def test_payment_settings_follow_updates(client, db, monkeypatch):
+    import app as app_module
+    first = client.get("/api/payment-settings")
+    assert client.put("/api/settings", json={"bankName": "Own Bank"}).status_code == 200
+    second = client.get("/api/payment-settings")
+    assert second.json["bank_transfer"]["bankName"] == "Own Bank"
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+    assert client.put("/api/payment-settings", json={"crypto": {"wallet": "abc"}}).status_code == 200
+    assert client.get("/api/payment-settings").json["crypto"] == {"wallet": "abc"}
+
+    # Written by another worker: no invalidate() here, only the version bump
+    monkeypatch.setattr(app_module.payment_settings_snapshot, "check_interval", 0)
+    with app_module.app.app_context():
+        app_module.StoreSettings.query.update({"bankName": "Other Bank"})
+        app_module.bump_cache_version(app_module.PAYMENT_SETTINGS_VERSION)
+        app_module.db.session.commit()
+    assert client.get("/api/payment-settings").json["bank_transfer"]["bankName"] == "Other Bank"
@@ -0,0 +1,62 @@
+"""
+Stock batches are all-or-nothing, pair created ids with their request rows, and never push a value below zero
+"""
+import pytest
+
+
+def _item(name="Phone", price=100.0, quantity=5, grade="A", location="US"):
+    return {"name": name, "price": price, "quantity": quantity, "grade": grade, "location": location}
+
+
+def _batch(client, payload):
+    return client.patch("/api/stock/batch", json=payload)
+
+
+@pytest.fixture
+def items(client, db):
+    ids = [client.post("/api/stock", json=_item(name=f"Phone {n}")).json["id"] for n in range(3)]
+    assert client.post("/api/orders", json={"user_id": "u", "total_amount": 100,
+                                            "items": [{"id": ids[2], "quantity": 1, "price": 100}]}).status_code == 201
+    return ids
+
+
+def test_one_bad_operation_rejects_the_whole_batch(client, items):
+    before = client.get("/api/stock").json
+    response = _batch(client, {
+        "create": [_item(name="New")],
+        "update": [{"id": items[0], "price": 1}, {"id": items[0], "price": 2}, {"id": 999, "price": 3}],
+        "adjust": [{"where": {"all": True}, "set": {"quantity": 0}}],
+        "delete": [items[1], items[2]],
+    })
+    assert response.status_code == 400
+    reasons = {(error["op"], error["id"], error["reason"]) for error in response.json["errors"]}
+    assert reasons == {("update", items[0], "duplicate"), ("update", 999, "not_found"),
+                       ("delete", items[2], "referenced")}
+    assert client.get("/api/stock").json == before
+
+
+def test_created_ids_follow_the_request_rows(client, db):
+    rows = [_item(name="Twin"), _item(name="Other", price=5), _item(name="Twin")]
+    created = _batch(client, {"create": rows}).json["created"]
+    assert [entry["index"] for entry in created] == [0, 1, 2]
+    ids = [entry["id"] for entry in created]
+    assert len(set(ids)) == 3
+    for row, item_id in zip(rows, ids):
+        stored = client.get(f"/api/stock/{item_id}").json
+        assert (stored["name"], stored["price"]) == (row["name"], row["price"])
+
+
+@pytest.mark.parametrize("adjustment, expected", [
+    ({"quantity": {"add": -10}}, {"quantity": 0, "price": 100.0}),
+    ({"quantity": {"multiply": -2}}, {"quantity": 0, "price": 100.0}),
+    ({"price": {"add": -150}}, {"quantity": 5, "price": 0}),
+    ({"price": {"multiply": -0.5}}, {"quantity": 5, "price": 0}),
+    ({"price": {"multiply": 0.955}, "quantity": {"add": -2}}, {"quantity": 3, "price": 95.5}),
+])
+def test_adjustments_clamp_at_zero(client, db, adjustment, expected):
+    item_id = client.post("/api/stock", json=_item()).json["id"]
+    response = _batch(client, {"adjust": [{"where": {"ids": [item_id]}, "set": adjustment}]})
+    assert response.status_code == 200
+    assert response.json["adjusted"][0]["ids"] == [item_id]
+    stored = client.get(f"/api/stock/{item_id}").json
+    assert {field: stored[field] for field in expected} == expected
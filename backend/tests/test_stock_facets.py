@@ -0,0 +1,47 @@
+"""
+Each facet applies every filter but its own, and cached facet counts are dropped by a stock write
+"""
+import pytest
+
+ITEMS = [("A", "US", 100, 1), ("A", "UK", 200, 2), ("B", "US", 300, 3), ("B", "UK", 400, 4), ("C", "US", 500, 5)]
+
+
+@pytest.fixture
+def catalog(client, db):
+    return [client.post("/api/stock", json={"name": f"Phone {n}", "price": price, "quantity": quantity,
+                                            "grade": grade, "location": location}).json["id"]
+            for n, (grade, location, price, quantity) in enumerate(ITEMS)]
+
+
+def _counts(facet):
+    return {entry["value"]: entry["count"] for entry in facet}
+
+
+def test_each_facet_ignores_its_own_filter(client, catalog):
+    facets = client.get("/api/stock/facets?grade=A&location=US&min_price=150&buckets=2").json
+    # Every filter: A/US/100 is below the price and A/UK/200 in the wrong location
+    assert facets["total"]["count"] == 0
+    # Grades under location=US and price >= 150: B/300, C/500
+    assert _counts(facets["grades"]) == {"B": 1, "C": 1}
+    # Locations under grade=A and price >= 150: A/UK/200
+    assert _counts(facets["locations"]) == {"UK": 1}
+    # The price range ignores the price filter: grade A in the US is A/US/100
+    assert (facets["price"]["min"], facets["price"]["max"]) == (100, 100)
+
+    facets = client.get("/api/stock/facets?location=US&buckets=2").json
+    assert facets["total"] == {"count": 3, "quantity": 9, "min_price": 100, "max_price": 500}
+    assert _counts(facets["grades"]) == {"A": 1, "B": 1, "C": 1}
+    assert _counts(facets["locations"]) == {"US": 3, "UK": 2}
+    # [100, 300) and [300, 500]
+    assert [bucket["count"] for bucket in facets["price"]["buckets"]] == [1, 2]
+
+
+def test_write_invalidates_cached_facets(client, catalog):
+    url = "/api/stock/facets?grade=B"
+    assert client.get(url).json["total"]["count"] == 2
+    assert client.get(url).json["total"]["count"] == 2
+
+    assert client.put(f"/api/stock/{catalog[0]}", json={"grade": "B"}).status_code == 200
+    assert client.get(url).json["total"]["count"] == 3
+    assert client.delete(f"/api/stock/{catalog[2]}").status_code == 200
+    assert client.get(url).json["total"]["count"] == 2
@@ -0,0 +1,113 @@
+"""
+Replace imports diff the catalog against the feed, sync imports apply a changeset that keeps
+reservations; feed lines end at "\n" only
+"""
+import io
+import json
+from datetime import datetime, timedelta
+
+from services.stock_import_service import _iter_lines, iter_feed_rows
+
+
+class ChunkedStream:
+    def __init__(self, data, size):
+        self.data = io.BytesIO(data)
+        self.size = size
+
+    def read(self, _):
+        return self.data.read(self.size)
+
+
+def _replace(client, rows):
+    return client.post("/api/import-stock", data=json.dumps(rows), content_type="application/json")
+
+
+def _row(item_id, quantity=5, name="Phone"):
+    return {"id": item_id, "name": f"{name} {item_id}", "price": 100, "quantity": quantity, "grade": "A",
+            "location": "US"}
+
+
+def test_replace_keeps_ordered_items_and_removes_dependents(client, db):
+    import app as app_module
+    assert _replace(client, [_row(1), _row(2), _row(3)]).status_code == 200
+    assert client.post("/api/orders", json={"user_id": "u", "total_amount": 100,
+                                            "items": [{"id": 1, "quantity": 1, "price": 100}]}).status_code == 201
+    assert client.put("/api/stock/2/details", json={"warrantyInfo": "1 year"}).status_code == 200
+    with app_module.app.app_context():
+        db.session.add(app_module.StockItemImage(stock_item_id=2, role="main", url="/api/images/x"))
+        db.session.commit()
+
+    report = _replace(client, [_row(3, quantity=9), _row(4)]).json
+    assert (report["inserted"], report["updated"], report["deleted"], report["retired"]) == (1, 1, 1, 1)
+
+    with app_module.app.app_context():
+        items = {item.id: item for item in app_module.StockItem.query.all()}
+        assert set(items) == {1, 3, 4}
+        assert items[1].deleted_at is not None
+        assert items[3].quantity == 9
+        assert app_module.StockItemDetail.query.count() == 0
+        assert app_module.StockItemImage.query.count() == 0
+    assert sorted(item["id"] for item in client.get("/api/stock").json) == [3, 4]
+
+
+def test_replace_leaves_unchanged_rows_alone(client):
+    _replace(client, [_row(1), _row(2)])
+    report = _replace(client, [_row(1), _row(2, name="Tablet")]).json
+    assert (report["updated"], report["unchanged"]) == (1, 1)
+
+
+def test_lines_end_at_newline_only():
+    data = 'a b\x1cc\r\nnext\rsame\n'.encode("utf-8")
+    assert list(_iter_lines(io.BytesIO(data))) == ['a b\x1cc\r\n', 'next\rsame\n']
+
+
+def test_crlf_split_across_chunks():
+    data = b"id,name,price,quantity,grade,location\r\n1,Phone,1,2,A,US\r\n2,Tab,1,2,B,UK"
+    for size in range(1, len(data) + 1):
+        rows = [row for _, row, _ in iter_feed_rows(ChunkedStream(data, size), "csv")]
+        assert [row["name"] for row in rows] == ["Phone", "Tab"], size
+        assert rows[1]["location"] == "UK"
+
+
+def _sync(client, rows):
+    return client.post("/api/import-stock?mode=sync", data=json.dumps(rows), content_type="application/json")
+
+
+def test_sync_inserts_updates_and_soft_deletes(client, db):
+    report = _sync(client, [_row(1), _row(2), _row(3)]).json
+    assert (report["inserted"], report["updated"], report["deleted"], report["unchanged"]) == (3, 0, 0, 0)
+
+    report = _sync(client, [_row(1), _row(2, quantity=8)]).json
+    assert (report["inserted"], report["updated"], report["deleted"], report["unchanged"]) == (0, 1, 1, 1)
+    assert client.get("/api/stock/2").json["quantity"] == 8
+    assert client.get("/api/stock/3").status_code == 404
+
+    # A soft-deleted item back in the feed is revived under its old id, even unchanged
+    report = _sync(client, [_row(1), _row(2, quantity=8), _row(3)]).json
+    assert (report["inserted"], report["updated"], report["deleted"], report["unchanged"]) == (0, 1, 0, 2)
+    assert client.get("/api/stock/3").json["quantity"] == 5
+
+
+def test_sync_keeps_reservations_on_changed_rows(client, db):
+    import app as app_module
+    assert _sync(client, [_row(7, quantity=10)]).status_code == 200
+    order_id = client.post("/api/orders", json={"user_id": "u", "total_amount": 300,
+                                                "items": [{"id": 7, "quantity": 3, "price": 100}]}).json["order_id"]
+
+    # The feed's 12 units include the 3 the pending order holds
+    assert _sync(client, [_row(7, quantity=12, name="Renamed")]).json["updated"] == 1
+    assert client.get("/api/stock/7").json["quantity"] == 9
+    assert client.get("/api/stock/search?q=renamed").json[0]["quantity"] == 9
+
+    # Once the order expires, the item is back at the feed quantity, not above it
+    with app_module.app.app_context():
+        app_module.Order.query.filter_by(id=order_id).update({"expires_at": datetime.utcnow() - timedelta(minutes=1)})
+        db.session.commit()
+        assert app_module.reservation_expiry.expire_due(db.engine) == 1
+    assert client.get("/api/stock/7").json["quantity"] == 12
+
+    # More units held than the feed has leaves none for sale
+    client.post("/api/orders", json={"user_id": "u", "total_amount": 1000,
+                                     "items": [{"id": 7, "quantity": 10, "price": 100}]})
+    _sync(client, [_row(7, quantity=4)])
+    assert client.get("/api/stock/7").json["quantity"] == 0
@@ -0,0 +1,137 @@
+"""
+Concurrent checkouts never oversell, on SQLite and (with TEST_POSTGRES_URL set) PostgreSQL
+"""
+import json
+import os
+import random
+import threading
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from services.stock_reservation_service import StockReservationError, reserve_stock
+
+THREADS = 16
+ATTEMPTS_PER_THREAD = 10
+INITIAL_QUANTITY = 60
+
+
+def _run_threads(target):
+    errors = []
+
+    def guarded(index):
+        try:
+            target(index)
+        except Exception as e:  # surfaced below, a thread cannot fail the test itself
+            errors.append(e)
+
+    threads = [threading.Thread(target=guarded, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+
+
+def test_concurrent_orders_never_oversell(client, db):
+    import app as app_module
+    items = [client.post("/api/stock", json={"name": f"Phone {n}", "price": 100, "quantity": INITIAL_QUANTITY,
+                                             "grade": "A", "location": "US"}).json["id"] for n in range(2)]
+    placed = []
+    statuses = []
+    lock = threading.Lock()
+
+    def checkout(index):
+        rng = random.Random(index)
+        thread_client = app_module.app.test_client()
+        for _ in range(ATTEMPTS_PER_THREAD):
+            lines = [{"id": item_id, "quantity": rng.randint(1, 3), "price": 100} for item_id in items]
+            response = thread_client.post("/api/orders", json={"user_id": f"u{index}", "total_amount": 1,
+                                                                "items": lines})
+            with lock:
+                statuses.append(response.status_code)
+                if response.status_code == 201:
+                    placed.append(lines)
+
+    _run_threads(checkout)
+
+    assert set(statuses) <= {201, 400}, statuses
+    assert 400 in statuses, "the test must exhaust the stock to prove anything"
+    stock = {item["id"]: item["quantity"] for item in client.get("/api/stock").json}
+    for item_id in items:
+        sold = sum(line["quantity"] for lines in placed for line in lines if line["id"] == item_id)
+        assert sold <= INITIAL_QUANTITY
+        assert stock[item_id] == INITIAL_QUANTITY - sold
+    with app_module.app.app_context():
+        order_lines = db.session.query(app_module.OrderItem).count()
+    assert order_lines == len(placed) * len(items)
+
+
+def _engines():
+    yield pytest.param("sqlite", id="sqlite")
+    yield pytest.param("postgresql", id="postgresql", marks=pytest.mark.skipif(
+        not os.environ.get("TEST_POSTGRES_URL"), reason="set TEST_POSTGRES_URL to run against PostgreSQL"))
+
+
+@pytest.fixture(params=list(_engines()))
+def stock_engine(request, app, tmp_path):
+    import app as app_module
+    if request.param == "sqlite":
+        engine = create_engine(f"sqlite:///{tmp_path / 'reserve.db'}", connect_args={"timeout": 30})
+    else:
+        engine = create_engine(os.environ["TEST_POSTGRES_URL"], pool_size=THREADS)
+    table = app_module.StockItem.__table__
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    yield engine, table
+    table.drop(engine)
+    engine.dispose()
+
+
+def test_reserve_stock_under_contention(stock_engine):
+    # The service on its own: the FOR UPDATE path on PostgreSQL, the conditional UPDATE on SQLite
+    engine, table = stock_engine
+    with engine.begin() as connection:
+        connection.execute(insert(table), [{"id": 1, "name": "Phone", "price": 1, "quantity": INITIAL_QUANTITY,
+                                            "grade": "A", "location": "US", "content_hash": "feed"}])
+    reserved = []
+    lock = threading.Lock()
+
+    def reserve(index):
+        rng = random.Random(index)
+        for _ in range(ATTEMPTS_PER_THREAD):
+            quantity = rng.randint(1, 4)
+            with Session(engine) as session:
+                try:
+                    rows = reserve_stock(session, table, {1: quantity})
+                except StockReservationError:
+                    session.rollback()
+                    continue
+                session.commit()
+            with lock:
+                reserved.append((quantity, rows[1].quantity))
+
+    _run_threads(reserve)
+
+    with engine.connect() as connection:
+        quantity, content_hash = connection.execute(select(table.c.quantity, table.c.content_hash)).one()
+    assert sum(amount for amount, _ in reserved) == INITIAL_QUANTITY - quantity
+    assert quantity >= 0
+    # Each reservation reports the quantity its own UPDATE left; no two can see the same one
+    remaining = [left for _, left in reserved]
+    assert len(set(remaining)) == len(remaining)
+    assert min(remaining) == quantity
+    assert content_hash == "feed"
+
+
+def test_sync_import_keeps_reserved_quantity(client):
+    feed = [{"id": 7, "name": "Phone", "price": 100, "quantity": 10, "grade": "A", "location": "US"}]
+    sync = lambda: client.post("/api/import-stock?mode=sync", data=json.dumps(feed), content_type="application/json")
+    assert sync().status_code == 200
+    assert client.post("/api/orders", json={"user_id": "u", "total_amount": 300,
+                                            "items": [{"id": 7, "quantity": 3, "price": 100}]}).status_code == 201
+
+    report = sync().json
+    assert report["unchanged"] == 1
+    assert client.get("/api/stock/7").json["quantity"] == 7
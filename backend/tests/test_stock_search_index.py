@@ -0,0 +1,87 @@
+"""
+Search results against a brute-force ranking, through writes that reorder and renumber the index
+"""
+import random
+
+import pytest
+
+import services.stock_search_index as search_index
+from services.stock_search_index import FIELD_WEIGHTS, PREFIX_MATCH_FACTOR, STOP_WORDS, StockSearchIndex, tokenize
+
+NAMES = ["iPhone 13 Pro 128GB Blue", "iPhone 13 mini 64GB", "iPhone 14 Pro Max 256GB Gold", "Galaxy S23 Ultra",
+         "Galaxy S21 128GB", "Pixel 8 Pro", "iPad Pro 11", "iPad Air 64GB Silver"]
+QUERIES = ["i", "ip", "iphone 13", "pro", "128gb", "galaxy ul", "grade a", "pixel 8 in london", "64", "nothing"]
+
+
+def _item(rng, item_id):
+    return {"id": item_id, "name": rng.choice(NAMES), "price": 100.0, "quantity": rng.randint(0, 5),
+            "grade": rng.choice(("A", "B", "A+")), "location": rng.choice(("London", "New York"))}
+
+
+def _expected(items, query):
+    terms = [term for term in dict.fromkeys(tokenize(query)) if term not in STOP_WORDS]
+    ranked = []
+    for item in items:
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(item[field]):
+                weights[term] = max(weights.get(term, 0), weight)
+        score = 0
+        for index, term in enumerate(terms):
+            best = weights.get(term, 0)
+            if index == len(terms) - 1:
+                best = max([best] + [weight * PREFIX_MATCH_FACTOR for other, weight in weights.items()
+                                     if other != term and other.startswith(term)])
+            if not best:
+                break
+            score += best
+        else:
+            ranked.append((-round(score, 6), len(item["name"]), item["id"]))
+    return len(ranked), [item_id for _, _, item_id in sorted(ranked)]
+
+
+def _check(index, items):
+    for query in QUERIES:
+        total, found = index.search(query, limit=30)
+        expected_total, expected = _expected(items.values(), query)
+        assert (total, [item["id"] for item in found]) == (expected_total, expected[:30]), query
+
+
+def test_results_match_brute_force_through_writes(monkeypatch):
+    monkeypatch.setattr(search_index, "MAX_UNORDERED", 20)
+    rng = random.Random(5)
+    items = {n: _item(rng, n) for n in range(1, 401)}
+    index = StockSearchIndex()
+    index.rebuild(items.values())
+    _check(index, items)
+    for step in range(200):
+        if step % 3 == 0:
+            item_id = rng.choice(list(items))
+            del items[item_id]
+            index.remove(item_id)
+        else:
+            # A new name length moves the item out of tie-break order
+            item = _item(rng, rng.randint(1, 450))
+            items[item["id"]] = item
+            index.upsert(item)
+        if step % 20 == 0:
+            _check(index, items)
+    _check(index, items)
+
+
+def test_write_drops_only_the_results_it_touches():
+    rng = random.Random(1)
+    index = StockSearchIndex()
+    index.rebuild([dict(_item(rng, n), name=NAMES[n % len(NAMES)]) for n in range(1, 101)])
+    for query in ("galaxy", "pixel", "iphone 13"):
+        index.search(query)
+    index.upsert({"id": 500, "name": "Galaxy S24", "price": 1.0, "quantity": 1, "grade": "A", "location": "London"})
+    assert set(index._result_cache) == {("pixel",), ("iphone", "13")}
+    assert index.search("galaxy s24")[0] == 1
+
+
+@pytest.mark.parametrize("query", ["", "grade the"])
+def test_empty_query(query):
+    index = StockSearchIndex()
+    index.rebuild([{"id": 1, "name": "iPhone", "grade": "A", "location": "London"}])
+    assert index.search(query) == (0, [])
@@ -14,6 +14,28 @@ export const getApiUrl = (endpoint: string): string => {
   return `${API_BASE_URL}${endpoint.startsWith('/') ? endpoint : `/${endpoint}`}`;
 };
 
+// After a write the backend sends X-DB-Read-Primary: <seconds>; echoing it on
+// reads for that long makes them read from the primary database instead of a
+// replica that may not have the write yet (cookies are not sent, see below)
+const READ_PRIMARY_HEADER = 'X-DB-Read-Primary';
+const READ_PRIMARY_KEY = 'dbReadPrimaryUntil';
+
+// fetch() for API requests that need to read their own writes (orders, payments, chat)
+export const apiFetch = async (input: string, init: RequestInit = {}): Promise<Response> => {
+  const headers = new Headers(init.headers);
+  const until = Number(sessionStorage.getItem(READ_PRIMARY_KEY) || 0);
+  if (until > Date.now()) {
+    headers.set(READ_PRIMARY_HEADER, '1');
+  }
+
+  const response = await fetch(input, { ...init, headers });
+  const seconds = Number(response.headers.get(READ_PRIMARY_HEADER));
+  if (seconds > 0) {
+    sessionStorage.setItem(READ_PRIMARY_KEY, String(Date.now() + seconds * 1000));
+  }
+  return response;
+};
+
 // Export a debug function to help troubleshoot API issues
 export const debugApiConnection = async (): Promise<boolean> => {
   try {
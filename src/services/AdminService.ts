@@ -82,6 +82,46 @@ export const deleteStockItem = async (itemId: number): Promise<void> => {
   }
 };
 
+export interface StockBatchRequest {
+  create?: Omit<StockItem, 'id'>[];
+  update?: (Partial<StockItem> & { id: number })[];
+  adjust?: {
+    where: { grade?: string | string[]; location?: string | string[]; min_price?: number; max_price?: number; q?: string; ids?: number[]; all?: true };
+    set: Record<string, string | number | { set?: string | number; add?: number; multiply?: number }>;
+  }[];
+  delete?: number[];
+}
+
+export interface StockBatchResult {
+  created: { index: number; id: number; status: string }[];
+  updated: { index: number; id: number; status: string }[];
+  adjusted: { index: number; count: number; ids: number[]; status: string }[];
+  deleted: { index: number; id: number; status: string }[];
+}
+
+// Apply many stock changes in one request and one transaction
+export const batchUpdateStockItems = async (batch: StockBatchRequest): Promise<StockBatchResult> => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/stock/batch`, {
+      method: 'PATCH',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify(batch)
+    });
+    
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({}));
+      throw new Error(error.error || 'Failed to apply stock changes');
+    }
+    
+    return await response.json();
+  } catch (error) {
+    console.error('Error applying stock changes:', error);
+    throw error;
+  }
+};
+
 export interface StoreSettings {
   bankName: string;
   accountNumber: string;
@@ -2,7 +2,7 @@
  * Chat Service for handling communication with the chat API
  */
 import { sendTelegramNotification } from "@/services/TelegramService";
-import { API_BASE_URL } from '@/config/api';
+import { API_BASE_URL, apiFetch } from '@/config/api';
 
 /**
  * Chat message interface
@@ -51,7 +51,7 @@ export const checkUnreadMessages = async (conversationId: string): Promise<boole
 export const sendChatMessage = async (message: Omit<ChatMessage, 'is_admin_reply' | 'is_read' | 'created_at'>): Promise<ChatMessage> => {
   try {
     // Send message to backend API
-    const response = await fetch(`${API_BASE_URL}/chat/messages`, {
+    const response = await apiFetch(`${API_BASE_URL}/chat/messages`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -107,7 +107,7 @@ export const sendChatMessage = async (message: Omit<ChatMessage, 'is_admin_reply
 export const getChatMessages = async (conversationId: string): Promise<ChatMessage[]> => {
   try {
     console.log(`Getting messages for conversation: ${conversationId}`);
-    const response = await fetch(`${API_BASE_URL}/chat/messages/${conversationId}`);
+    const response = await apiFetch(`${API_BASE_URL}/chat/messages/${conversationId}`);
     
     if (!response.ok) {
       const errorData = await response.json();
@@ -130,7 +130,7 @@ export const getChatMessages = async (conversationId: string): Promise<ChatMessa
 export const getAllChatConversations = async (): Promise<ChatConversation[]> => {
   try {
     console.log('Getting all chat conversations');
-    const response = await fetch(`${API_BASE_URL}/chat/admin/messages`);
+    const response = await apiFetch(`${API_BASE_URL}/chat/admin/messages`);
     
     if (!response.ok) {
       const errorData = await response.json();
@@ -162,7 +162,7 @@ export const sendAdminChatReply = async (conversationId: string, message: string
     
     console.log(`Making POST request to ${API_BASE_URL}/chat/admin/reply`);
     
-    const response = await fetch(`${API_BASE_URL}/chat/admin/reply`, {
+    const response = await apiFetch(`${API_BASE_URL}/chat/admin/reply`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -204,7 +204,7 @@ export const sendAdminChatReply = async (conversationId: string, message: string
  */
 export const markMessagesAsRead = async (conversationId: string, isAdmin: boolean = false): Promise<void> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/chat/messages/mark-read`, {
+    const response = await apiFetch(`${API_BASE_URL}/chat/messages/mark-read`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -1,6 +1,6 @@
 import { CartItem } from '@/contexts/CartContext';
 import { sendTelegramMessage, formatCartItems } from '@/services/TelegramService';
-import { API_BASE_URL } from '@/config/api';
+import { API_BASE_URL, apiFetch } from '@/config/api';
 
 export interface CreateOrderRequest {
   user_id: string; // This will now be the user's email
@@ -321,7 +321,7 @@ export const createOrder = async (cartItems: CartItem[], userEmail: string, tota
     
     console.log('Sending order data to server:', JSON.stringify(orderData));
     
-    const response = await fetch(`${API_BASE_URL}/orders`, {
+    const response = await apiFetch(`${API_BASE_URL}/orders`, {
       method: "POST",
       headers: {
         'Content-Type': 'application/json'
@@ -370,7 +370,7 @@ export const createPayment = async (orderId: number, paymentMethod: PaymentMetho
       amount: amount
     };
     
-    const response = await fetch(`${API_BASE_URL}/payments`, {
+    const response = await apiFetch(`${API_BASE_URL}/payments`, {
       method: "POST",
       headers: {
         'Content-Type': 'application/json'
@@ -407,7 +407,7 @@ export const createPayment = async (orderId: number, paymentMethod: PaymentMetho
 // Confirm a payment
 export const confirmPayment = async (paymentId: number) => {
   try {
-    const response = await fetch(`http://localhost:5000/api/payments/${paymentId}/confirm`, {
+    const response = await apiFetch(`http://localhost:5000/api/payments/${paymentId}/confirm`, {
       method: "POST",
       headers: {
         'Content-Type': 'application/json'
@@ -443,7 +443,7 @@ export const confirmPayment = async (paymentId: number) => {
 // Get order details
 export const getOrder = async (orderId: number) => {
   try {
-    const response = await fetch(`/api/orders/${orderId}`);
+    const response = await apiFetch(`/api/orders/${orderId}`);
     
     if (!response.ok) {
       throw new Error('Failed to fetch order');
@@ -459,7 +459,7 @@ export const getOrder = async (orderId: number) => {
 // Get orders by user
 export const getOrdersByUser = async (userEmail: string) => {
   try {
-    const response = await fetch(`/api/orders/by-user/${userEmail}`);
+    const response = await apiFetch(`/api/orders/by-user/${userEmail}`);
     
     if (!response.ok) {
       throw new Error('Failed to fetch orders');
@@ -475,7 +475,7 @@ export const getOrdersByUser = async (userEmail: string) => {
 // Get order by tracking number
 export const getOrderByTracking = async (trackingNumber: string) => {
   try {
-    const response = await fetch(`/api/orders/by-tracking/${trackingNumber}`);
+    const response = await apiFetch(`/api/orders/by-tracking/${trackingNumber}`);
     
     if (!response.ok) {
       throw new Error('Failed to fetch order');